@@ -74,6 +74,10 @@ setup(name='tngcli',
       packages=find_packages('src'),  # dependency resolution
       include_package_data=True,       # package data specified in MANIFEST.in
       install_requires=pkgs,
+      extras_require={
+          'export': ['pyarrow'],
+          'zstd': ['zstandard'],
+      },
       dependency_links=new_links,
       zip_safe=False,
       entry_points={
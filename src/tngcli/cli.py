@@ -31,8 +31,12 @@
 # partner consortium (www.5gtango.eu).
 
 import sys
+import io
+import contextlib
 import argparse
+import functools
 import tnglib
+from tngcli import output
 import yaml
 import os
 import json
@@ -53,7 +57,21 @@ def run(args=None):
     if args is None:
         args = sys.argv[1:]
     parsed_args = parse_args(args)
-    return dispatch(parsed_args)
+
+    with contextlib.ExitStack() as stack:
+        if parsed_args.record:
+            stack.enter_context(tnglib.record_traffic(parsed_args.record))
+        if parsed_args.replay:
+            try:
+                stack.enter_context(tnglib.TrafficReplay(
+                    parsed_args.replay, parsed_args.replay_latency_factor))
+            except IOError as e:
+                print(e)
+                exit(1)
+        if parsed_args.timings:
+            stack.callback(print_timings, parsed_args.timings_format)
+
+        return dispatch(parsed_args)
 
 
 def dispatch(args):
@@ -64,18 +82,36 @@ def dispatch(args):
     # Handle the verbose argument
     init_logger(args.verbose)
 
+    # Handle the output format
+    output.set_output_format(getattr(args, 'output_format', 'table'))
+    output.set_paging(getattr(args, 'limit', None),
+                      getattr(args, 'offset', 0))
+    output.set_table_sample(getattr(args, 'width_sample',
+                                    output.TABLE_SAMPLE))
+
     # abort if no subcommand is provided
     if args.subparser_name is None:
         print("Missing subcommand. Type tng-cli -h")
         exit(1)
 
+    if args.offline and not is_mirrored_listing(args):
+        print("--offline only applies to listings of requests, service, " +
+              "function and slice instances and test results")
+        exit(1)
+
+    # Actions on local data don't need an SP
+    offline = is_offline(args)
+
     # Handle --url argument and set environment
-    if args.sp_url:
+    if args.replay:
+        # env already points to the replaying stubs
+        pass
+    elif args.sp_url:
         tnglib.set_sp_path(args.sp_url)
     else:
         if 'SP_PATH' in os.environ:
             tnglib.set_sp_path(os.environ["SP_PATH"])
-        else:
+        elif not offline:
             print("Missing path to SP. Use env SP_PATH or tng-cli -u")
             exit(1)
 
@@ -83,8 +119,12 @@ def dispatch(args):
     if 'TIMEOUT' in os.environ:
         tnglib.set_timeout(os.environ["TIMEOUT"])
 
+    # Set parallelism of bulk actions
+    if args.workers:
+        tnglib.set_max_workers(args.workers)
+
     # Check if the SP is reachable
-    if not tnglib.sp_health_check():
+    if not offline and not tnglib.sp_health_check():
         print("Couldn't reach SP at \"" + tnglib.get_sp_path() + "\"")
         exit(1)
 
@@ -184,13 +224,13 @@ def dispatch(args):
             exit(not res)
 
         else:
-            res, mes = tnglib.get_requests()
             order = ['request_uuid',
                      'request_type',
                      'status',
                      'created_at',
                      'instance_uuid']
-            form_print(mes, order)
+            res = query_print(tnglib.iter_requests, order, args,
+                              tnglib.REQUEST_FILTERS, 'requests')
             exit(not res)
     
     #monitor subcommand
@@ -199,7 +239,7 @@ def dispatch(args):
                     args.metric_list, args.vnf_uuid, args.vdu_uuid, 
                     args.metric_name, args.vnv_tests, args.service_uuid, 
                     args.remove_service, args.target_name,args.target_endpoint, 
-                    args.target_type, args.target_path]
+                    args.target_type, args.target_path, args.export]
 
         arg_sum = len([x for x in sel_args if x])
         if arg_sum == 0:
@@ -214,6 +254,16 @@ def dispatch(args):
             print(msg)
             exit(1)
 
+        if args.export:
+            res, mes = export_monitoring(args.export,
+                                         args.export_format,
+                                         args.metric_name,
+                                         args.vnv_tests,
+                                         args.service_uuid)
+            order = ['dataset', 'rows', 'file']
+            form_print(mes, order)
+            exit(not res)
+
         if args.remove_service:
             res, mes = tnglib.stop_monitoring(args.remove_service)
             order = ['srv_uuid']
@@ -339,9 +389,10 @@ def dispatch(args):
             exit(not res)
 
         if args.instance:
-            res, mes = tnglib.get_service_instances()
             order = ['instance_uuid', 'name', 'status', 'created_at']
-            form_print(mes, order)
+            res = query_print(tnglib.iter_service_instances, order, args,
+                              tnglib.SERVICE_INSTANCE_FILTERS,
+                              'service_instances')
             exit(not res)
 
         if bool(args.instantiate):
@@ -356,7 +407,8 @@ def dispatch(args):
                     exit(1)
             elif args.params_file:
                 try:
-                    params = yaml.load(open(args.params_file, 'r'))
+                    params = tnglib.helpers.load_yaml(
+                        open(args.params_file, 'r'))
                     if not isinstance(params, dict):
                         print("File does not contain a dictionary")
                         exit(1)
@@ -465,9 +517,10 @@ def dispatch(args):
             exit(not res)
 
         if args.instance:
-            res, mes = tnglib.get_function_instances()
             order = ['instance_uuid', 'status', 'version', 'created_at']
-            form_print(mes, order)
+            res = query_print(tnglib.iter_function_instances, order, args,
+                              tnglib.FUNCTION_INSTANCE_FILTERS,
+                              'function_instances')
             exit(not res)
 
     # sla subcommand
@@ -508,6 +561,21 @@ def dispatch(args):
                         args.date
                         ]
 
+            if args.manifest:
+                res, mes = tnglib.create_sla_templates_from_manifest(
+                    args.manifest,
+                    args.mapping or None,
+                    rate=args.rate)
+                order = ['templateName', 'status', 'sla_uuid']
+                if isinstance(mes, list):
+                    form_print(mes, order)
+                    failed = [x for x in mes if x['status'] == 'failed']
+                    for result in failed:
+                        print(result['templateName'] + ": " + result['error'])
+                else:
+                    print(mes)
+                exit(not res)
+
             arg_sum = len([x for x in sel_args if x])
             if arg_sum == 0:
                 res, mes = tnglib.get_sla_templates()
@@ -594,6 +662,18 @@ def dispatch(args):
                 print("Only --nsi and --sla allowed with --agreement")
                 exit(1)
 
+            if args.detailed:
+                res, mes = tnglib.get_agreement_details(args.nsi or None)
+                if res:
+                    mes = [_flatten_agreement(agr) for agr in mes]
+                order = ['sla_uuid',
+                         'nsi_uuid',
+                         'template',
+                         'guarantees',
+                         'status']
+                form_print(mes, order)
+                exit(not res)
+
             if bool(args.nsi) and bool(args.sla):
                 res, mes = tnglib.get_detailed_agreement(args.sla, args.nsi)
                 form_print(mes)
@@ -632,6 +712,47 @@ def dispatch(args):
                 print("Only --nsi and --sla allowed with --violation")
                 exit(1)
 
+            if args.watch:
+                def report(violation):
+                    print(json.dumps(violation))
+                    sys.stdout.flush()
+
+                nsi_uuids = None
+                if args.nsi:
+                    nsi_uuids = args.nsi.split(',')
+
+                res, mes = tnglib.watch_violations(callback=report,
+                                                   webhook=args.webhook,
+                                                   nsi_uuids=nsi_uuids,
+                                                   interval=args.interval)
+                exit(not res)
+
+            if args.summary:
+                if args.top:
+                    res, mes = tnglib.get_top_violators(args.top,
+                                                        args.group_by,
+                                                        args.since,
+                                                        args.until,
+                                                        args.nsi or None,
+                                                        args.sla or None)
+                    order = [args.group_by, 'violations', 'first', 'last']
+                else:
+                    res, mes = tnglib.get_violation_summary(
+                        args.window,
+                        args.group_by,
+                        args.since,
+                        args.until,
+                        nsi_uuid=args.nsi or None,
+                        sla_uuid=args.sla or None)
+                    order = [args.group_by,
+                             'window_start',
+                             'violations',
+                             'first',
+                             'last',
+                             'duration']
+                form_print(mes, order)
+                exit(not res)
+
             if bool(args.nsi) and bool(args.sla):
                 res, mes = tnglib.get_violations_per_nsi_sla(args.sla,
                                                              args.nsi)
@@ -668,22 +789,54 @@ def dispatch(args):
                     args.instantiate,
                     args.terminate,
                     args.template,
-                    args.instance]
+                    args.instance,
+                    args.batch]
         arg_sum = len([x for x in sel_args if x])
 
         if arg_sum == 0:
             msg = "One of --create, --remove, --terminate, --instantiate, " \
-                  "--template or --instance needed with slice subcommand."
+                  "--template, --instance or --batch needed with slice " \
+                  "subcommand."
             print(msg)
             exit(1)
 
         if arg_sum > 1:
             msg = "Only one of --create, --remove, --terminate, " \
-                  "--instantiate, --template or --instance needed " \
-                  "with slice subcommand."
+                  "--instantiate, --template, --instance or --batch " \
+                  "needed with slice subcommand."
             print(msg)
             exit(1)
 
+        if args.batch:
+            res, slices = tnglib.helpers.load_descriptor(args.batch)
+            if not res:
+                print(slices)
+                exit(1)
+            if not isinstance(slices, list):
+                print("The batch file should contain a list of slices")
+                exit(1)
+
+            def report(result):
+                print(result['name'] + ": " + str(result['status']))
+                sys.stdout.flush()
+
+            res, mes = tnglib.slice_batch_instantiate(
+                slices,
+                failure_threshold=args.failure_threshold,
+                timeout=args.batch_timeout,
+                callback=report)
+            order = ['name',
+                     'instance_uuid',
+                     'status',
+                     'submission',
+                     'duration',
+                     'rolled_back']
+            if isinstance(mes, list):
+                form_print(mes, order)
+            else:
+                print(mes)
+            exit(not res)
+
         if args.name and not args.instantiate:
             print("--name can only be combined with --instantiate.")
             exit(1)
@@ -701,8 +854,10 @@ def dispatch(args):
             res, mes = tnglib.get_slice_template(args.get)
 
         elif args.instance and not args.get:
-            res, mes = tnglib.get_slice_instances()
             order = ['instance_uuid', 'name', 'template_uuid', 'created_at']
+            res = query_print(tnglib.iter_slice_instances, order, args,
+                              collection='slice_instances')
+            exit(not res)
 
         elif args.instance and args.get:
             res, mes = tnglib.get_slice_instance(args.get)
@@ -710,6 +865,15 @@ def dispatch(args):
         elif args.remove:
             res, mes = tnglib.delete_slice_template(args.remove)
 
+        elif args.create and args.sla:
+            slas = []
+            for sla in args.sla:
+                sla_uuid, _, sla_name = sla.partition(':')
+                slas.append((sla_uuid, sla_name or sla_uuid))
+            res, mes = tnglib.create_slice_template_variants(args.create,
+                                                             slas)
+            order = ['sla_uuid', 'name', 'uuid', 'error']
+
         elif args.create:
             res, mes = tnglib.create_slice_template(args.create)
 
@@ -778,8 +942,21 @@ def dispatch(args):
             res, mes = tnglib.get_test_result(args.get)
             form_print(mes)
             exit(not res)
+        elif args.archive:
+            def report(result_uuid, ok):
+                if not ok:
+                    sys.stderr.write("Couldn't download " + result_uuid +
+                                     "\n")
+
+            res, mes = tnglib.archive_test_results(args.archive,
+                                                   fmt=args.archive_format,
+                                                   callback=report)
+            form_print(mes)
+            exit(not res)
+        elif args.analyze:
+            res = analyze_results(args.analyze, args)
+            exit(not res)
         else:
-            res, mes = tnglib.get_test_results()
             order = ['uuid',
                      'instance_uuid',
                      'package_id',
@@ -788,12 +965,18 @@ def dispatch(args):
                      #'test_instance_uuid',
                      'status',
                      'created_at']
-            form_print(mes, order)
+            res = query_print(tnglib.iter_test_results, order, args,
+                              tnglib.TEST_RESULT_FILTERS, 'test_results')
             exit(not res)
 
     # plans subcommand
     elif args.subparser_name == 'plan':
 
+        if args.watch is not None:
+            res, mes = watch_plans(args.watch or None, args.interval,
+                                   args.timeout)
+            exit(not res)
+
         if bool(args.get):
             res, mes = tnglib.get_test_plan(args.get)
             form_print(mes)
@@ -828,6 +1011,224 @@ def dispatch(args):
             form_print(mes, order)
             exit(not res)
 
+    # inspect subcommand
+    elif args.subparser_name == 'inspect':
+        res, mes = tnglib.inspect_entity(args.uuid, depth=args.depth)
+        order = ['kind', 'uuid', 'name', 'relation', 'distance']
+        form_print(mes, order)
+        exit(not res)
+
+    # sync subcommand
+    elif args.subparser_name == 'sync':
+
+        if args.info:
+            res, mes = tnglib.get_mirror_info(args.mirror)
+            order = ['collection', 'records', 'created_at', 'synced_at',
+                     'sync']
+            form_print(mes, order)
+            exit(not res)
+
+        res, mes = tnglib.sync_mirror(args.collection,
+                                      db=args.mirror,
+                                      full=args.full)
+        if isinstance(mes, dict):
+            rows = []
+            for collection, stats in sorted(mes.items()):
+                row = {'collection': collection}
+                if isinstance(stats, dict):
+                    row.update(stats)
+                else:
+                    row['error'] = stats
+                rows.append(row)
+            mes = rows
+        order = ['collection', 'fetched', 'added', 'updated', 'removed',
+                 'error']
+        form_print(mes, order)
+        exit(not res)
+
+    # bench subcommand
+    elif args.subparser_name == 'bench':
+
+        if args.suite == 'compare':
+            if not (args.base and args.report):
+                print("--base and --report are required with compare")
+                exit(1)
+            res, mes = tnglib.compare_bench_reports(args.base, args.report)
+            order = ['operation', 'statistic', 'base', 'new', 'change']
+            form_print(mes, order)
+            exit(not res)
+
+        if args.suite == 'read':
+            sizes = {}
+            for size in args.size or []:
+                collection, _, number = size.partition('=')
+                if collection not in tnglib.MOCK_SIZES or \
+                        not number.isdigit():
+                    print("--size expects COLLECTION=N, with COLLECTION " +
+                          "one of " + ", ".join(sorted(tnglib.MOCK_SIZES)))
+                    exit(1)
+                sizes[collection] = int(number)
+
+            extra = {'form_print services':
+                     _renderer(tnglib.get_service_instances,
+                               ['instance_uuid', 'name', 'status',
+                                'created_at']),
+                     'form_print violations':
+                     _renderer(tnglib.get_violations,
+                               ['sla_uuid', 'nsi_uuid', 'violation_time',
+                                'alert_state'])}
+
+            res, mes = tnglib.bench_read(sizes,
+                                         latency=args.latency,
+                                         repeat=(args.repeat or
+                                                 tnglib.BENCH_READ_REPEAT),
+                                         extra=extra,
+                                         report=args.report)
+
+        if args.suite == 'render':
+            mes = output.bench_render(rows=args.rows,
+                                      repeat=args.repeat or 3,
+                                      report=args.report)
+            res = True
+
+        if args.suite == 'lifecycle':
+            if not args.service:
+                print("--service is required with lifecycle")
+                exit(1)
+
+            def report(cycle, operation, ok, seconds):
+                print("cycle " + str(cycle) + " " + operation + ": " +
+                      ("ok" if ok else "failed") + " after " +
+                      str(round(seconds, 1)) + "s")
+                sys.stdout.flush()
+
+            res, mes = tnglib.bench_lifecycle(args.service,
+                                              cycles=args.cycles,
+                                              concurrency=args.concurrency,
+                                              rate=args.rate,
+                                              vnfd_uuid=args.vnfd,
+                                              interval=args.interval,
+                                              timeout=args.timeout,
+                                              report=args.report,
+                                              callback=report)
+
+        rows = []
+        for operation, stats in sorted(mes['operations'].items()):
+            row = {'operation': operation}
+            row.update(stats)
+            rows.append(row)
+        order = ['operation', 'calls', 'failed', 'throughput', 'mean',
+                 'p50', 'p90', 'p99']
+        if args.suite == 'read':
+            order = ['operation', 'throughput', 'mean', 'p50', 'p99', 'cpu',
+                     'memory']
+        if args.suite == 'render':
+            order = ['operation', 'rows', 'throughput', 'mean', 'cpu']
+        print('')
+        form_print(rows, order)
+        for request_uuid in mes.get('leaked', []):
+            print("No instance terminated for request " + request_uuid)
+        exit(not res)
+
+    # logs subcommand
+    elif args.subparser_name == 'logs':
+
+        if args.index_info:
+            res, mes = tnglib.get_log_index_info(args.db)
+            form_print(mes)
+            exit(not res)
+
+        if args.evict:
+            res, mes = tnglib.evict_log_index(args.evict, args.db)
+            if res:
+                print("Removed " + str(mes) + " messages")
+            else:
+                print(mes)
+            exit(not res)
+
+        if args.local:
+            res, mes = tnglib.query_log_index(args.db,
+                                              _from=args.time_from,
+                                              to=args.time_to,
+                                              container=args.container,
+                                              source=args.source,
+                                              level=args.level,
+                                              text=args.search)
+            if not res:
+                print(mes)
+                exit(1)
+            for message in mes:
+                print(tnglib.format_log_message(message, args.format))
+            exit(0)
+
+        if args.tail or args.follow:
+            def report(count, timestamp):
+                sys.stderr.write(str(count) + " new messages, last at " +
+                                 str(timestamp) + "\n")
+
+            log_file = args.output
+            if args.stdout:
+                log_file = None
+
+            res, mes = tnglib.tail_logs(tnglib.get_sp_path(),
+                                        filter=args.filter,
+                                        output=log_file,
+                                        checkpoint=args.checkpoint,
+                                        follow=args.follow,
+                                        interval=args.interval,
+                                        callback=report,
+                                        fmt=args.format,
+                                        compression=args.compress,
+                                        rotate_size=args.rotate_size,
+                                        rotate_interval=args.rotate_interval)
+            if not res:
+                print(mes)
+            exit(not res)
+
+        if not (args.time_from and args.time_to):
+            print("--from and --to are required, unless --tail or --follow "
+                  "is used")
+            exit(1)
+
+        def progress(done, total, count):
+            sys.stderr.write("window " + str(done) + "/" + str(total) +
+                             " done, " + str(count) + " messages\n")
+
+        log_workers = args.log_workers or args.workers or \
+            tnglib.LOGS_WORKERS
+
+        if args.index:
+            res, mes = tnglib.index_logs(args.time_from,
+                                         args.time_to,
+                                         tnglib.get_sp_path(),
+                                         filter=args.filter,
+                                         db=args.db,
+                                         windows=args.windows,
+                                         workers=log_workers,
+                                         progress=progress)
+            if res:
+                print("Indexed " + str(mes) + " new messages in " + args.db)
+            else:
+                print(mes)
+            exit(not res)
+
+        res, mes = tnglib.get_logs(args.time_from,
+                                   args.time_to,
+                                   tnglib.get_sp_path(),
+                                   filter=args.filter,
+                                   file=not args.stdout,
+                                   windows=args.windows,
+                                   workers=log_workers,
+                                   progress=progress,
+                                   output=args.output,
+                                   fmt=args.format,
+                                   compression=args.compress,
+                                   rotate_size=args.rotate_size,
+                                   rotate_interval=args.rotate_interval)
+        if not res or not args.stdout:
+            print(mes)
+        exit(not res)
+
     elif args.subparser_name:
         print("Subcommand " + args.subparser_name + " not support yet")
         exit(0)
@@ -835,6 +1236,40 @@ def dispatch(args):
     return
 
 
+def is_offline(args):
+    """
+    Whether the requested action only works on local data
+    """
+
+    if args.replay or args.offline:
+        return True
+
+    if args.subparser_name == 'sync':
+        return args.info
+
+    if args.subparser_name == 'logs':
+        return bool(args.local or args.index_info or args.evict)
+
+    if args.subparser_name == 'bench':
+        return args.suite in ['compare', 'read', 'render']
+
+    return False
+
+
+def is_mirrored_listing(args):
+    """
+    Whether the requested action lists a collection of the local mirror
+    """
+
+    if args.subparser_name in ['request', 'result']:
+        return not args.get
+
+    if args.subparser_name in ['service', 'function', 'slice']:
+        return bool(args.instance and not args.get)
+
+    return False
+
+
 def parse_args(args):
     """
     This method parses the arguments provided with the cli command
@@ -848,6 +1283,62 @@ def parse_args(args):
                         default=None,
                         help='Specify the service platform url')
 
+    parser.add_argument('--workers',
+                        dest='workers',
+                        metavar='N',
+                        type=int,
+                        default=None,
+                        help='Number of parallel requests for bulk actions')
+
+    parser.add_argument('--timings',
+                        dest='timings',
+                        action='store_true',
+                        default=False,
+                        help='Print the latency percentiles of the '
+                             'lifecycle requests when done')
+
+    parser.add_argument('--timings-format',
+                        dest='timings_format',
+                        default='table',
+                        choices=['table', 'json', 'prometheus'],
+                        help='Format of --timings')
+
+    parser.add_argument('--record',
+                        dest='record',
+                        metavar='FILE',
+                        default=None,
+                        help='Record the HTTP traffic with the SP to an '
+                             'archive')
+
+    parser.add_argument('--replay',
+                        dest='replay',
+                        metavar='FILE',
+                        default=None,
+                        help='Answer requests from a recorded archive '
+                             'instead of the SP')
+
+    parser.add_argument('--replay-latency-factor',
+                        dest='replay_latency_factor',
+                        metavar='FACTOR',
+                        type=float,
+                        default=1.0,
+                        help='Factor applied to the recorded latencies, '
+                             '0.5 answers twice as fast, 0 immediately')
+
+    parser.add_argument('--offline',
+                        dest='offline',
+                        action='store_true',
+                        default=False,
+                        help='Answer listings from the local mirror, see '
+                             'tng-cli sync')
+
+    parser.add_argument('--mirror',
+                        dest='mirror',
+                        metavar='FILE',
+                        default=tnglib.MIRROR_DB,
+                        help='Path of the local mirror, default ' +
+                             tnglib.MIRROR_DB)
+
     parser.add_argument('-v',
                         '--verbose',
                         dest='verbose',
@@ -858,31 +1349,251 @@ def parse_args(args):
     subparsers = parser.add_subparsers(description='',
                                        dest='subparser_name')
 
+    # filtering of listings, shared by the subcommands that list records
+    parser_query = argparse.ArgumentParser(add_help=False)
+    help_mes = 'Only print the listed records that match all conditions, ' \
+               'e.g. "status=ERROR,created_at>2019-05-01". Operators are ' \
+               '=, !=, <, <=, >, >= and ~ (regular expression)'
+    parser_query.add_argument('--filter',
+                              metavar='EXPRESSION',
+                              default=None,
+                              help=help_mes)
+    help_mes = 'Sort the listed records on comma separated fields, ' \
+               'prefix a field with - to sort descending, e.g. ' \
+               '--sort=-created_at'
+    parser_query.add_argument('--sort',
+                              metavar='FIELDS',
+                              default=None,
+                              help=help_mes)
+    parser_query.add_argument('--columns',
+                              metavar='FIELDS',
+                              default=None,
+                              help='Comma separated fields to print')
+
+    # output format, shared by the subcommands that print results
+    parser_out = argparse.ArgumentParser(add_help=False)
+    parser_out.add_argument('--output',
+                            dest='output_format',
+                            choices=output.FORMATS,
+                            default='table',
+                            help='Format of the results, table by default')
+    parser_out.add_argument('--limit',
+                            metavar='N',
+                            type=int,
+                            default=None,
+                            help='Print at most N records of a listing')
+    parser_out.add_argument('--offset',
+                            metavar='N',
+                            type=int,
+                            default=0,
+                            help='Skip the first N records of a listing')
+    help_mes = 'Number of records the table column widths are taken ' \
+               'from, 0 for all. Default ' + str(output.TABLE_SAMPLE)
+    parser_out.add_argument('--width-sample',
+                            metavar='N',
+                            type=int,
+                            default=output.TABLE_SAMPLE,
+                            help=help_mes)
+
     parser_pkg = subparsers.add_parser('package',
-                                       help='actions related to packages')
+                                       help='actions related to packages',
+                                       parents=[parser_out])
     parser_ser = subparsers.add_parser('service',
-                                       help='actions related to services')
+                                       help='actions related to services',
+                                       parents=[parser_out, parser_query])
     parser_req = subparsers.add_parser('request',
-                                       help='actions related to requests')
+                                       help='actions related to requests',
+                                       parents=[parser_out, parser_query])
     parser_fun = subparsers.add_parser('function',
-                                       help='actions related to functions')
+                                       help='actions related to functions',
+                                       parents=[parser_out, parser_query])
     parser_sla = subparsers.add_parser('sla',
-                                       help='actions related to slas')
+                                       help='actions related to slas',
+                                       parents=[parser_out])
     parser_slc = subparsers.add_parser('slice',
-                                       help='actions related to slices')
+                                       help='actions related to slices',
+                                       parents=[parser_out, parser_query])
     parser_pol = subparsers.add_parser('policy',
-                                       help='actions related to policies')
+                                       help='actions related to policies',
+                                       parents=[parser_out])
     parser_tests = subparsers.add_parser('test',
-                                         help='actions related to test descriptors')
+                                         help='actions related to test descriptors',
+                                         parents=[parser_out])
     parser_plans = subparsers.add_parser('plan',
-                                         help='actions related to test-plans')
+                                         help='actions related to test-plans',
+                                         parents=[parser_out])
     parser_results = subparsers.add_parser('result',
-                                         help='actions related to results')
+                                         help='actions related to results',
+                                           parents=[parser_out, parser_query])
     parser_mon = subparsers.add_parser('monitor',
-                                         help='actions related to monitoring')
+                                         help='actions related to monitoring',
+                                       parents=[parser_out])
+    parser_logs = subparsers.add_parser('logs',
+                                         help='actions related to logs')
+    parser_bench = subparsers.add_parser('bench',
+                                         help='benchmarks of the SP',
+                                         parents=[parser_out])
+    parser_ins = subparsers.add_parser('inspect',
+                                       help='entities related to a uuid',
+                                       parents=[parser_out])
+    parser_sync = subparsers.add_parser('sync',
+                                        help='mirror SP collections locally',
+                                        parents=[parser_out])
     parser_login = subparsers.add_parser('login',
                                          help='actions related to login')
 
+    # bench sub arguments
+    help_mes = 'lifecycle: run instantiate, scale and terminate cycles. ' \
+               'read: time the read functions against a local mock SP. ' \
+               'render: measure the rows per second of the output ' \
+               'formats. compare: compare the report of a run with --base'
+    parser_bench.add_argument('suite',
+                              choices=['lifecycle', 'read', 'render',
+                                       'compare'],
+                              help=help_mes)
+
+    help_mes = 'Only with render. Number of records to render'
+    parser_bench.add_argument('--rows',
+                              metavar='N',
+                              type=int,
+                              required=False,
+                              default=tnglib.BENCH_RENDER_ROWS,
+                              help=help_mes)
+
+    help_mes = 'Only with read. Number of records the mock serves for a ' \
+               'collection, can be repeated'
+    parser_bench.add_argument('--size',
+                              metavar='COLLECTION=N',
+                              action='append',
+                              required=False,
+                              default=None,
+                              help=help_mes)
+
+    help_mes = 'Only with read. Seconds the mock adds to every response'
+    parser_bench.add_argument('--latency',
+                              metavar='SECONDS',
+                              type=float,
+                              required=False,
+                              default=0,
+                              help=help_mes)
+
+    help_mes = 'Only with read and render. Number of timed calls per ' \
+               'function, ' + str(tnglib.BENCH_READ_REPEAT) + \
+               ' for read and 3 for render by default'
+    parser_bench.add_argument('--repeat',
+                              metavar='N',
+                              type=int,
+                              required=False,
+                              default=None,
+                              help=help_mes)
+
+    help_mes = 'Only with lifecycle. The service to instantiate'
+    parser_bench.add_argument('-s',
+                              '--service',
+                              metavar='SERVICE UUID',
+                              required=False,
+                              default=None,
+                              help=help_mes)
+
+    help_mes = 'Only with lifecycle. The vnf descriptor to scale out and ' \
+               'in, no scaling if omitted'
+    parser_bench.add_argument('--vnfd',
+                              metavar='VNFD UUID',
+                              required=False,
+                              default=None,
+                              help=help_mes)
+
+    parser_bench.add_argument('--cycles',
+                              metavar='N',
+                              type=int,
+                              required=False,
+                              default=10,
+                              help='Number of cycles, 10 by default')
+
+    parser_bench.add_argument('--concurrency',
+                              metavar='N',
+                              type=int,
+                              required=False,
+                              default=4,
+                              help='Number of cycles in flight, 4 by default')
+
+    help_mes = 'Maximum number of cycles started per second. Cycles ' \
+               'only start when one of the --concurrency slots is free'
+    parser_bench.add_argument('--rate',
+                              metavar='N',
+                              type=float,
+                              required=False,
+                              default=None,
+                              help=help_mes)
+
+    parser_bench.add_argument('--interval',
+                              metavar='SECONDS',
+                              type=float,
+                              required=False,
+                              default=tnglib.BENCH_POLL_INTERVAL,
+                              help='Seconds between two status polls')
+
+    help_mes = 'Seconds after which an operation counts as failed'
+    parser_bench.add_argument('--timeout',
+                              metavar='SECONDS',
+                              type=float,
+                              required=False,
+                              default=None,
+                              help=help_mes)
+
+    help_mes = 'Json file to write the report to. With compare, the ' \
+               'report to compare'
+    parser_bench.add_argument('--report',
+                              metavar='FILE',
+                              required=False,
+                              default=None,
+                              help=help_mes)
+
+    help_mes = 'Only with compare. The reference report'
+    parser_bench.add_argument('--base',
+                              metavar='FILE',
+                              required=False,
+                              default=None,
+                              help=help_mes)
+
+    # inspect sub arguments
+    help_mes = 'uuid of a package, descriptor, record, request, SLA, ' \
+               'policy, test or slice'
+    parser_ins.add_argument('uuid',
+                            metavar='UUID',
+                            help=help_mes)
+
+    parser_ins.add_argument('--depth',
+                            metavar='N',
+                            type=int,
+                            required=False,
+                            default=1,
+                            help='Number of relations to follow, 1 by default')
+
+    # sync sub arguments
+    help_mes = 'Collection to sync, can be repeated. All by default'
+    parser_sync.add_argument('-c',
+                             '--collection',
+                             choices=tnglib.MIRROR_COLLECTIONS,
+                             action='append',
+                             required=False,
+                             default=None,
+                             help=help_mes)
+
+    help_mes = 'Read the complete collections and remove the records ' \
+               'the SP no longer lists'
+    parser_sync.add_argument('--full',
+                             action='store_true',
+                             required=False,
+                             default=False,
+                             help=help_mes)
+
+    parser_sync.add_argument('--info',
+                             action='store_true',
+                             required=False,
+                             default=False,
+                             help='Show the content of the mirror')
+
     # login sub arguments
     parser_login.add_argument('-u',
                               '--username',
@@ -1196,6 +1907,31 @@ def parse_args(args):
                             default=False,
                             help=help_mes)
 
+    help_mes = 'Only with --template. Create all SLA templates described ' \
+               'in a json or yaml manifest. Existing templates are skipped.'
+    parser_sla.add_argument('--manifest',
+                            metavar='FILE',
+                            required=False,
+                            default=False,
+                            help=help_mes)
+
+    help_mes = 'Only with --template --manifest. Json file to store the ' \
+               'uuid of each template in'
+    parser_sla.add_argument('--mapping',
+                            metavar='FILE',
+                            required=False,
+                            default=False,
+                            help=help_mes)
+
+    help_mes = 'Only with --template --manifest. Maximum number of ' \
+               'templates created per second'
+    parser_sla.add_argument('--rate',
+                            metavar='N',
+                            type=float,
+                            required=False,
+                            default=tnglib.SLA_MANIFEST_RATE,
+                            help=help_mes)
+
     help_mes = 'Only with --template. Remove an SLA template.'
     parser_sla.add_argument('-r',
                             '--remove',
@@ -1231,6 +1967,84 @@ def parse_args(args):
                             default=False,
                             help=help_mes)
 
+    help_mes = 'Only with --agreement. Resolve the details, template ' \
+               'and guarantees of every agreement'
+    parser_sla.add_argument('--detailed',
+                            action='store_true',
+                            required=False,
+                            default=False,
+                            help=help_mes)
+
+    help_mes = 'Only with --violation. Keep polling and print new ' \
+               'violations as json lines. -n takes a comma separated list'
+    parser_sla.add_argument('--watch',
+                            action='store_true',
+                            required=False,
+                            default=False,
+                            help=help_mes)
+
+    help_mes = 'Only with --violation --watch. Post new violations to url'
+    parser_sla.add_argument('--webhook',
+                            metavar='URL',
+                            required=False,
+                            default=None,
+                            help=help_mes)
+
+    help_mes = 'Only with --violation --watch. Shortest time between ' \
+               'two polls, in seconds'
+    parser_sla.add_argument('--interval',
+                            metavar='SECONDS',
+                            type=float,
+                            required=False,
+                            default=tnglib.VIOLATIONS_WATCH_MIN,
+                            help=help_mes)
+
+    help_mes = 'Only with --violation. Count violations per service ' \
+               'instance and time window'
+    parser_sla.add_argument('--summary',
+                            action='store_true',
+                            required=False,
+                            default=False,
+                            help=help_mes)
+
+    help_mes = 'Only with --summary. minute, hour, day, week or a ' \
+               'number of seconds'
+    parser_sla.add_argument('--window',
+                            metavar='WINDOW',
+                            required=False,
+                            default='hour',
+                            help=help_mes)
+
+    help_mes = 'Only with --summary. Group by nsi_uuid or sla_uuid'
+    parser_sla.add_argument('--group-by',
+                            choices=['nsi_uuid', 'sla_uuid'],
+                            required=False,
+                            default='nsi_uuid',
+                            help=help_mes)
+
+    help_mes = 'Only with --summary. Start of the period, a timestamp ' \
+               'or a duration like 7d'
+    parser_sla.add_argument('--since',
+                            metavar='TIME',
+                            required=False,
+                            default=None,
+                            help=help_mes)
+
+    help_mes = 'Only with --summary. End of the period'
+    parser_sla.add_argument('--until',
+                            metavar='TIME',
+                            required=False,
+                            default=None,
+                            help=help_mes)
+
+    help_mes = 'Only with --summary. List the N worst offenders instead'
+    parser_sla.add_argument('--top',
+                            metavar='N',
+                            type=int,
+                            required=False,
+                            default=None,
+                            help=help_mes)
+
     # slice related arguments
     parser_slc.add_argument('--template',
                             action='store_true',
@@ -1299,6 +2113,43 @@ def parse_args(args):
                             default=False,
                             help=help_mes)
 
+    help_mes = 'Instantiate all slices listed in a json or yaml file and ' \
+               'wait for them. Each entry has a template uuid and ' \
+               'optionally a name and description.'
+    parser_slc.add_argument('--batch',
+                            metavar='FILE',
+                            required=False,
+                            default=False,
+                            help=help_mes)
+
+    help_mes = 'Only with --batch. Terminate the instantiated slices ' \
+               'when more than N slices fail, N below 1 is a fraction'
+    parser_slc.add_argument('--failure-threshold',
+                            metavar='N',
+                            type=float,
+                            required=False,
+                            default=None,
+                            help=help_mes)
+
+    help_mes = 'Only with --batch. Seconds after which unfinished ' \
+               'requests count as failed'
+    parser_slc.add_argument('--batch-timeout',
+                            metavar='SECONDS',
+                            type=float,
+                            required=False,
+                            default=None,
+                            help=help_mes)
+
+    help_mes = 'Only with --create. Create a variant of the slice ' \
+               'template for this SLA, can be repeated. The name of the ' \
+               'SLA is appended to the template name.'
+    parser_slc.add_argument('--sla',
+                            metavar='SLA UUID[:SLA NAME]',
+                            action='append',
+                            required=False,
+                            default=None,
+                            help=help_mes)
+
     # Policy subcommands
     parser_pol.add_argument('-g',
                             '--get',
@@ -1458,6 +2309,208 @@ def parse_args(args):
                             default=False,
                             help=help_mes)
 
+    help_mes = 'Export metrics (with --metric-name), VnV test data ' \
+               '(with --vnv-tests) and SLA violations to columnar files ' \
+               'in DIRECTORY'
+    parser_mon.add_argument('-exp',
+                            '--export',
+                            metavar='DIRECTORY',
+                            required=False,
+                            default=False,
+                            help=help_mes)
+
+    help_mes = 'Only with --export. File format of the export ' \
+               '(parquet or arrow)'
+    parser_mon.add_argument('--export-format',
+                            choices=['parquet', 'arrow'],
+                            required=False,
+                            default='parquet',
+                            help=help_mes)
+
+    # logs sub arguments
+    parser_logs.add_argument('--from',
+                             dest='time_from',
+                             metavar='"YYYY-MM-DD HH:MM:SS"',
+                             required=False,
+                             default=None,
+                             help='Start of the time range')
+
+    parser_logs.add_argument('--to',
+                             dest='time_to',
+                             metavar='"YYYY-MM-DD HH:MM:SS"',
+                             required=False,
+                             default=None,
+                             help='End of the time range')
+
+    help_mes = 'Graylog filter, e.g. "container_name:tng-gtk-sp". ' \
+               'Defaults to all errors of the SP'
+    parser_logs.add_argument('-f',
+                             '--filter',
+                             metavar='FILTER',
+                             required=False,
+                             default=None,
+                             help=help_mes)
+
+    help_mes = 'Number of windows the time range is split in'
+    parser_logs.add_argument('--windows',
+                             metavar='WINDOWS',
+                             type=int,
+                             required=False,
+                             default=1,
+                             help=help_mes)
+
+    help_mes = 'Number of windows that are fetched in parallel, the ' \
+               'global --workers or ' + str(tnglib.LOGS_WORKERS) + \
+               ' by default'
+    parser_logs.add_argument('--workers',
+                             dest='log_workers',
+                             metavar='WORKERS',
+                             type=int,
+                             required=False,
+                             default=None,
+                             help=help_mes)
+
+    help_mes = 'Append the messages that are new since the previous ' \
+               '--tail to the output file'
+    parser_logs.add_argument('--tail',
+                             action='store_true',
+                             required=False,
+                             default=False,
+                             help=help_mes)
+
+    help_mes = 'Like --tail, but keep polling until interrupted'
+    parser_logs.add_argument('--follow',
+                             action='store_true',
+                             required=False,
+                             default=False,
+                             help=help_mes)
+
+    help_mes = 'Only with --follow. Seconds between two polls'
+    parser_logs.add_argument('--interval',
+                             metavar='SECONDS',
+                             type=float,
+                             required=False,
+                             default=5,
+                             help=help_mes)
+
+    help_mes = 'Only with --tail or --follow. Path of the checkpoint file, ' \
+               'one per user and SP in the temp directory by default'
+    parser_logs.add_argument('--checkpoint',
+                             metavar='FILE',
+                             required=False,
+                             default=None,
+                             help=help_mes)
+
+    help_mes = 'Ingest the time range into the local log index ' \
+               'instead of writing a file'
+    parser_logs.add_argument('--index',
+                             action='store_true',
+                             required=False,
+                             default=False,
+                             help=help_mes)
+
+    help_mes = 'Query the local log index instead of Graylog. Can be ' \
+               'combined with --from, --to, --container, --source, ' \
+               '--level and --search'
+    parser_logs.add_argument('--local',
+                             action='store_true',
+                             required=False,
+                             default=False,
+                             help=help_mes)
+
+    help_mes = 'Only with --local. Filter on container name'
+    parser_logs.add_argument('--container',
+                             metavar='CONTAINER NAME',
+                             required=False,
+                             default=None,
+                             help=help_mes)
+
+    help_mes = 'Only with --local. Filter on source'
+    parser_logs.add_argument('--source',
+                             metavar='SOURCE',
+                             required=False,
+                             default=None,
+                             help=help_mes)
+
+    help_mes = 'Only with --local. Maximum syslog level, e.g. 3 for errors'
+    parser_logs.add_argument('--level',
+                             metavar='LEVEL',
+                             type=int,
+                             required=False,
+                             default=None,
+                             help=help_mes)
+
+    help_mes = 'Only with --local. Full-text search on the message'
+    parser_logs.add_argument('--search',
+                             metavar='TEXT',
+                             required=False,
+                             default=None,
+                             help=help_mes)
+
+    help_mes = 'Show the size and content of the local log index'
+    parser_logs.add_argument('--index-info',
+                             action='store_true',
+                             required=False,
+                             default=False,
+                             help=help_mes)
+
+    help_mes = 'Remove messages older than the timestamp from the index'
+    parser_logs.add_argument('--evict',
+                             metavar='"YYYY-MM-DD HH:MM:SS"',
+                             required=False,
+                             default=None,
+                             help=help_mes)
+
+    help_mes = 'Path of the local log index'
+    parser_logs.add_argument('--db',
+                             metavar='FILE',
+                             required=False,
+                             default=tnglib.LOGS_INDEX,
+                             help=help_mes)
+
+    help_mes = 'Print the logs instead of writing them to a file'
+    parser_logs.add_argument('--stdout',
+                             action='store_true',
+                             required=False,
+                             default=False,
+                             help=help_mes)
+
+    parser_logs.add_argument('-o',
+                             '--output',
+                             metavar='FILE',
+                             required=False,
+                             default='graylogs.log',
+                             help='Path of the log file')
+
+    help_mes = 'text for formatted lines, jsonl to keep all Graylog fields'
+    parser_logs.add_argument('--format',
+                             choices=['text', 'jsonl'],
+                             required=False,
+                             default='text',
+                             help=help_mes)
+
+    parser_logs.add_argument('--compress',
+                             choices=['gzip', 'zstd'],
+                             required=False,
+                             default=None,
+                             help='Compress the log files')
+
+    help_mes = 'Start a new log file when the current one exceeds BYTES'
+    parser_logs.add_argument('--rotate-size',
+                             metavar='BYTES',
+                             type=int,
+                             required=False,
+                             default=None,
+                             help=help_mes)
+
+    help_mes = 'Start a new log file for every SECONDS of log messages'
+    parser_logs.add_argument('--rotate-interval',
+                             metavar='SECONDS',
+                             type=int,
+                             required=False,
+                             default=None,
+                             help=help_mes)
+
     # tests sub arguments
     parser_tests.add_argument('-g',
                               '--get',
@@ -1473,6 +2526,31 @@ def parse_args(args):
                               default=False,
                               help='Returns detailed info on specified test-plan')
 
+    help_mes = 'Follow test plans until they are finished. Without UUIDs, ' \
+               'all unfinished plans are followed'
+    parser_plans.add_argument('--watch',
+                              metavar='UUID',
+                              nargs='*',
+                              required=False,
+                              default=None,
+                              help=help_mes)
+
+    help_mes = 'Only with --watch. Seconds between two status listings'
+    parser_plans.add_argument('--interval',
+                              metavar='SECONDS',
+                              type=float,
+                              required=False,
+                              default=tnglib.PLANS_WATCH_INTERVAL,
+                              help=help_mes)
+
+    help_mes = 'Only with --watch. Stop after this many seconds'
+    parser_plans.add_argument('--timeout',
+                              metavar='SECONDS',
+                              type=float,
+                              required=False,
+                              default=None,
+                              help=help_mes)
+
     parser_results.add_argument('-g',
                           '--get',
                           metavar='UUID',
@@ -1480,6 +2558,37 @@ def parse_args(args):
                           default=False,
                           help='Returns detailed info on specified test-plan')
 
+    help_mes = 'Download the detailed results into an archive directory, ' \
+               'skipping those already archived'
+    parser_results.add_argument('--archive',
+                                metavar='DIR',
+                                required=False,
+                                default=None,
+                                help=help_mes)
+
+    parser_results.add_argument('--archive-format',
+                                choices=tnglib.ARCHIVE_FORMATS,
+                                required=False,
+                                default='jsonl',
+                                help='Format of the archive, jsonl by default')
+
+    help_mes = 'Run an analytic service on the test results given ' \
+               'with --uuids or selected by --filter, and print the ' \
+               'analytic results'
+    parser_results.add_argument('--analyze',
+                                metavar='SERVICE_NAME',
+                                required=False,
+                                default=None,
+                                help=help_mes)
+
+    help_mes = 'Only with --analyze. Uuids of the test results to analyze'
+    parser_results.add_argument('--uuids',
+                                metavar='UUID',
+                                nargs='+',
+                                required=False,
+                                default=None,
+                                help=help_mes)
+
     return parser.parse_args(args)
 
 
@@ -1493,83 +2602,278 @@ def watch_request(request_uuid):
              'status',
              'created_at']
 
-    res, mes = tnglib.get_request(request_uuid)
-
-    if (not res):
-        return res
-
-    output = [{'request_uuid': request_uuid,
-               'request_type': mes['request_type'],
-               'status': mes['status'],
-               'created_at': mes['created_at']}]
-
-    form_print(output, order)
-    status = mes['status']
-
-    while status not in ['READY', 'ERROR']:
-        time.sleep(5)
-        res, mes = tnglib.get_request(request_uuid)
-        if (not res):
-            return res
+    printed = []
 
+    def report(mes):
         output = [{'request_uuid': request_uuid,
                    'request_type': mes['request_type'],
                    'status': mes['status'],
                    'created_at': mes['created_at']}]
 
-        form_print(output, order, update=True)
-        status = mes['status']
+        form_print(output, order, update=bool(printed))
+        printed.append(mes['status'])
+
+    res, mes = tnglib.wait_for_request(request_uuid, callback=report)
+
+    return res
+
+
+def watch_plans(plan_uuids, interval, timeout):
+    """
+    Follow test plans, printing the finished ones and a progress line
+    """
+
+    order = ['uuid', 'status', 'duration', 'test_result_uuid']
+    printed = []
+    interactive = sys.stderr.isatty()
+
+    def report(event):
+        if event['status'] == 'NOT_FOUND':
+            sys.stderr.write("Test plan " + event['uuid'] + " not found\n")
+            return
+        if event['status'] not in tnglib.PLAN_FINAL_STATUSES:
+            return
+        if interactive:
+            sys.stderr.write('\r\033[K')
+        form_print([event], order, update=bool(printed))
+        sys.stdout.flush()
+        printed.append(event['uuid'])
+
+    def progress(summary):
+        others = sorted((status, count) for status, count in summary.items()
+                        if status not in ['plans', 'finished', 'elapsed'])
+        line = str(summary['finished']) + "/" + str(summary['plans']) + \
+            " finished after " + str(int(summary['elapsed'])) + "s"
+        if others:
+            line = line + " (" + ", ".join(str(status).lower() + " " +
+                                           str(count)
+                                           for status, count in others) + ")"
+        sys.stderr.write(('\r\033[K' if interactive else '') + line +
+                         ('' if interactive else '\n'))
+        sys.stderr.flush()
+
+    res, mes = tnglib.watch_test_plans(plan_uuids,
+                                       interval=interval,
+                                       timeout=timeout,
+                                       callback=report,
+                                       progress=progress)
+    if interactive:
+        sys.stderr.write('\n')
+
+    if not res and not isinstance(mes, list):
+        print(mes)
+
+    return res, mes
+
+
+def analyze_results(service_name, args):
+    """
+    Run an analytic service on the test results given with --uuids or
+    selected by --filter, printing each test result as its analytic
+    result arrives
+    """
 
-    if status == 'ERROR':
+    if not (args.uuids or args.filter):
+        print("--analyze needs --uuids or --filter to select the test "
+              "results.")
         return False
 
-    return True
+    res, conditions = tnglib.parse_filter(args.filter)
+    if not res:
+        print(conditions)
+        return False
 
-def form_print(data, order=None, update=False):
+    testr_uuids = args.uuids or []
+    if args.filter:
+        params = tnglib.filter_params(conditions, tnglib.TEST_RESULT_FILTERS)
+        try:
+            results = tnglib.query_records(tnglib.iter_test_results(
+                params=params), conditions)
+            selected = [result['uuid'] for result in results]
+        except tnglib.helpers.RequestError as e:
+            print(e.text)
+            return False
+        if args.uuids:
+            wanted = set(args.uuids)
+            selected = [uuid for uuid in selected if uuid in wanted]
+        testr_uuids = selected
+
+    if not testr_uuids:
+        print("No test results match the filter.")
+        return False
+
+    order = ['testr_uuid', 'status', 'result_uuid']
+    printed = []
+
+    def report(entry):
+        form_print([entry], order, update=bool(printed))
+        sys.stdout.flush()
+        printed.append(entry['testr_uuid'])
+
+    res, mes = tnglib.analyze_test_results(testr_uuids, service_name,
+                                           callback=report)
+    if not isinstance(mes, list):
+        print(mes)
+
+    return res
+
+
+def _renderer(func, order):
     """
-    Formatted printing
+    Callable that renders the result of func, for benchmarks
     """
-    if isinstance(data, list):
-        if order is None:
-            if bool(data):
-                order = data[0].keys()
-            else:
-                return
-
-        # print header
-        if not update:
-            header = ''
-            for key in order:
-                if ('uuid' in key) or ('metric' in key):
-                    new_seg = key.replace('_', ' ').upper().ljust(40)
-                # elif key == 'version':
-                #     new_seg = key.upper().ljust(10)
-                else:
-                    new_seg = key.replace('_', ' ').upper().ljust(20)
-                header = header + new_seg
-            print(header)
-
-        # print content
-        for data_seg in data:
-            line = ''
-            for key in order:
-                if ('uuid' in key) or ('metric' in key):
-                    new_seg = data_seg[key].ljust(40)
-                elif key in ['created_at', 'updated_at', 'violation_time']:
-                    new_seg = data_seg[key][:16].replace('T', ' ').ljust(20)
-                else:
-                    new_seg = data_seg[key][:18].ljust(20)
-                line = line + new_seg
-            print(line)
 
-    elif isinstance(data, dict):
-        print('')
-        print(yaml.dump(data, default_flow_style=False))
+    data = []
+
+    def render():
+        if not data:
+            data.append(func()[1])
+        with contextlib.redirect_stdout(io.StringIO()):
+            form_print(data[0], order)
+
+    return render
+
 
+def print_timings(fmt):
+    """
+    Print the recorded lifecycle timings
+    """
+
+    if fmt != 'table':
+        res, mes = tnglib.export_timings(fmt)
+        print(mes)
+        return
+
+    res, mes = tnglib.get_timings()
+    rows = []
+    for timing in mes:
+        labels = ','.join([str(value) for value in timing['labels'].values()])
+        metric = timing['metric'].replace('request_', '')
+        metric = metric.replace('_seconds', '')
+        rows.append({'metric': metric + ' ' + labels,
+                     'count': str(timing['count']),
+                     'p50': '%.3f' % timing['p50'],
+                     'p90': '%.3f' % timing['p90'],
+                     'p99': '%.3f' % timing['p99'],
+                     'max': '%.3f' % timing['max']})
+
+    print('')
+    form_print(rows, ['metric', 'count', 'p50', 'p90', 'p99', 'max'])
+
+
+def export_monitoring(directory, fmt, metric_name, vnv_tests, service_uuid):
+    """
+    Export monitoring data and SLA violations to columnar files
+    """
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    jobs = []
+    if metric_name:
+        jobs.append((metric_name,
+                     lambda path: tnglib.export_metric(metric_name, path)))
+    if vnv_tests:
+        jobs.append(('vnv_tests',
+                     lambda path: tnglib.export_vnv_tests(path,
+                                                          service_uuid or None)))
+    jobs.append(('sla_violations', tnglib.export_violations))
+
+    success = True
+    output = []
+    for dataset, func in jobs:
+        path = os.path.join(directory, dataset + '.' + fmt)
+        res, mes = func(path)
+        if not res:
+            success = False
+            output.append({'dataset': dataset, 'rows': '', 'file': str(mes)})
+        else:
+            output.append({'dataset': dataset, 'rows': str(mes), 'file': path})
+
+    return success, output
+
+
+def _flatten_agreement(agreement):
+    """
+    Summarize a resolved agreement as a table row
+    """
+
+    template = agreement['template']
+    if isinstance(template, dict):
+        name = template.get('slad', {}).get('name', '')
     else:
-        print(data)
+        name = ''
 
-    return
+    status = 'ok'
+    if not isinstance(agreement['detail'], dict):
+        status = 'detail error'
+    elif not isinstance(template, dict):
+        status = 'template error'
+
+    guarantees = ','.join([str(guar['name'])
+                           for guar in agreement['guarantees']])
+
+    return {'sla_uuid': agreement['sla_uuid'],
+            'nsi_uuid': agreement['nsi_uuid'],
+            'template': name,
+            'guarantees': guarantees,
+            'status': status}
+
+
+def form_print(data, order=None, update=False):
+    """
+    Formatted printing, in the format selected with --output
+    """
+
+    output.write_records(data, order, update)
+
+
+def stream_print(records, order=None):
+    """
+    Print records while they are read from the SP, errors go to stderr
+    so they don't end up in the printed data
+    """
+
+    try:
+        form_print(records, order)
+    except tnglib.helpers.RequestError as e:
+        sys.stdout.flush()
+        sys.stderr.write(str(e.text) + "\n")
+        return False
+
+    return True
+
+
+def query_print(iterate, order, args, fields=None, collection=None):
+    """
+    Print a listing with the --filter, --sort and --columns of args,
+    from the local mirror of the collection with --offline
+    """
+
+    res, conditions = tnglib.parse_filter(args.filter)
+    if not res:
+        print(conditions)
+        return False
+
+    if args.offline:
+        iterate = functools.partial(tnglib.iter_mirror, collection,
+                                    db=args.mirror)
+        fields = tnglib.MIRROR_FILTERS[collection]
+
+    params = tnglib.filter_params(conditions, fields)
+    if params:
+        LOG.debug("Filtering on the gatekeeper with " + str(params))
+
+    records = iterate(callback=sys.stdout.flush, params=params)
+    records = tnglib.query_records(records,
+                                   conditions,
+                                   sort=args.sort,
+                                   columns=args.columns)
+    if args.columns:
+        order = [column.strip() for column in args.columns.split(',')
+                 if column.strip()]
+
+    return stream_print(records, order)
 
 
 def init_logger(verbose):
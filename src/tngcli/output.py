@@ -0,0 +1,386 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+"""Rendering of the CLI results as a table or machine-readable formats."""
+
+import csv
+import io
+import itertools
+import json
+import shutil
+import sys
+import time
+import yaml
+from datetime import datetime
+from tnglib.bench import BENCH_RENDER_ROWS, get_bench_requests
+
+FORMATS = ['table', 'json', 'jsonl', 'csv', 'yaml']
+
+DATE_KEYS = ['created_at', 'updated_at', 'violation_time', 'window_start',
+             'first', 'last']
+
+# Number of records the widths of the table columns are taken from
+TABLE_SAMPLE = 1000
+
+# Bounds of the width of a table column. Columns are only narrowed below
+# TABLE_MAX_WIDTH to fit the table in the terminal.
+TABLE_MAX_WIDTH = 40
+TABLE_MIN_WIDTH = 8
+
+TABLE_SEPARATOR = '  '
+
+# Number of table rows written to the stream at once
+TABLE_CHUNK = 500
+
+output_format = 'table'
+table_sample = TABLE_SAMPLE
+limit = None
+offset = 0
+
+# The libyaml based dumper is an order of magnitude faster, when available
+YAML_DUMPER = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+# Row format of the last table per list of columns, to continue it
+_row_formats = {}
+
+
+def set_output_format(output_format_in):
+    """Set the format results are printed in.
+
+    :param output_format_in: one of FORMATS
+    """
+
+    global output_format
+    output_format = output_format_in
+
+
+def set_paging(limit_in=None, offset_in=0):
+    """Set which part of a listing is printed.
+
+    :param limit_in: (Default value = None) maximum number of records. If
+        None, all records are printed.
+    :param offset_in: (Default value = 0) number of records to skip.
+    """
+
+    global limit
+    global offset
+    limit = limit_in
+    offset = offset_in
+
+
+def set_table_sample(table_sample_in):
+    """Set from how many records the widths of the table columns are
+    taken.
+
+    :param table_sample_in: number of records. If 0, all records are
+        read before the table is printed.
+    """
+
+    global table_sample
+    table_sample = table_sample_in
+
+
+def write_records(data, order=None, update=False, stream=None):
+    """Prints a result in the configured format.
+
+    data can be a list or any iterable of dictionaries, which is written
+    as it is consumed for all formats but yaml, a dictionary or a plain
+    value. Of an iterable only the records selected with set_paging are
+    written, and a generator isn't consumed beyond them. The table format
+    only shows the columns in order, the other formats show complete
+    records.
+
+    :param data: the result to print.
+    :param order: (Default value = None) columns of the table.
+    :param update: (Default value = False) the table rows continue a
+        previous call, so no header is printed.
+    :param stream: (Default value = None) where to write, sys.stdout if
+        None.
+    """
+
+    stream = stream or sys.stdout
+
+    if isinstance(data, (str, bytes, int, float, bool)) or data is None:
+        if output_format in ['json', 'jsonl']:
+            stream.write(json.dumps(data) + '\n')
+        else:
+            stream.write(str(data) + '\n')
+        return
+
+    if isinstance(data, dict):
+        if output_format == 'table':
+            stream.write('\n' + yaml.dump(data, default_flow_style=False) +
+                         '\n')
+        elif output_format == 'yaml':
+            stream.write(yaml.dump(data, Dumper=YAML_DUMPER,
+                               default_flow_style=False))
+        else:
+            _WRITERS[output_format]([data], order, update, stream)
+        return
+
+    if offset or limit is not None:
+        stop = None if limit is None else offset + limit
+        data = itertools.islice(data, offset, stop)
+
+    _WRITERS[output_format](data, order, update, stream)
+
+
+def _write_table(records, order, update, stream):
+    """ Aligned columns, one row per record. The column widths are taken
+    from the first table_sample records, which are held back until the
+    widths are known, and the rows are written in chunks. """
+
+    records = iter(records)
+    if table_sample:
+        sample = list(itertools.islice(records, table_sample))
+    else:
+        sample = list(records)
+
+    if order is None:
+        if not sample:
+            return
+        order = list(sample[0].keys())
+
+    dates = set(key for key in order if key in DATE_KEYS)
+    titles = [key.replace('_', ' ').upper() for key in order]
+
+    row_format = _row_formats.get(tuple(order)) if update else None
+    if row_format is None:
+        rows = [_table_cells(record, order, dates) for record in sample]
+        widths = _column_widths(rows, titles)
+        if stream.isatty():
+            keep = [pos for pos, key in enumerate(order) if 'uuid' in key]
+            widths = _fit_widths(widths,
+                                 shutil.get_terminal_size().columns, keep)
+        row_format = _row_format(widths)
+        _row_formats[tuple(order)] = row_format
+    else:
+        rows = None
+
+    lines = []
+    if not update:
+        lines.append(row_format.format(*titles))
+
+    if rows is not None:
+        for cells in rows:
+            lines.append(row_format.format(*cells))
+    else:
+        records = itertools.chain(sample, records)
+
+    for record in records:
+        lines.append(row_format.format(*_table_cells(record, order, dates)))
+        if len(lines) >= TABLE_CHUNK:
+            stream.write('\n'.join(lines) + '\n')
+            lines = []
+
+    if lines:
+        stream.write('\n'.join(lines) + '\n')
+
+
+def _table_cells(record, order, dates):
+    """ Texts of the cells of a record. """
+
+    cells = []
+    for key in order:
+        value = record.get(key)
+        if value is None:
+            cells.append('')
+        elif key in dates:
+            cells.append(str(value)[:16].replace('T', ' '))
+        elif isinstance(value, str):
+            cells.append(value)
+        else:
+            cells.append(str(value))
+
+    return cells
+
+
+def _column_widths(rows, titles):
+    """ Width of every column, from its title and its cells. """
+
+    widths = [len(title) for title in titles]
+    for cells in rows:
+        widths = [max(width, len(cell)) for width, cell in zip(widths, cells)]
+
+    return [min(width, TABLE_MAX_WIDTH) for width in widths]
+
+
+def _fit_widths(widths, columns, keep=()):
+    """ Narrows the widest columns until the table fits in columns
+    characters, or all are TABLE_MIN_WIDTH wide. The columns at the
+    positions in keep are only narrowed when the others can't be. """
+
+    widths = list(widths)
+    excess = sum(widths) + len(TABLE_SEPARATOR) * (len(widths) - 1) - columns
+
+    for candidates in [[pos for pos in range(len(widths))
+                        if pos not in keep],
+                       list(range(len(widths)))]:
+        while excess > 0 and candidates:
+            widest = max(candidates, key=lambda pos: widths[pos])
+            if widths[widest] <= TABLE_MIN_WIDTH:
+                break
+            widths[widest] = widths[widest] - 1
+            excess = excess - 1
+
+    return widths
+
+
+def _row_format(widths):
+    """ Format string of a table row. Longer cells are cut off, the last
+    column isn't padded. """
+
+    fields = ['{:<%d.%d}' % (width, width) for width in widths[:-1]]
+    if widths:
+        fields.append('{:.%d}' % widths[-1])
+
+    return TABLE_SEPARATOR.join(fields)
+
+
+def _write_json(records, order, update, stream):
+    """ A json array, written record by record. The array is closed
+    also when reading the records fails. """
+
+    stream.write('[')
+    first = True
+    try:
+        for record in records:
+            if not first:
+                stream.write(',')
+            stream.write('\n    ' + json.dumps(record, default=str))
+            first = False
+    finally:
+        stream.write('\n]\n' if not first else ']\n')
+
+
+def _write_jsonl(records, order, update, stream):
+    """ One json document per line. """
+
+    for record in records:
+        stream.write(json.dumps(record, default=str) + '\n')
+
+
+def _write_csv(records, order, update, stream):
+    """ Comma separated values, nested values as json. The columns are
+    those in order followed by the other keys of the first record. """
+
+    writer = None
+    for record in records:
+        if writer is None:
+            fields = list(order or [])
+            fields = fields + [key for key in record if key not in fields]
+            writer = csv.DictWriter(stream, fields, extrasaction='ignore',
+                                    lineterminator='\n')
+            if not update:
+                writer.writeheader()
+        writer.writerow(dict((key, _csv_value(record.get(key)))
+                             for key in writer.fieldnames))
+
+
+def _csv_value(value):
+    """ Value of a csv cell. """
+
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+
+    return value
+
+
+def _write_yaml(records, order, update, stream):
+    """ A yaml list, which needs all records first. """
+
+    stream.write(yaml.dump(list(records), Dumper=YAML_DUMPER,
+                           default_flow_style=False))
+
+
+def bench_render(rows=BENCH_RENDER_ROWS, repeat=3, report=None,
+                 callback=None):
+    """Measures how fast every format renders a listing of requests.
+
+    The records come from get_bench_requests and are rendered into
+    memory, so the terminal isn't part of the measurement.
+
+    :param rows: (Default value = BENCH_RENDER_ROWS) number of records.
+    :param repeat: (Default value = 3) number of timed renders per format.
+    :param report: (Default value = None) path of a json file to write
+        the report to.
+    :param callback: (Default value = None) callable that is invoked with
+        the name and statistics of every format.
+
+    :returns: the report, with per format the rows per second as
+        'throughput', the seconds per render as 'mean' and the CPU time
+        per render.
+    """
+
+    order = ['request_uuid', 'request_type', 'status', 'created_at',
+             'instance_uuid']
+    records = get_bench_requests(rows)
+
+    operations = {}
+    for fmt in FORMATS:
+        seconds = 0.0
+        cpu = 0.0
+        for _ in range(repeat):
+            start_cpu = time.process_time()
+            start = time.perf_counter()
+            _WRITERS[fmt](iter(records), order, False, io.StringIO())
+            seconds = seconds + time.perf_counter() - start
+            cpu = cpu + time.process_time() - start_cpu
+        stats = {'calls': repeat,
+                 'rows': rows,
+                 'throughput': round(rows * repeat / seconds, 1)
+                 if seconds else None,
+                 'mean': round(seconds / max(repeat, 1), 6),
+                 'cpu': round(cpu / max(repeat, 1), 6)}
+        operations['render ' + fmt] = stats
+        if callback:
+            callback('render ' + fmt, stats)
+
+    bench_report = {
+        'benchmark': 'render',
+        'started_at': datetime.utcnow().isoformat(),
+        'config': {'rows': rows,
+                   'repeat': repeat},
+        'operations': operations}
+
+    if report:
+        with open(report, 'w') as report_file:
+            json.dump(bench_report, report_file, indent=4, sort_keys=True)
+
+    return bench_report
+
+
+_WRITERS = {'table': _write_table,
+            'json': _write_json,
+            'jsonl': _write_jsonl,
+            'csv': _write_csv,
+            'yaml': _write_yaml}
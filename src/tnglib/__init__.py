@@ -32,13 +32,16 @@
 
 from tnglib.packages import *
 from tnglib.slas import *
+from tnglib.violations import *
 from tnglib.general import *
 from tnglib.services import *
 from tnglib.functions import *
 from tnglib.policies import *
+from tnglib.timings import *
 from tnglib.requests import *
 from tnglib.slices import *
 from tnglib.logs import *
+from tnglib.logindex import *
 from tnglib.tests import *
 from tnglib.records import *
 from tnglib.env import *
@@ -48,5 +51,12 @@ from tnglib.monitor import *
 from tnglib.infrastructure import *
 from tnglib.recommendations import *
 from tnglib.analytics_engine import *
+from tnglib.export import *
+from tnglib.mock_sp import *
+from tnglib.traffic import *
+from tnglib.bench import *
+from tnglib.query import *
+from tnglib.mirror import *
+from tnglib.graph import *
 
 set_sp_path('localhost')
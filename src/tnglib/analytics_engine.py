@@ -33,10 +33,18 @@
 import requests
 import logging
 import json
+import time
 import tnglib.env as env
+from tnglib import helpers
 
 LOG = logging.getLogger(__name__)
 
+# Seconds between two listings of the analytic results
+ANALYTICS_POLL_INTERVAL = 10
+
+# Seconds analyze_test_results waits for the analytic results
+ANALYTICS_TIMEOUT = 1800
+
 
 def get_analytic_services():
     """Returns a json array with all available analytic services.
@@ -106,4 +114,132 @@ def get_analytic_results():
     return True, len(json.loads(resp.text))
 
 
+def analyze_test_results(testr_uuids, service_name,
+                         workers=None, rate=None,
+                         interval=ANALYTICS_POLL_INTERVAL,
+                         timeout=ANALYTICS_TIMEOUT, callback=None):
+    """Runs an analytic service on many test results and collects the
+    analytic results.
+
+    The analytic processes are invoked with bounded parallelism. The
+    analytic results are then listed once per interval, however many
+    processes are still running, and matched to the test results by their
+    testr_uuid. Results that exist before the invocations are ignored.
+
+    :param testr_uuids: list of test result uuids.
+    :param service_name: name of the analytic service.
+    :param workers: (Default value = None) number of parallel
+        invocations, env.max_workers if None.
+    :param rate: (Default value = None) maximum number of invocations per
+        second.
+    :param interval: (Default value = ANALYTICS_POLL_INTERVAL) seconds
+        between two listings of the analytic results.
+    :param timeout: (Default value = ANALYTICS_TIMEOUT) seconds to wait for
+        the analytic results. If None, wait until all arrived.
+    :param callback: (Default value = None) callable that is invoked with
+        the entry of every test result as soon as its outcome is known,
+        always from the calling thread.
+
+    :returns: A tuple. [0] is a bool, True if all analytic results
+        arrived. [1] is a list of dictionaries, one per test result, with
+        'testr_uuid', 'service_name', 'status' ('COMPLETED', 'NOT_INVOKED'
+        or 'TIMEOUT'), 'result_uuid' and the analytic 'result', or an
+        error message.
+    """
 
+    res, before = _list_analytic_results()
+    if not res:
+        return False, before
+
+    known = set(_result_key(result) for result in before)
+    start = time.time()
+
+    entries = {}
+    for testr_uuid in testr_uuids:
+        entries.setdefault(testr_uuid, {'testr_uuid': testr_uuid,
+                                        'service_name': service_name,
+                                        'status': None,
+                                        'result_uuid': None,
+                                        'result': None})
+
+    def invoke(testr_uuid):
+        return invoke_analytic_process(testr_uuid, service_name)
+
+    invocations = helpers.bulk_call(invoke,
+                                    [(testr_uuid,) for testr_uuid in entries],
+                                    workers=workers, rate=rate)
+
+    for entry, ok in zip(entries.values(), invocations):
+        if ok is not True:
+            entry['status'] = 'NOT_INVOKED'
+            if isinstance(ok, tuple):
+                entry['result'] = ok[1]
+            if callback:
+                callback(entry)
+
+    pending = set(testr_uuid for testr_uuid, entry in entries.items()
+                  if entry['status'] is None)
+    LOG.debug("Invoked " + service_name + " on " + str(len(pending)) +
+              " of " + str(len(entries)) + " test results")
+
+    while pending:
+        res, results = _list_analytic_results()
+        if not res:
+            LOG.debug("Listing analytic results failed: " + str(results))
+            results = []
+
+        for result in results:
+            key = _result_key(result)
+            if key in known:
+                continue
+            known.add(key)
+            testr_uuid = result.get('testr_uuid')
+            if testr_uuid not in pending:
+                continue
+            pending.discard(testr_uuid)
+            entry = entries[testr_uuid]
+            entry['status'] = 'COMPLETED'
+            entry['result_uuid'] = result.get('id', result.get('uuid'))
+            entry['result'] = result
+            if callback:
+                callback(entry)
+
+        if not pending:
+            break
+
+        if timeout is not None and time.time() - start + interval > timeout:
+            break
+
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            break
+
+    for testr_uuid in pending:
+        entries[testr_uuid]['status'] = 'TIMEOUT'
+        if callback:
+            callback(entries[testr_uuid])
+
+    dataset = list(entries.values())
+    completed = all(entry['status'] == 'COMPLETED' for entry in dataset)
+
+    return completed, dataset
+
+
+def _list_analytic_results():
+    """ All analytic results, as a (bool, list or error) tuple. """
+
+    try:
+        return helpers.get_paged(env.analytics_engine_api + '/results/list')
+    except requests.exceptions.RequestException as e:
+        return False, str(e)
+
+
+def _result_key(result):
+    """ Identifies an analytic result, also when it has no id. """
+
+    key = result.get('id', result.get('uuid'))
+    if key is None:
+        key = json.dumps(result, sort_keys=True)
+
+    return key
@@ -0,0 +1,421 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+import tnglib.env as env
+from tnglib import helpers
+from tnglib.mock_sp import MockServicePlatform, mock_uuid
+from tnglib.packages import get_packages, get_package
+from tnglib.services import get_service_descriptors, \
+    get_service_descriptor, get_service_instances, get_service_instance
+from tnglib.functions import get_function_descriptors, \
+    get_function_instances
+from tnglib.slas import get_sla_templates, get_sla_template, \
+    get_agreements, get_violations, get_sla_guarantees
+from tnglib.monitor import get_metric, get_vnv_tests
+from tnglib.requests import service_instantiate, service_terminate, \
+    service_scale_in, service_scale_out, wait_for_request, get_requests, \
+    get_request, FINAL_STATUSES
+
+LOG = logging.getLogger(__name__)
+
+# Seconds between two status polls of a benchmarked request
+BENCH_POLL_INTERVAL = 2
+
+BENCH_PERCENTILES = [50, 90, 95, 99]
+
+# Number of timed calls per function of the read benchmark
+BENCH_READ_REPEAT = 20
+
+# Number of records rendered by the render benchmark
+BENCH_RENDER_ROWS = 50000
+
+
+def bench_lifecycle(service_uuid, cycles=10, concurrency=4, rate=None,
+                    vnfd_uuid=None, interval=BENCH_POLL_INTERVAL,
+                    timeout=None, report=None, callback=None):
+    """Runs instantiate, scale and terminate cycles of a service against
+    the SP and measures their latency and throughput.
+
+    Every cycle instantiates the service, scales it out and back in when
+    vnfd_uuid is given, and terminates it. Up to concurrency cycles run at
+    the same time, and new cycles start at most rate times per second.
+    The load is closed-loop: a cycle only starts when one of the
+    concurrency slots is free, so rate is an upper bound on the arrival
+    rate, not a fixed one. Raise concurrency to sustain rate against a
+    slow SP. The latency of an operation runs from its submission until
+    the request is READY or ERROR. A cycle stops at its first failing
+    operation, but always terminates what it instantiated. When the
+    instantiation times out, its request is followed for another timeout
+    and the instance is terminated once it appears. Requests that still
+    have no instance then are listed as 'leaked' in the report.
+
+    :param service_uuid: uuid of the service to instantiate.
+    :param cycles: (Default value = 10) number of cycles.
+    :param concurrency: (Default value = 4) number of cycles in flight.
+    :param rate: (Default value = None) maximum number of cycles started
+        per second. If None, cycles start as soon as a slot is free.
+    :param vnfd_uuid: (Default value = None) uuid of the vnf descriptor to
+        scale. If None, cycles don't scale.
+    :param interval: (Default value = BENCH_POLL_INTERVAL) seconds between
+        two status polls.
+    :param timeout: (Default value = None) seconds after which an
+        operation counts as failed.
+    :param report: (Default value = None) path of a json file to write
+        the report to.
+    :param callback: (Default value = None) callable that is invoked as
+        callback(cycle, operation, ok, seconds) after every operation.
+
+    :returns: A tuple. [0] is a bool, True if all cycles succeeded. [1] is
+        the report, a dictionary with the configuration, the duration,
+        the overall throughput, per operation the number of calls,
+        failures, throughput and latency percentiles, and the requests
+        whose instance could not be terminated.
+    """
+
+    samples = []
+    leaked = []
+    lock = threading.Lock()
+
+    def measure(cycle, operation, func, *args):
+        start = time.time()
+        res, request_uuid = func(*args)
+        request = request_uuid
+        submitted = request_uuid if res else None
+        if res:
+            res, request = wait_for_request(request_uuid, interval,
+                                                      timeout)
+        seconds = time.time() - start
+        with lock:
+            samples.append((operation, res, seconds,
+                            None if res else str(request)))
+        if callback:
+            callback(cycle, operation, res, seconds)
+        return res, request, submitted
+
+    def recover(request_uuid):
+        # the request outlived the timeout, it may still bring up an
+        # instance that has to be terminated
+        res, request = wait_for_request(request_uuid, interval, timeout)
+        if not isinstance(request, dict):
+            res, request = get_request(request_uuid)
+        if isinstance(request, dict) and request.get('instance_uuid'):
+            return request
+        if not isinstance(request, dict) or \
+                request.get('status') not in FINAL_STATUSES:
+            with lock:
+                leaked.append(request_uuid)
+            LOG.debug("No instance to terminate for request " +
+                      request_uuid)
+        return None
+
+    def cycle(number):
+        res, request, request_uuid = measure(number, 'instantiate',
+                                             service_instantiate,
+                                             service_uuid)
+        if request_uuid and not isinstance(request, dict):
+            request = recover(request_uuid) or request
+        if not isinstance(request, dict) or \
+                not request.get('instance_uuid'):
+            return False, request
+        instance_uuid = request['instance_uuid']
+
+        ok = res
+        if ok and vnfd_uuid:
+            ok, mes, _ = measure(number, 'scale_out',
+                                 service_scale_out, instance_uuid,
+                                 vnfd_uuid)
+            if ok:
+                ok, mes, _ = measure(number, 'scale_in',
+                                     service_scale_in, instance_uuid,
+                                     None, vnfd_uuid)
+
+        res, mes, _ = measure(number, 'terminate', service_terminate,
+                              instance_uuid)
+
+        return ok and res, instance_uuid
+
+    started = time.time()
+    results = helpers.bulk_call(cycle, [(number,) for number in range(cycles)],
+                                concurrency, rate)
+    finished = time.time()
+
+    completed = len([result for result in results if result[0]])
+
+    bench_report = {
+        'benchmark': 'lifecycle',
+        'sp': env.get_sp_path(),
+        'started_at': datetime.utcfromtimestamp(started).isoformat(),
+        'config': {'service_uuid': service_uuid,
+                   'vnfd_uuid': vnfd_uuid,
+                   'cycles': cycles,
+                   'concurrency': concurrency,
+                   'rate': rate,
+                   'interval': interval,
+                   'timeout': timeout},
+        'duration': round(finished - started, 3),
+        'cycles': {'completed': completed,
+                   'failed': cycles - completed,
+                   'throughput': _throughput(completed, finished - started)},
+        'operations': _summarize(samples, finished - started),
+        'errors': [{'operation': sample[0], 'error': sample[3]}
+                   for sample in samples if not sample[1]],
+        'leaked': leaked}
+
+    if report:
+        with open(report, 'w') as report_file:
+            json.dump(bench_report, report_file, indent=4, sort_keys=True)
+        LOG.debug("Benchmark report written to " + report)
+
+    return completed == cycles, bench_report
+
+
+def bench_read(sizes=None, latency=0, repeat=BENCH_READ_REPEAT,
+               extra=None, report=None, callback=None):
+    """Benchmarks the listing and detail functions against a local mock
+    of the SP.
+
+    A MockServicePlatform serves synthetic records in a separate process.
+    Every function is called once to warm up, then repeat times to
+    measure its latency and CPU time, and once more under tracemalloc to
+    measure the peak memory it allocates.
+
+    :param sizes: (Default value = None) number of records per
+        collection, see MOCK_SIZES.
+    :param latency: (Default value = 0) seconds the mock adds to every
+        response.
+    :param repeat: (Default value = BENCH_READ_REPEAT) number of timed
+        calls per function.
+    :param extra: (Default value = None) dictionary of additional
+        callables to benchmark, by name. They are called without arguments
+        while the mock is running, e.g. to measure rendering.
+    :param report: (Default value = None) path of a json file to write
+        the report to.
+    :param callback: (Default value = None) callable that is invoked with
+        the name and statistics of every benchmarked function.
+
+    :returns: A tuple. [0] is a bool, True if all calls succeeded. [1] is
+        the report, with per function the latency percentiles, the
+        throughput, the CPU time per call and the peak memory.
+    """
+
+    calls = [('get_packages', get_packages, ()),
+             ('get_package', get_package, (mock_uuid('packages', 0),)),
+             ('get_service_descriptors', get_service_descriptors, ()),
+             ('get_service_descriptor', get_service_descriptor,
+              (mock_uuid('services', 0),)),
+             ('get_service_instances', get_service_instances, ()),
+             ('get_service_instance', get_service_instance,
+              (mock_uuid('service_instances', 0),)),
+             ('get_function_descriptors', get_function_descriptors, ()),
+             ('get_function_instances', get_function_instances, ()),
+             ('get_requests', get_requests, ()),
+             ('get_request', get_request, (mock_uuid('requests', 0),)),
+             ('get_sla_templates', get_sla_templates, ()),
+             ('get_sla_template', get_sla_template,
+              (mock_uuid('sla_templates', 0),)),
+             ('get_agreements', get_agreements, ()),
+             ('get_violations', get_violations, ()),
+             ('get_sla_guarantees', get_sla_guarantees, ()),
+             ('get_metric', get_metric, ('metric-0',)),
+             ('get_vnv_tests', get_vnv_tests, (None,))]
+
+    for name, func in sorted((extra or {}).items()):
+        calls.append((name, func, ()))
+
+    functions = {}
+    ok = True
+    with MockServicePlatform(sizes, latency) as mock:
+        for name, func, args in calls:
+            stats = _bench_call(func, args, repeat)
+            ok = ok and stats['ok']
+            functions[name] = stats
+            if callback:
+                callback(name, stats)
+        sizes = mock.sizes
+
+    bench_report = {
+        'benchmark': 'read',
+        'started_at': datetime.utcnow().isoformat(),
+        'config': {'sizes': sizes,
+                   'latency': latency,
+                   'repeat': repeat},
+        'operations': functions}
+
+    if report:
+        with open(report, 'w') as report_file:
+            json.dump(bench_report, report_file, indent=4, sort_keys=True)
+        LOG.debug("Benchmark report written to " + report)
+
+    return ok, bench_report
+
+
+def get_bench_requests(rows=BENCH_RENDER_ROWS):
+    """Builds synthetic request summaries, e.g. to benchmark rendering.
+
+    :param rows: (Default value = BENCH_RENDER_ROWS) number of records.
+
+    :returns: a list of dictionaries shaped like the records of
+        iter_requests, every tenth one in ERROR.
+    """
+
+    records = []
+    for pos in range(rows):
+        records.append({'request_uuid': mock_uuid('requests', pos),
+                        'request_type': 'CREATE_SERVICE',
+                        'status': 'READY' if pos % 10 else 'ERROR',
+                        'created_at': '2019-05-01T12:00:00.000+00:00',
+                        'instance_uuid': mock_uuid('service_instances', pos),
+                        'error': None if pos % 10 else 'Timeout'})
+
+    return records
+
+
+def _bench_call(func, args, repeat):
+    """ Latency, CPU time and peak memory of repeated calls to func. """
+
+    result = func(*args)
+    ok = not (isinstance(result, tuple) and result and result[0] is False)
+
+    latencies = []
+    cpu = 0.0
+    for _ in range(repeat):
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - start)
+        cpu = cpu + time.process_time() - start_cpu
+    latencies.sort()
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    stats = {'ok': ok,
+             'calls': repeat,
+             'throughput': _throughput(repeat, sum(latencies)),
+             'mean': round(sum(latencies) / max(repeat, 1), 6),
+             'max': round(latencies[-1], 6) if latencies else None,
+             'cpu': round(cpu / max(repeat, 1), 6),
+             'memory': peak}
+    for percent in BENCH_PERCENTILES:
+        value = helpers.percentile(latencies, percent)
+        stats['p' + str(percent)] = None if value is None else \
+            round(value, 6)
+
+    return stats
+
+
+def compare_bench_reports(base, new):
+    """Compares the operation latencies of two benchmark reports.
+
+    :param base: path of the reference report, or the report itself.
+    :param new: path of the report to compare, or the report itself.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        dictionaries with, per operation and statistic, the 'base' and
+        'new' value and the relative 'change' in percent.
+    """
+
+    reports = []
+    for report in [base, new]:
+        if not isinstance(report, dict):
+            try:
+                with open(report, 'r') as report_file:
+                    report = json.load(report_file)
+            except (IOError, ValueError) as e:
+                return False, "Can't read report: " + str(e)
+        reports.append(report.get('operations', {}))
+
+    stats = ['throughput', 'mean'] + ['p' + str(percent)
+                                      for percent in BENCH_PERCENTILES] + \
+        ['cpu', 'memory']
+
+    rows = []
+    for operation in sorted(set(reports[0]) | set(reports[1])):
+        for stat in stats:
+            old_value = reports[0].get(operation, {}).get(stat)
+            new_value = reports[1].get(operation, {}).get(stat)
+            if old_value is None and new_value is None:
+                continue
+            change = None
+            if old_value and new_value is not None:
+                change = round((new_value - old_value) / old_value * 100, 1)
+            rows.append({'operation': operation,
+                         'statistic': stat,
+                         'base': old_value,
+                         'new': new_value,
+                         'change': change})
+
+    return True, rows
+
+
+def _summarize(samples, duration):
+    """ Latency and throughput statistics per operation. """
+
+    summary = {}
+    for operation in sorted(set(sample[0] for sample in samples)):
+        latencies = sorted(sample[2] for sample in samples
+                           if sample[0] == operation and sample[1])
+        calls = len([sample for sample in samples if sample[0] == operation])
+        stats = {'calls': calls,
+                 'failed': calls - len(latencies),
+                 'throughput': _throughput(len(latencies), duration),
+                 'mean': None,
+                 'max': None}
+        if latencies:
+            stats['mean'] = round(sum(latencies) / len(latencies), 3)
+            stats['max'] = round(latencies[-1], 3)
+        for percent in BENCH_PERCENTILES:
+            value = helpers.percentile(latencies, percent)
+            stats['p' + str(percent)] = None if value is None else \
+                round(value, 3)
+        summary[operation] = stats
+
+    return summary
+
+
+def _throughput(count, duration):
+    """ Operations per second. """
+
+    if duration <= 0:
+        return None
+
+    return round(count / duration, 3)
@@ -32,6 +32,12 @@
 
 # Commons
 timeout = 15.0
+max_workers = 8
+
+# Ports of the SP components
+gtk_port = 32002
+monitoring_port = 8000
+analytics_port = 8085
 
 # Building all paths for global use
 sp_path = ''
@@ -101,6 +107,15 @@ def set_timeout(timeout_in):
     global timeout
     timeout = timeout_in
 
+def set_max_workers(max_workers_in):
+    """Set the number of requests that bulk operations run in parallel.
+
+    :param max_workers_in: new number of parallel requests
+    """
+
+    global max_workers
+    max_workers = max(1, int(max_workers_in))
+
 def set_sp_path(new_base_path):
     """Set the path were the SP can be reached.
 
@@ -111,6 +126,30 @@ def set_sp_path(new_base_path):
     sp_path = new_base_path
     _build_paths()
 
+def set_ports(gtk_port_in=None, monitoring_port_in=None,
+              analytics_port_in=None):
+    """Set the ports on which the SP components are reached.
+
+    :param gtk_port_in: (Default value = None) port of the gatekeeper.
+    :param monitoring_port_in: (Default value = None) port of the
+        monitoring manager.
+    :param analytics_port_in: (Default value = None) port of the
+        analytics engine.
+    """
+
+    global gtk_port
+    global monitoring_port
+    global analytics_port
+
+    if gtk_port_in:
+        gtk_port = int(gtk_port_in)
+    if monitoring_port_in:
+        monitoring_port = int(monitoring_port_in)
+    if analytics_port_in:
+        analytics_port = int(analytics_port_in)
+
+    _build_paths()
+
 def add_token_to_header(token):
     """Set the header for all requests with the token.
 
@@ -150,7 +189,7 @@ def _build_paths():
     global recommendations_api
     global analytics_engine_api
 
-    gtk_api = ":32002/api/v3"
+    gtk_api = ":" + str(gtk_port) + "/api/v3"
     root_api = sp_path + gtk_api
     user_api = sp_path + gtk_api + '/users'
     session_api = sp_path + gtk_api + "/users/sessions"
@@ -173,7 +212,7 @@ def _build_paths():
     test_results_api = sp_path + gtk_api + "/tests/results"
     test_plans_api = sp_path + gtk_api + "/tests/plans"
     test_descriptors_api = sp_path + gtk_api + "/tests/descriptors"
-    monitoring_manager_api = sp_path + ":8000/api/v2"
+    monitoring_manager_api = sp_path + ":" + str(monitoring_port) + "/api/v2"
     monitor_api = sp_path + gtk_api + "/monitoring/data"
     recommendations_api = sp_path + gtk_api + "/recommendations"
-    analytics_engine_api = sp_path + ":8085"
+    analytics_engine_api = sp_path + ":" + str(analytics_port)
@@ -0,0 +1,422 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+import gzip
+import logging
+import json
+import os
+import uuid
+from concurrent import futures
+from datetime import datetime
+import tnglib.env as env
+from tnglib import helpers
+from tnglib import monitor
+from tnglib import slas
+from tnglib.results import iter_test_results, get_test_result
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+LOG = logging.getLogger(__name__)
+
+# Number of rows that are buffered before a row group is written
+EXPORT_CHUNK_SIZE = 10000
+
+# Number of test results per part file of an archive
+ARCHIVE_CHUNK_SIZE = 500
+
+ARCHIVE_FORMATS = ['jsonl', 'parquet']
+
+ARCHIVE_MANIFEST = 'manifest.jsonl'
+
+_ARCHIVE_SCHEMA = [('uuid', 'string'),
+                   ('instance_uuid', 'string'),
+                   ('service_uuid', 'string'),
+                   ('package_id', 'string'),
+                   ('test_uuid', 'string'),
+                   ('status', 'string'),
+                   ('started_at', 'string'),
+                   ('ended_at', 'string'),
+                   ('created_at', 'string'),
+                   ('result', 'string')]
+
+
+def export_metric(metric_name, path, chunk_size=EXPORT_CHUNK_SIZE):
+    """Exports the series of a metric to a columnar file.
+
+    The file format is derived from the extension of path: '.arrow' or
+    '.feather' results in an Arrow IPC file, anything else in Parquet.
+
+    :param metric_name: name of the metric.
+    :param path: path of the file to create.
+    :param chunk_size: (Default value = EXPORT_CHUNK_SIZE) number of rows
+        per row group.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the number of
+        exported rows, or an error message.
+    """
+
+    res, results = monitor._get_metric_results(metric_name)
+    if not res:
+        return False, results
+
+    def rows():
+        for result in results:
+            labels = result.get('metric', {})
+            if 'values' in result:
+                samples = result['values']
+            else:
+                samples = [result['value']]
+            for sample in samples:
+                yield {'metric_name': metric_name,
+                       'job': labels.get('job'),
+                       'instance': labels.get('instance'),
+                       'timestamp': int(float(sample[0]) * 1000),
+                       'value': float(sample[1]),
+                       'labels': json.dumps(labels, sort_keys=True)}
+
+    schema = [('metric_name', 'string'),
+              ('job', 'string'),
+              ('instance', 'string'),
+              ('timestamp', 'timestamp'),
+              ('value', 'float64'),
+              ('labels', 'string')]
+
+    return _write_rows(path, schema, rows(), chunk_size)
+
+
+def export_vnv_tests(path, service_uuid=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Exports the stored passive monitoring tests to a columnar file.
+
+    The 'data' field of each test is stored as a JSON string.
+
+    :param path: path of the file to create.
+    :param service_uuid: (Default value = None) uuid of a network service
+        record. If None, all stored tests are exported.
+    :param chunk_size: (Default value = EXPORT_CHUNK_SIZE) number of rows
+        per row group.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the number of
+        exported rows, or an error message.
+    """
+
+    res, tests = monitor.get_vnv_tests(service_uuid)
+    if not res:
+        return False, tests
+
+    def rows():
+        for test in tests:
+            data = None
+            if 'data' in test:
+                data = json.dumps(test['data'])
+            yield {'test_uuid': test['test_uuid'],
+                   'srv_uuid': test['srv_uuid'],
+                   'started': test['started'],
+                   'terminated': test['terminated'],
+                   'data': data}
+
+    schema = [('test_uuid', 'string'),
+              ('srv_uuid', 'string'),
+              ('started', 'string'),
+              ('terminated', 'string'),
+              ('data', 'string')]
+
+    return _write_rows(path, schema, rows(), chunk_size)
+
+
+def export_violations(path, nsi_uuid=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Exports SLA violations to a columnar file.
+
+    The complete violation is kept as a JSON string in the 'raw' column.
+
+    :param path: path of the file to create.
+    :param nsi_uuid: (Default value = None) uuid of a service instance. If
+        None, all violations are exported.
+    :param chunk_size: (Default value = EXPORT_CHUNK_SIZE) number of rows
+        per row group.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the number of
+        exported rows, or an error message.
+    """
+
+    res, violations = slas.get_violations(nsi_uuid)
+    if not res:
+        return False, violations
+
+    def rows():
+        for violation in violations:
+            yield {'sla_uuid': violation.get('sla_uuid'),
+                   'nsi_uuid': violation.get('nsi_uuid'),
+                   'violation_time': violation.get('violation_time'),
+                   'alert_state': violation.get('alert_state'),
+                   'raw': json.dumps(violation)}
+
+    schema = [('sla_uuid', 'string'),
+              ('nsi_uuid', 'string'),
+              ('violation_time', 'string'),
+              ('alert_state', 'string'),
+              ('raw', 'string')]
+
+    return _write_rows(path, schema, rows(), chunk_size)
+
+
+def archive_test_results(directory, fmt='jsonl', workers=None,
+                         chunk_size=ARCHIVE_CHUNK_SIZE, callback=None):
+    """Downloads the detailed test results into a local archive.
+
+    The results are listed page by page, and the details of those that
+    aren't archived yet are fetched in parallel. Every chunk_size results
+    are written to a new part file, gzip compressed JSON lines or
+    Parquet, which is moved into place when complete. Only then are its
+    results added to the manifest of the archive. An interrupted archival
+    therefore resumes where it stopped, and results that failed to
+    download are retried by the next run.
+
+    :param directory: directory of the archive, created if needed.
+    :param fmt: (Default value = 'jsonl') 'jsonl' or 'parquet'. Parquet
+        requires pyarrow and stores the details as a JSON string.
+    :param workers: (Default value = None) number of parallel downloads,
+        env.max_workers if None.
+    :param chunk_size: (Default value = ARCHIVE_CHUNK_SIZE) number of
+        results per part file.
+    :param callback: (Default value = None) callable that is invoked as
+        callback(uuid, ok) after every download.
+
+    :returns: A tuple. [0] is a bool, True if all results are archived.
+        [1] is a dictionary with the number of 'archived', 'skipped' and
+        'failed' results and the new 'parts', or an error message.
+    """
+
+    if fmt not in ARCHIVE_FORMATS:
+        return False, "Unsupported format: " + str(fmt)
+
+    if fmt == 'parquet' and pyarrow is None:
+        return False, "pyarrow is required to export columnar files"
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        archived = _read_manifest(directory)
+    except (IOError, OSError, ValueError) as e:
+        return False, "Can't open archive: " + str(e)
+
+    stats = {'archived': 0, 'skipped': 0, 'failed': 0, 'parts': 0}
+    run = datetime.utcnow().strftime('%Y%m%dT%H%M%S') + '-' + \
+        uuid.uuid4().hex[:8]
+    chunk = []
+    workers = workers or env.max_workers
+
+    def download(result_uuid):
+        try:
+            return get_test_result(result_uuid)
+        except ValueError as e:
+            return False, str(e)
+
+    def collect(future, result_uuid):
+        try:
+            res, result = future.result()
+        except Exception as e:
+            res, result = False, str(e)
+        if res:
+            chunk.append((result_uuid, result))
+        else:
+            LOG.debug("Can't download test result " + result_uuid + ": " +
+                      str(result))
+            stats['failed'] = stats['failed'] + 1
+        if callback:
+            callback(result_uuid, res)
+
+    error = None
+    pending = {}
+    try:
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for summary in iter_test_results():
+                result_uuid = summary['uuid']
+                if result_uuid in archived:
+                    stats['skipped'] = stats['skipped'] + 1
+                    continue
+                archived.add(result_uuid)
+
+                # bound the downloads in flight
+                if len(pending) >= workers * 2:
+                    done, _ = futures.wait(pending,
+                                           return_when=futures.FIRST_COMPLETED)
+                    for future in done:
+                        collect(future, pending.pop(future))
+
+                pending[executor.submit(download, result_uuid)] = \
+                    result_uuid
+
+                if len(chunk) >= chunk_size:
+                    _write_part(directory, run, stats, chunk, fmt)
+                    chunk = []
+    except helpers.RequestError as e:
+        LOG.debug("Listing test results failed: " + str(e))
+        error = e.text
+
+    # the executor waited for the downloads in flight, also after an error
+    for future in list(pending):
+        collect(future, pending.pop(future))
+
+    while chunk:
+        _write_part(directory, run, stats, chunk[:chunk_size], fmt)
+        chunk = chunk[chunk_size:]
+
+    if error is not None:
+        return False, error
+
+    LOG.debug("Archived " + str(stats['archived']) + " test results in " +
+              directory)
+
+    return stats['failed'] == 0, stats
+
+
+def _read_manifest(directory):
+    """ uuids of the results in the manifest of an archive. """
+
+    archived = set()
+    path = os.path.join(directory, ARCHIVE_MANIFEST)
+    if not os.path.exists(path):
+        return archived
+
+    with open(path, 'r') as manifest:
+        for line in manifest:
+            line = line.strip()
+            # the last line may be incomplete after a crash
+            try:
+                archived.add(json.loads(line)['uuid'])
+            except (ValueError, KeyError):
+                LOG.debug("Skipping manifest line: " + line)
+
+    return archived
+
+
+def _write_part(directory, run, stats, results, fmt):
+    """ Writes (result_uuid, result) tuples to a new part file of an
+    archive and adds them to the manifest, by the uuid they were listed
+    with. """
+
+    if not results:
+        return
+
+    stats['parts'] = stats['parts'] + 1
+    name = 'results-' + run + '-' + str(stats['parts']).zfill(4)
+    name = name + ('.parquet' if fmt == 'parquet' else '.jsonl.gz')
+    path = os.path.join(directory, name)
+    tmp_path = path + '.tmp'
+
+    if fmt == 'parquet':
+        rows = ({'uuid': result_uuid,
+                 'instance_uuid': result.get('instance_uuid'),
+                 'service_uuid': result.get('service_uuid'),
+                 'package_id': result.get('package_id'),
+                 'test_uuid': result.get('test_uuid'),
+                 'status': result.get('status'),
+                 'started_at': _text(result.get('started_at')),
+                 'ended_at': _text(result.get('ended_at')),
+                 'created_at': _text(result.get('created_at')),
+                 'result': json.dumps(result, sort_keys=True)}
+                for result_uuid, result in results)
+        _write_rows(tmp_path, _ARCHIVE_SCHEMA, rows, len(results))
+    else:
+        with gzip.open(tmp_path, 'wt') as part:
+            for result_uuid, result in results:
+                part.write(json.dumps(result, sort_keys=True) + '\n')
+
+    os.replace(tmp_path, path)
+
+    archived_at = datetime.utcnow().isoformat()
+    with open(os.path.join(directory, ARCHIVE_MANIFEST), 'a') as manifest:
+        for result_uuid, result in results:
+            manifest.write(json.dumps({'uuid': result_uuid,
+                                       'part': name,
+                                       'archived_at': archived_at}) + '\n')
+        manifest.flush()
+        os.fsync(manifest.fileno())
+
+    stats['archived'] = stats['archived'] + len(results)
+
+
+def _text(value):
+    """ value as a string, None stays None. """
+
+    return None if value is None else str(value)
+
+
+def _arrow_schema(schema):
+    """ Translates a list of (name, type) tuples into an Arrow schema. """
+
+    types = {'string': pyarrow.string(),
+             'float64': pyarrow.float64(),
+             'int64': pyarrow.int64(),
+             'timestamp': pyarrow.timestamp('ms', tz='UTC')}
+
+    return pyarrow.schema([(name, types[typ]) for name, typ in schema])
+
+
+def _write_rows(path, schema, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """ Writes an iterable of dictionaries to a Parquet or Arrow file,
+    one row group per chunk_size rows. """
+
+    if pyarrow is None:
+        return False, "pyarrow is required to export columnar files"
+
+    arrow_schema = _arrow_schema(schema)
+    ext = os.path.splitext(path)[1]
+
+    if ext in ['.arrow', '.feather']:
+        writer = pyarrow.ipc.new_file(path, arrow_schema)
+    else:
+        writer = pyarrow.parquet.ParquetWriter(path, arrow_schema)
+
+    count = 0
+    chunk = []
+    try:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                writer.write_table(pyarrow.Table.from_pylist(chunk,
+                                                             arrow_schema))
+                count = count + len(chunk)
+                chunk = []
+        if chunk:
+            writer.write_table(pyarrow.Table.from_pylist(chunk, arrow_schema))
+            count = count + len(chunk)
+    finally:
+        writer.close()
+
+    LOG.debug("Exported " + str(count) + " rows to " + path)
+
+    return True, count
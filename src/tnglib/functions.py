@@ -37,9 +37,15 @@ import time
 import os
 import yaml
 import tnglib.env as env
+from tnglib import helpers
 
 LOG = logging.getLogger(__name__)
 
+# Fields of the function instance summaries the gatekeeper filters on,
+# and their query parameter
+FUNCTION_INSTANCE_FILTERS = {'status': 'status',
+                             'version': 'version'}
+
 
 def get_function_descriptors():
     """Returns info on all available function descriptors.
@@ -124,16 +130,38 @@ def get_function_instances():
 
     functions_res = []
     for function in functions:
-        dic = {'instance_uuid': function['uuid'],
-               'status': function['status'],
-               'version': function['version'],
-               'created_at': function['created_at']}
+        dic = _format_function_instance(function)
         LOG.debug(str(dic))
         functions_res.append(dic)
 
     return True, functions_res
 
 
+def iter_function_instances(callback=None, params=None):
+    """Generator over all function instances, reading them page by page.
+
+    :param callback: (Default value = None) callable that is invoked after
+        each page, see helpers.iter_pages.
+    :param params: (Default value = None) dictionary with query parameters
+        that filter the listing, see filter_params.
+
+    :raises RequestError: when the gatekeeper replies with an error.
+    """
+
+    for function in helpers.iter_pages(env.function_instance_api, params,
+                                       callback=callback):
+        yield _format_function_instance(function)
+
+
+def _format_function_instance(function):
+    """ Summary of a vnfr as returned by get_function_instances. """
+
+    return {'instance_uuid': function['uuid'],
+            'status': function['status'],
+            'version': function['version'],
+            'created_at': function['created_at']}
+
+
 def get_function_instance(function_instance_uuid):
     """Returns info on a specific function instance.
 
@@ -0,0 +1,279 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+
+import logging
+from collections import defaultdict, deque
+import tnglib.env as env
+from tnglib import helpers
+
+LOG = logging.getLogger(__name__)
+
+# Seconds a built graph is reused
+GRAPH_CACHE_TTL = 60
+
+# Per kind of entity, the env attribute with the url of its listing and
+# the key of the list in the reply, if any
+GRAPH_COLLECTIONS = {'package': ('pkg_api', None),
+                     'nsd': ('service_descriptor_api', None),
+                     'vnfd': ('function_descriptor_api', None),
+                     'nsr': ('service_instance_api', None),
+                     'vnfr': ('function_instance_api', None),
+                     'request': ('request_api', None),
+                     'sla_template': ('sl_templates_api', None),
+                     'agreement': ('sl_agreements_api', 'agreements'),
+                     'policy': ('policy_api', None),
+                     'test_descriptor': ('test_descriptors_api', None),
+                     'test_result': ('test_results_api', None),
+                     'slice_template': ('slice_template_api', None),
+                     'slice_instance': ('slice_instance_api', None)}
+
+_cache = helpers.TTLCache(GRAPH_CACHE_TTL)
+
+
+class EntityGraph(object):
+    """Entities of the SP and the relations between them.
+
+    nodes maps the uuid of every entity on a dictionary with its 'uuid',
+    'kind' and 'name'. adjacency maps the uuid of every entity on a
+    dictionary with the uuids of its neighbours and the relation to them.
+    Relations are stored in both directions.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.adjacency = defaultdict(dict)
+        self.errors = {}
+
+    def add_node(self, uuid, kind, name=None):
+        """ Adds an entity. """
+
+        if uuid:
+            self.nodes[uuid] = {'uuid': uuid, 'kind': kind, 'name': name}
+
+    def add_edge(self, uuid, other, relation):
+        """ Relates two entities, both of which must be known. """
+
+        if uuid in self.nodes and other in self.nodes and uuid != other:
+            self.adjacency[uuid][other] = relation
+            self.adjacency[other][uuid] = relation
+
+    def neighborhood(self, uuid, depth=1):
+        """Entities within depth relations of an entity, breadth first.
+
+        :returns: a list of dictionaries with the 'uuid', 'kind' and
+            'name' of each entity, the 'relation' through which it was
+            reached and its 'distance', starting with the entity itself.
+        """
+
+        if uuid not in self.nodes:
+            return []
+
+        found = [dict(self.nodes[uuid], relation='', distance=0)]
+        visited = set([uuid])
+        queue = deque([(uuid, 0)])
+        while queue:
+            current, distance = queue.popleft()
+            if distance >= depth:
+                continue
+            for other, relation in sorted(self.adjacency[current].items()):
+                if other in visited:
+                    continue
+                visited.add(other)
+                found.append(dict(self.nodes[other],
+                                  relation=relation,
+                                  distance=distance + 1))
+                queue.append((other, distance + 1))
+
+        return found
+
+
+def get_entity_graph(refresh=False, workers=None):
+    """Builds the relationship graph of all entities of the SP.
+
+    All collections are read in one parallel sweep. Descriptors are
+    related to packages, records, policies and each other by name and
+    version. The graph is cached for GRAPH_CACHE_TTL seconds. Collections
+    that can't be read are left out and listed in the errors of the
+    graph.
+
+    :param refresh: (Default value = False) ignore the cache.
+    :param workers: (Default value = None) number of parallel listings,
+        env.max_workers if None.
+
+    :returns: A tuple. [0] is a bool, False if no collection could be
+        read. [1] is an EntityGraph, or an error message.
+    """
+
+    if refresh:
+        _cache.clear()
+
+    return _cache.get(env.root_api, lambda: _build_graph(workers))
+
+
+def inspect_entity(uuid, depth=1, refresh=False):
+    """Returns an entity of the SP and the entities related to it.
+
+    :param uuid: uuid of any package, descriptor, record, request, SLA,
+        policy, test or slice.
+    :param depth: (Default value = 1) number of relations to follow.
+    :param refresh: (Default value = False) rebuild the graph.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        dictionaries with the 'kind', 'uuid', 'name', 'relation' and
+        'distance' of the entity and its neighbours, or an error message.
+    """
+
+    res, graph = get_entity_graph(refresh)
+    if not res:
+        return False, graph
+
+    if uuid not in graph.nodes:
+        return False, "Unknown uuid: " + str(uuid)
+
+    return True, graph.neighborhood(uuid, depth)
+
+
+def _build_graph(workers=None):
+    """ Reads all collections and relates their records. """
+
+    kinds = sorted(GRAPH_COLLECTIONS)
+
+    def read(kind):
+        url_attr, key = GRAPH_COLLECTIONS[kind]
+        return helpers.get_paged(getattr(env, url_attr), key=key)
+
+    results = helpers.bulk_call(read, [(kind,) for kind in kinds], workers)
+
+    graph = EntityGraph()
+    records = {}
+    for kind, (res, result) in zip(kinds, results):
+        if res:
+            records[kind] = result
+        else:
+            LOG.debug("Can't read " + kind + " records: " + str(result))
+            graph.errors[kind] = result
+            records[kind] = []
+
+    if len(graph.errors) == len(kinds):
+        return False, "Couldn't read any collection of the SP"
+
+    # descriptors are referenced by name and version
+    descriptors = {}
+    for kind, section in [('package', 'pd'), ('nsd', 'nsd'),
+                          ('vnfd', 'vnfd'), ('test_descriptor', 'testd'),
+                          ('slice_template', 'nstd'),
+                          ('sla_template', 'slad'), ('policy', 'pld')]:
+        for record in records[kind]:
+            content = record.get(section) or {}
+            graph.add_node(record.get('uuid'), kind, content.get('name'))
+            descriptors[(kind, content.get('name'),
+                         content.get('version'))] = record.get('uuid')
+
+    for kind, name_key in [('nsr', 'instance_name'), ('vnfr', None),
+                           ('request', 'request_type'),
+                           ('test_result', 'status'),
+                           ('slice_instance', 'name')]:
+        for record in records[kind]:
+            graph.add_node(record.get('uuid', record.get('id')), kind,
+                           record.get(name_key) if name_key else None)
+
+    def find(kind, name, version):
+        return descriptors.get((kind, name, version))
+
+    for package in records['package']:
+        for content in (package.get('pd') or {}).get('package_content', []):
+            ref = content.get('id') or {}
+            for kind in ['nsd', 'vnfd', 'test_descriptor']:
+                graph.add_edge(package.get('uuid'),
+                               find(kind, ref.get('name'),
+                                    ref.get('version')),
+                               'contains')
+
+    for nsd in records['nsd']:
+        for function in (nsd.get('nsd') or {}).get('network_functions', []):
+            graph.add_edge(nsd.get('uuid'),
+                           find('vnfd', function.get('vnf_name'),
+                                function.get('vnf_version')),
+                           'uses')
+
+    for nsr in records['nsr']:
+        graph.add_edge(nsr.get('uuid'), nsr.get('descriptor_reference'),
+                       'instance of')
+        for function in nsr.get('network_functions') or []:
+            graph.add_edge(nsr.get('uuid'), function.get('vnfr_id'),
+                           'contains')
+
+    for vnfr in records['vnfr']:
+        graph.add_edge(vnfr.get('uuid'), vnfr.get('descriptor_reference'),
+                       'instance of')
+
+    for request in records['request']:
+        service = request.get('service')
+        if isinstance(service, dict):
+            graph.add_edge(request.get('id'), service.get('uuid'),
+                           'requests')
+        graph.add_edge(request.get('id'), request.get('instance_uuid'),
+                       'requests')
+
+    for template in records['sla_template']:
+        service = ((template.get('slad') or {}).get('sla_template') or
+                   {}).get('service') or {}
+        graph.add_edge(template.get('uuid'), service.get('ns_id'),
+                       'applies to')
+
+    for agreement in records['agreement']:
+        graph.add_edge(agreement.get('sla_uuid'), agreement.get('nsi_uuid'),
+                       'agreement')
+
+    for policy in records['policy']:
+        service = (policy.get('pld') or {}).get('network_service') or {}
+        graph.add_edge(policy.get('uuid'),
+                       find('nsd', service.get('name'),
+                            service.get('version')),
+                       'applies to')
+
+    for result in records['test_result']:
+        for other, relation in [('instance_uuid', 'tests'),
+                                ('service_uuid', 'tests'),
+                                ('package_id', 'tests'),
+                                ('test_uuid', 'result of')]:
+            graph.add_edge(result.get('uuid'), result.get(other), relation)
+
+    for nsi in records['slice_instance']:
+        graph.add_edge(nsi.get('uuid'), nsi.get('nst-ref'), 'instance of')
+        for nsr in nsi.get('nsr-list') or []:
+            graph.add_edge(nsi.get('uuid'), nsr.get('nsrId'), 'contains')
+
+    LOG.debug("Built a graph of " + str(len(graph.nodes)) + " entities")
+
+    return True, graph
@@ -0,0 +1,400 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+"""Helpers shared by the tnglib modules. Not part of the public API."""
+
+import requests
+import logging
+import json
+import os
+import re
+import copy
+import threading
+import time
+import yaml
+import tnglib.env as env
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+LOG = logging.getLogger(__name__)
+
+# Number of records requested per page from the gatekeeper
+PAGE_SIZE = 100
+
+TIMESTAMP_FORMATS = ['%Y-%m-%dT%H:%M:%S.%f%z',
+                     '%Y-%m-%dT%H:%M:%S%z',
+                     '%Y-%m-%d %H:%M:%S.%f%z',
+                     '%Y-%m-%d %H:%M:%S%z',
+                     '%Y-%m-%d %H:%M:%S.%f',
+                     '%Y-%m-%d %H:%M:%S',
+                     '%Y-%m-%dT%H:%M:%S.%f',
+                     '%Y-%m-%dT%H:%M:%S',
+                     '%Y-%m-%d %H:%M',
+                     '%Y-%m-%d',
+                     '%d/%m/%Y']
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+# The libyaml based loader is an order of magnitude faster, when available
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Number of parsed descriptor files that are kept in memory
+DESCRIPTOR_CACHE_SIZE = 64
+
+_descriptors = OrderedDict()
+_descriptors_lock = threading.Lock()
+
+
+class RequestError(Exception):
+    """ Raised by generators that can't return a (False, error) tuple. """
+
+    def __init__(self, status_code, text):
+        super(RequestError, self).__init__("Request returned with " +
+                                           str(status_code))
+        self.status_code = status_code
+        self.text = text
+
+
+def iter_pages(url, params=None, page_size=PAGE_SIZE, key=None,
+               callback=None):
+    """Generator over the records of a paged gatekeeper listing.
+
+    Pages are requested with the page_size and page_number query
+    parameters until a page comes back short. Endpoints that ignore the
+    paging parameters are detected and read only once.
+
+    :param url: url of the listing.
+    :param params: (Default value = None) extra query parameters.
+    :param page_size: (Default value = PAGE_SIZE) records per page.
+    :param key: (Default value = None) key of the list in the reply, when
+        the reply is a dictionary.
+    :param callback: (Default value = None) callable that is invoked
+        without arguments after the records of each page were consumed,
+        e.g. to flush output.
+
+    :raises RequestError: when the gatekeeper replies with an error.
+    """
+
+    page_number = 0
+    first = None
+
+    while True:
+        query = dict(params or {})
+        query['page_size'] = page_size
+        query['page_number'] = page_number
+
+        resp = requests.get(url,
+                            params=query,
+                            timeout=env.timeout,
+                            headers=env.header)
+
+        env.set_return_header(resp.headers)
+
+        if resp.status_code != 200:
+            LOG.debug("Request for " + url + " returned with " +
+                      (str(resp.status_code)))
+            raise RequestError(resp.status_code, resp.text)
+
+        page = json.loads(resp.text)
+        if key:
+            page = page[key]
+
+        # the endpoint ignores the paging parameters
+        if len(page) > page_size or (page and page[0] == first):
+            if page_number == 0:
+                for record in page:
+                    yield record
+            return
+
+        for record in page:
+            yield record
+
+        if callback:
+            callback()
+
+        if len(page) < page_size:
+            return
+
+        first = page[0]
+        page_number = page_number + 1
+
+
+def get_paged(url, params=None, page_size=PAGE_SIZE, key=None):
+    """Reads a complete paged listing.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        records, or an error message.
+    """
+
+    try:
+        return True, list(iter_pages(url, params, page_size, key))
+    except RequestError as e:
+        return False, e.text
+
+
+class RateLimiter(object):
+    """ Spaces calls at least 1/rate seconds apart, across threads. """
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_call = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """ Blocks until the next call is allowed. """
+
+        if not self.interval:
+            return
+
+        with self.lock:
+            now = time.time()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+def bulk_call(func, items, workers=None, rate=None, callback=None):
+    """Calls func(*item) for every item with bounded parallelism.
+
+    Exceptions raised by func are turned into (False, message) tuples, so
+    one failing call doesn't abort the others.
+
+    :param func: the function to call.
+    :param items: list of argument tuples.
+    :param workers: (Default value = None) number of parallel calls,
+        env.max_workers if None.
+    :param rate: (Default value = None) maximum number of calls started
+        per second.
+    :param callback: (Default value = None) callable that is invoked as
+        callback(item, result) as calls complete.
+
+    :returns: a list with the result of each call, in the order of items.
+    """
+
+    items = list(items)
+    limiter = RateLimiter(rate)
+
+    def call(item):
+        limiter.wait()
+        try:
+            result = func(*item)
+        except Exception as e:
+            LOG.debug(str(e))
+            result = (False, str(e))
+        if callback:
+            callback(item, result)
+        return result
+
+    if not items:
+        return []
+
+    workers = min(workers or env.max_workers, len(items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(call, items))
+
+
+def load_yaml(stream):
+    """ Parses a yaml string or file with YAML_LOADER. """
+
+    return yaml.load(stream, Loader=YAML_LOADER)
+
+
+def load_descriptor(path):
+    """Parses a json or yaml file, reusing the result while the file
+    doesn't change.
+
+    Files are cached by path and invalidated when their modification time
+    or size changes. Every call returns its own copy of the document, so
+    callers can modify it.
+
+    :param path: path of the file. Files ending in .json are parsed as
+        json, all others as yaml.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the parsed
+        document, or an error message.
+    """
+
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        return False, str(e)
+
+    key = os.path.abspath(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    with _descriptors_lock:
+        entry = _descriptors.get(key)
+        if entry and entry[0] == version:
+            _descriptors.move_to_end(key)
+            return True, copy.deepcopy(entry[1])
+
+    try:
+        with open(path, 'rb') as descriptor_file:
+            if os.path.splitext(path)[1] == '.json':
+                document = json.loads(descriptor_file.read().decode('utf-8'))
+            else:
+                document = load_yaml(descriptor_file)
+    except (IOError, ValueError, yaml.YAMLError) as e:
+        LOG.debug("Can't parse " + path + ": " + str(e))
+        return False, "Can't parse " + path + ": " + str(e)
+
+    with _descriptors_lock:
+        _descriptors[key] = (version, document)
+        _descriptors.move_to_end(key)
+        while len(_descriptors) > DESCRIPTOR_CACHE_SIZE:
+            _descriptors.popitem(last=False)
+
+    return True, copy.deepcopy(document)
+
+
+def percentile(values, percent):
+    """ Nearest-rank percentile of a sorted list, None if it's empty. """
+
+    if not values:
+        return None
+
+    return values[int(round(percent / 100.0 * (len(values) - 1)))]
+
+
+class TTLCache(object):
+    """ Thread safe dictionary whose entries expire after ttl seconds. """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, func):
+        """ Returns the cached value for key, calling func() on a miss.
+        Results of func that are (False, error) tuples are not cached. """
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry[0] < self.ttl:
+                return entry[1]
+
+        value = func()
+        if not (isinstance(value, tuple) and value and value[0] is False):
+            with self.lock:
+                self.entries[key] = (time.time(), value)
+        return value
+
+    def clear(self):
+        """ Drops all entries. """
+
+        with self.lock:
+            self.entries = {}
+
+
+def parse_timestamp(value):
+    """Parses a timestamp into a timezone aware datetime.
+
+    Timestamps without timezone are taken to be UTC.
+
+    :param value: a string, a datetime or a number of seconds since epoch.
+
+    :returns: a datetime in UTC, or None if value can't be parsed.
+    """
+
+    if value is None or value == '':
+        return None
+
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc)
+    else:
+        text = str(value).strip()
+
+        # fast path for the iso format the gatekeeper uses
+        try:
+            parsed = datetime.fromisoformat(text)
+        except (AttributeError, ValueError):
+            parsed = None
+        if parsed is not None:
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return parsed.astimezone(timezone.utc)
+
+        if text.endswith('Z'):
+            text = text[:-1] + '+0000'
+        # %z doesn't accept a colon in the offset before python 3.7
+        text = re.sub(r'([+-]\d\d):(\d\d)$', r'\1\2', text)
+        # %f accepts at most 6 digits
+        text = re.sub(r'(\.\d{6})\d+', r'\1', text)
+
+        parsed = None
+        for time_format in TIMESTAMP_FORMATS:
+            try:
+                parsed = datetime.strptime(text, time_format)
+                break
+            except ValueError:
+                pass
+
+        if parsed is None:
+            return None
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+
+    return parsed.astimezone(timezone.utc)
+
+
+def parse_duration(value):
+    """Parses a duration like '90s', '15m', '24h', '7d' or '2w'.
+
+    :returns: a timedelta, or None if value is not a duration.
+    """
+
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([smhdw])\s*$', str(value))
+    if not match:
+        return None
+
+    return timedelta(seconds=float(match.group(1)) *
+                     DURATION_UNITS[match.group(2)])
+
+
+def parse_since(value, now=None):
+    """Parses an absolute timestamp or a duration relative to now.
+
+    :returns: a timezone aware datetime, or None.
+    """
+
+    duration = parse_duration(value)
+    if duration is not None:
+        now = now or datetime.now(timezone.utc)
+        return now - duration
+
+    return parse_timestamp(value)
@@ -37,6 +37,7 @@ import time
 import os
 import yaml
 import tnglib.env as env
+from tnglib import helpers
 
 LOG = logging.getLogger(__name__)
 
@@ -288,7 +289,9 @@ def post_vim_from_file(tag, file=None):
         else:
             return False, 'No infrastructure file'
 
-    data = yaml.load(open(file, 'r'))
+    res, data = helpers.load_descriptor(file)
+    if not res:
+        return False, data
 
     return post_vim(data[tag]['type'], data[tag]['payload'])
 
@@ -306,6 +309,8 @@ def get_available_vim_tags(file=None):
         else:
             return False, 'No infrastructure file'
 
-    data = yaml.load(open(file, 'r'))
+    res, data = helpers.load_descriptor(file)
+    if not res:
+        return False, data
 
     return True, list(data.keys())
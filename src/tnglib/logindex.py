@@ -0,0 +1,359 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from tnglib import logs
+
+LOG = logging.getLogger(__name__)
+
+# Default location of the local log index
+LOGS_INDEX = '/tmp/tngcli_logs.db'
+
+# Number of messages inserted per transaction
+LOGS_INDEX_BATCH = 1000
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS messages (
+           rowid INTEGER PRIMARY KEY,
+           id TEXT UNIQUE,
+           timestamp TEXT,
+           container_name TEXT,
+           source TEXT,
+           level INTEGER,
+           message TEXT,
+           fields TEXT)""",
+    """CREATE INDEX IF NOT EXISTS messages_timestamp
+           ON messages (timestamp)""",
+    """CREATE INDEX IF NOT EXISTS messages_container
+           ON messages (container_name, timestamp)""",
+    """CREATE INDEX IF NOT EXISTS messages_source
+           ON messages (source, timestamp)""",
+    """CREATE INDEX IF NOT EXISTS messages_level
+           ON messages (level, timestamp)""",
+    """CREATE TABLE IF NOT EXISTS ranges (
+           query TEXT,
+           start TEXT,
+           end TEXT,
+           messages INTEGER,
+           ingested_at TEXT)"""]
+
+_FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+           USING fts5(message, content='messages', content_rowid='rowid')""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_insert
+           AFTER INSERT ON messages BEGIN
+           INSERT INTO messages_fts (rowid, message)
+               VALUES (new.rowid, new.message);
+           END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_delete
+           AFTER DELETE ON messages BEGIN
+           INSERT INTO messages_fts (messages_fts, rowid, message)
+               VALUES ('delete', old.rowid, old.message);
+           END"""]
+
+
+def index_logs(_from, to, sp_path, filter=None, db=LOGS_INDEX, windows=1,
+               workers=logs.LOGS_WORKERS, page_size=logs.LOGS_PAGE_SIZE,
+               progress=None):
+    """Ingests the Graylog messages of a time range into a local index.
+
+    The index is an SQLite database with indexes on timestamp, container,
+    source and level, and a full-text index on the message when SQLite
+    supports FTS5. Messages that are already indexed are skipped, so
+    overlapping ranges can be ingested safely.
+
+    :param _from: start of the time range, e.g. "2019-04-25 17:11:01.201".
+    :param to: end of the time range.
+    :param sp_path: complete url of the SP.
+    :param filter: (Default value = None) complete filter in Graylog syntax.
+    :param db: (Default value = LOGS_INDEX) path of the index.
+    :param windows: (Default value = 1) see get_logs.
+    :param workers: (Default value = LOGS_WORKERS) see get_logs.
+    :param page_size: (Default value = LOGS_PAGE_SIZE) see get_logs.
+    :param progress: (Default value = None) see get_logs.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the number of
+        newly indexed messages, or an error message.
+    """
+
+    query = logs._build_query(sp_path, filter)
+
+    res, spools = logs._fetch_windows(query, _from, to, windows, workers,
+                                      page_size, progress)
+    if not res:
+        return False, spools
+
+    conn = _connect(db)
+    try:
+        before = _count_messages(conn)
+        batch = []
+        for message in logs._merge_spools(spools):
+            batch.append(_to_row(message))
+            if len(batch) >= LOGS_INDEX_BATCH:
+                _insert(conn, batch)
+                batch = []
+        _insert(conn, batch)
+        added = _count_messages(conn) - before
+
+        with conn:
+            conn.execute("INSERT INTO ranges VALUES (?, ?, ?, ?, ?)",
+                         (query,
+                          logs._format_time(logs._parse_time(_from)),
+                          logs._format_time(logs._parse_time(to)),
+                          added,
+                          logs._format_time(datetime.utcnow())))
+    finally:
+        conn.close()
+        for spool in spools:
+            spool.close()
+
+    LOG.debug("Indexed " + str(added) + " new messages in " + db)
+
+    return True, added
+
+
+def query_log_index(db=LOGS_INDEX, _from=None, to=None, container=None,
+                    source=None, level=None, text=None, limit=None):
+    """Returns the indexed messages that match all given filters.
+
+    :param db: (Default value = LOGS_INDEX) path of the index.
+    :param _from: (Default value = None) start of the time range.
+    :param to: (Default value = None) end of the time range.
+    :param container: (Default value = None) container_name of the message.
+    :param source: (Default value = None) source of the message.
+    :param level: (Default value = None) maximum syslog level, e.g. 3 for
+        errors and worse.
+    :param text: (Default value = None) text the message must contain,
+        matched as a phrase with the full-text index when available,
+        otherwise as a substring.
+    :param limit: (Default value = None) maximum number of messages.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        dictionaries, each containing a message, ordered by timestamp.
+    """
+
+    if not os.path.exists(db):
+        return False, "No log index found at " + db
+
+    clauses = []
+    params = []
+
+    try:
+        if _from:
+            clauses.append("m.timestamp >= ?")
+            params.append(logs._format_time(logs._parse_time(_from)))
+        if to:
+            clauses.append("m.timestamp <= ?")
+            params.append(logs._format_time(logs._parse_time(to)))
+    except ValueError as e:
+        return False, str(e)
+
+    if container:
+        clauses.append("m.container_name = ?")
+        params.append(container)
+    if source:
+        clauses.append("m.source = ?")
+        params.append(source)
+    if level is not None:
+        clauses.append("m.level <= ?")
+        params.append(int(level))
+
+    conn = _connect(db)
+    try:
+        sql = "SELECT m.fields FROM messages m"
+        if text:
+            if _has_fts(conn):
+                sql = sql + " JOIN messages_fts f ON f.rowid = m.rowid"
+                clauses.append("messages_fts MATCH ?")
+                params.append(_fts_phrase(text))
+            else:
+                clauses.append("m.message LIKE ?")
+                params.append('%' + text + '%')
+        if clauses:
+            sql = sql + " WHERE " + " AND ".join(clauses)
+        sql = sql + " ORDER BY m.timestamp, m.rowid"
+        if limit:
+            sql = sql + " LIMIT " + str(int(limit))
+
+        messages = [json.loads(row[0]) for row in conn.execute(sql, params)]
+    except sqlite3.Error as e:
+        return False, str(e)
+    finally:
+        conn.close()
+
+    return True, messages
+
+
+def get_log_index_info(db=LOGS_INDEX):
+    """Returns info on the content and size of the local log index.
+
+    :param db: (Default value = LOGS_INDEX) path of the index.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a dictionary
+        with the number of messages, the covered time span, the size on
+        disk and the ingested ranges.
+    """
+
+    if not os.path.exists(db):
+        return False, "No log index found at " + db
+
+    conn = _connect(db)
+    try:
+        first, last = conn.execute("SELECT MIN(timestamp), MAX(timestamp) "
+                                   "FROM messages").fetchone()
+        ranges = []
+        for row in conn.execute("SELECT query, start, end, messages, "
+                                "ingested_at FROM ranges ORDER BY start"):
+            ranges.append({'query': row[0],
+                           'start': row[1],
+                           'end': row[2],
+                           'messages': row[3],
+                           'ingested_at': row[4]})
+        info = {'path': db,
+                'size': os.path.getsize(db),
+                'messages': _count_messages(conn),
+                'first': first,
+                'last': last,
+                'full_text': _has_fts(conn),
+                'ranges': ranges}
+    finally:
+        conn.close()
+
+    return True, info
+
+
+def evict_log_index(before, db=LOGS_INDEX):
+    """Removes the indexed messages and ranges older than a timestamp.
+
+    :param before: messages with an older timestamp are removed.
+    :param db: (Default value = LOGS_INDEX) path of the index.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the number of
+        removed messages, or an error message.
+    """
+
+    if not os.path.exists(db):
+        return False, "No log index found at " + db
+
+    try:
+        before = logs._format_time(logs._parse_time(before))
+    except ValueError as e:
+        return False, str(e)
+
+    conn = _connect(db)
+    try:
+        with conn:
+            removed = conn.execute("DELETE FROM messages WHERE timestamp < ?",
+                                   (before,)).rowcount
+            conn.execute("DELETE FROM ranges WHERE end < ?", (before,))
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    return True, removed
+
+
+def _connect(db):
+    """ Opens the index, creating the schema when needed. """
+
+    conn = sqlite3.connect(db)
+    with conn:
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        try:
+            for statement in _FTS_SCHEMA:
+                conn.execute(statement)
+        except sqlite3.OperationalError:
+            LOG.debug("SQLite without FTS5, full-text search uses LIKE")
+
+    return conn
+
+
+def _has_fts(conn):
+    """ Whether the index has a full-text table. """
+
+    row = conn.execute("SELECT name FROM sqlite_master WHERE type='table' "
+                       "AND name='messages_fts'").fetchone()
+    return row is not None
+
+
+def _fts_phrase(text):
+    """ Quotes text as an FTS5 phrase, so its punctuation isn't parsed
+    as query syntax. """
+
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _count_messages(conn):
+    """ Number of indexed messages. """
+
+    return conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+
+def _to_row(message):
+    """ Translates a Graylog message into a row of the messages table. """
+
+    timestamp = message.get("timestamp")
+    try:
+        timestamp = logs._format_time(logs._parse_time(timestamp))
+    except (TypeError, ValueError):
+        pass
+
+    level = message.get("level")
+    try:
+        level = int(level)
+    except (TypeError, ValueError):
+        level = None
+
+    return (message.get("_id"),
+            timestamp,
+            message.get("container_name"),
+            message.get("source"),
+            level,
+            message.get("message"),
+            json.dumps(message, sort_keys=True))
+
+
+def _insert(conn, rows):
+    """ Inserts a batch of rows in a single transaction. """
+
+    if not rows:
+        return
+
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO messages (id, timestamp, "
+                         "container_name, source, level, message, fields) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
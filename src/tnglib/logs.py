@@ -30,47 +30,637 @@
 # acknowledge the contributions of their colleagues of the 5GTANGO
 # partner consortium (www.5gtango.eu).
 
+import getpass
 import graylog
-from graylog.rest import ApiException
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from tnglib import env
 
-def get_logs(_from, to, sp_path, filter=None, file=True):
-    # _from = "2019-04-25 17:11:01.201" # Object | Timerange start. See description for date format
-    # to = "2019-04-25 17:26:01.201" # Object | Timerange end. See description for date format
-    # sp_path = "http://pre-int-sp-ath.5gtango.eu" | Complete url of the SP
-    # filter = "source:pre-int-sp-ath* AND container_name:tng-gtk-sp" | Complete filter with Graylogs sintax
-    # file = True/False | Write logs to file (Default is True)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOG = logging.getLogger(__name__)
+
+# Number of messages requested per Graylog search call
+LOGS_PAGE_SIZE = 1000
+
+# Number of time windows that are fetched in parallel
+LOGS_WORKERS = 4
+
+# Number of bytes that are buffered before they are written to disk
+LOGS_BUFFER_SIZE = 1024 * 1024
+
+# Directory in which tail_logs keeps its position per query, in one
+# file per user and SP
+LOGS_CHECKPOINT_DIR = tempfile.gettempdir()
+
+# How far back tail_logs starts when a query has no checkpoint yet
+LOGS_TAIL_START = timedelta(minutes=5)
+
+TIME_FORMATS = ['%Y-%m-%d %H:%M:%S.%f',
+                '%Y-%m-%d %H:%M:%S',
+                '%Y-%m-%dT%H:%M:%S.%fZ',
+                '%Y-%m-%dT%H:%M:%SZ']
+
+
+def get_logs(_from, to, sp_path, filter=None, file=True, windows=1,
+             workers=LOGS_WORKERS, page_size=LOGS_PAGE_SIZE, progress=None,
+             output='graylogs.log', fmt='text', compression=None,
+             rotate_size=None, rotate_interval=None):
+    """Retrieves the Graylog messages of an SP within a time range.
+
+    The time range is split in windows that are fetched in parallel. Each
+    window is paged with offset/limit and spooled to a temporary file, so
+    only one page per window is kept in memory. The windows are then
+    merged in timestamp order and streamed to the output.
+
+    :param _from: start of the time range, e.g. "2019-04-25 17:11:01.201".
+    :param to: end of the time range, e.g. "2019-04-25 17:26:01.201".
+    :param sp_path: complete url of the SP, e.g.
+        "http://pre-int-sp-ath.5gtango.eu".
+    :param filter: (Default value = None) complete filter in Graylog
+        syntax, e.g. "source:pre-int-sp-ath* AND container_name:tng-gtk-sp".
+    :param file: (Default value = True) write the logs to output instead
+        of printing them.
+    :param windows: (Default value = 1) number of windows the time range
+        is split in.
+    :param workers: (Default value = LOGS_WORKERS) number of windows that
+        are fetched in parallel.
+    :param page_size: (Default value = LOGS_PAGE_SIZE) number of messages
+        per search call.
+    :param progress: (Default value = None) callable that is invoked as
+        progress(done, total, messages) each time a window completes.
+    :param output: (Default value = 'graylogs.log') path of the log file.
+    :param fmt: (Default value = 'text') 'text' for one formatted line per
+        message, 'jsonl' for one JSON object with all Graylog fields per
+        message.
+    :param compression: (Default value = None) None, 'gzip' or 'zstd'.
+    :param rotate_size: (Default value = None) start a new file once the
+        current one exceeds this number of bytes.
+    :param rotate_interval: (Default value = None) start a new file for
+        every interval of this many seconds, based on the message
+        timestamps.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the number of
+        retrieved messages, or an error message.
+    """
+
+    query = _build_query(sp_path, filter)
+
+    res, spools = _fetch_windows(query, _from, to, windows, workers,
+                                 page_size, progress)
+    if not res:
+        return False, spools
+
+    messages = _merge_spools(spools)
+
+    count = 0
+    try:
+        if file:
+            with _LogWriter(output, fmt, compression, rotate_size,
+                            rotate_interval) as logs:
+                for message in messages:
+                    logs.write(message)
+                    count = count + 1
+        else:
+            for message in messages:
+                print(format_log_message(message, fmt))
+                count = count + 1
+    except ValueError as e:
+        return False, str(e)
+    finally:
+        for spool in spools:
+            spool.close()
+
+    return True, count
+
+
+def tail_logs(sp_path, filter=None, output='graylogs.log',
+              checkpoint=None, follow=False, interval=5,
+              page_size=LOGS_PAGE_SIZE, callback=None, fmt='text',
+              compression=None, rotate_size=None, rotate_interval=None):
+    """Appends the Graylog messages that arrived since the previous call.
+
+    The timestamp and ids of the last retrieved messages are stored per
+    query in a checkpoint file. Each poll only requests messages from
+    that timestamp onwards and drops the ones that were already written,
+    so overlapping polls never produce duplicates.
+
+    :param sp_path: complete url of the SP.
+    :param filter: (Default value = None) complete filter in Graylog syntax.
+    :param output: (Default value = 'graylogs.log') file the messages are
+        appended to. If None, the messages are printed.
+    :param checkpoint: (Default value = None) path of the checkpoint file.
+        If None, the one of the current user and SP, see
+        get_log_checkpoint.
+    :param follow: (Default value = False) keep polling every interval
+        seconds until interrupted.
+    :param interval: (Default value = 5) seconds between two polls.
+    :param page_size: (Default value = LOGS_PAGE_SIZE) number of messages
+        per search call.
+    :param callback: (Default value = None) callable that is invoked as
+        callback(messages, timestamp) after each poll.
+    :param fmt: (Default value = 'text') 'text' or 'jsonl', see get_logs.
+    :param compression: (Default value = None) None, 'gzip' or 'zstd'.
+    :param rotate_size: (Default value = None) see get_logs.
+    :param rotate_interval: (Default value = None) see get_logs.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the number of
+        appended messages, or an error message.
+    """
+
+    query = _build_query(sp_path, filter)
+    _configure()
+
+    if checkpoint is None:
+        checkpoint = get_log_checkpoint(sp_path)
+
+    sink = {'fmt': fmt,
+            'compression': compression,
+            'rotate_size': rotate_size,
+            'rotate_interval': rotate_interval}
+
+    total = 0
+    while True:
+        try:
+            count = _tail_once(query, output, checkpoint, page_size, sink)
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            LOG.debug(str(e))
+            return False, str(e)
+
+        total = total + count
+        if callback:
+            callback(count, _load_checkpoint(checkpoint)[query]['timestamp'])
+
+        if not follow:
+            break
+
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            break
+
+    return True, total
+
+
+def get_log_checkpoint(sp_path):
+    """Returns the default checkpoint file of tail_logs.
+
+    Every user and SP gets its own file in LOGS_CHECKPOINT_DIR, so
+    positions aren't shared between them.
+
+    :param sp_path: complete url of the SP.
+
+    :returns: the path of the checkpoint file.
+    """
+
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = str(os.getuid())
+
+    key = hashlib.sha1((user + '|' + sp_path).encode('utf-8')).hexdigest()
+
+    return os.path.join(LOGS_CHECKPOINT_DIR,
+                        'tngcli_logs_' + key[:16] + '.json')
+
+
+def _tail_once(query, output, checkpoint, page_size=LOGS_PAGE_SIZE,
+               sink=None):
+    """ Performs a single poll for tail_logs. sink holds the keyword
+    arguments for the _LogWriter. """
+
+    checkpoints = _load_checkpoint(checkpoint)
+    position = checkpoints.get(query)
+
+    now = datetime.utcnow()
+    if position:
+        _from = _parse_time(position['timestamp'])
+        last_timestamp = position['timestamp']
+        last_ids = set(position['ids'])
+    else:
+        _from = now - LOGS_TAIL_START
+        last_timestamp = _format_time(_from)
+        last_ids = set()
+
+    sink = sink or {}
+    if output:
+        logs = _LogWriter(output, append=True, **sink)
+    else:
+        logs = None
+
+    count = 0
+    complete = False
+    try:
+        for message in _search_pages(query, _format_time(_from),
+                                     _format_time(now), page_size):
+            timestamp = message.get("timestamp")
+            message_id = message.get("_id")
+            if timestamp == last_timestamp:
+                if message_id in last_ids:
+                    continue
+                last_ids.add(message_id)
+            else:
+                last_timestamp = timestamp
+                last_ids = set([message_id])
+
+            if logs:
+                logs.write(message)
+            else:
+                print(format_log_message(message, sink.get('fmt', 'text')))
+            count = count + 1
+        complete = True
+    finally:
+        if logs:
+            logs.close()
+
+        # without any message the window slides along, so it stays bounded
+        if complete and not last_ids:
+            last_timestamp = _format_time(max(_from, now - LOGS_TAIL_START))
+
+        # also after an interruption, the written messages aren't repeated
+        checkpoints[query] = {'timestamp': last_timestamp,
+                              'ids': sorted([i for i in last_ids if i])}
+        _store_checkpoint(checkpoint, checkpoints)
+
+    return count
+
+
+def _load_checkpoint(checkpoint):
+    """ Reads the checkpoint file, if it exists. """
+
+    try:
+        with open(checkpoint, 'r') as file:
+            return json.load(file)
+    except (IOError, ValueError):
+        return {}
+
+
+def _store_checkpoint(checkpoint, checkpoints):
+    """ Atomically replaces the checkpoint file. """
+
+    tmp = checkpoint + '.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(checkpoints, file)
+    os.replace(tmp, checkpoint)
+
+
+def _configure():
+    """ Applies the Graylog credentials from env. """
 
     configuration = graylog.Configuration()
     configuration.username = env.graylog_username
     configuration.password = env.graylog_password
     configuration.host = env.graylog_host
 
+
+def _build_query(sp_path, filter=None):
+    """ Builds the Graylog query for an SP. """
+
+    if filter:
+        return filter
+
     try:
         source = sp_path.split(".")[0].replace("http://","")
     except:
         source = sp_path
 
-    query = "source:{} AND type:E".format(source)
+    return "source:{} AND type:E".format(source)
 
-    if filter:
-        query = filter
 
-    try:
-        # Message search with absolute timerange.
-        api_instance = graylog.SearchuniversalabsoluteApi()
-        api_response = api_instance.search_absolute(query, _from, to)
+def _parse_time(value):
+    """ Parses a Graylog timestamp into a datetime. """
+
+    if isinstance(value, datetime):
+        return value
+
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format)
+        except ValueError:
+            pass
+
+    raise ValueError("Unsupported time format: " + str(value))
+
+
+def _format_time(value):
+    """ Formats a datetime the way Graylog expects it. """
+
+    return value.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def _split_time_range(_from, to, windows):
+    """ Splits a time range in a list of (start, end) tuples. """
+
+    start = _parse_time(_from)
+    end = _parse_time(to)
+    windows = max(1, int(windows))
+    step = (end - start) / windows
+
+    bounds = []
+    for i in range(windows):
+        w_start = start + step * i
+        w_end = end if i == windows - 1 else start + step * (i + 1)
+        bounds.append((_format_time(w_start), _format_time(w_end)))
+
+    return bounds
+
+
+def _search_pages(query, _from, to, page_size=LOGS_PAGE_SIZE):
+    """ Generator over the messages in a time range, one page at a time,
+    in ascending timestamp order. """
+
+    api_instance = graylog.SearchuniversalabsoluteApi()
+    offset = 0
+
+    while True:
+        api_response = api_instance.search_absolute(query, _from, to,
+                                                    limit=page_size,
+                                                    offset=offset,
+                                                    sort='timestamp:asc')
         reply = api_response.to_dict()
-    except ApiException as e:
-        print(e)
-
-    if file:
-        with open('graylogs.log', 'w') as logs:
-            for message in reply["messages"]:
-                logs.write(message["message"]["timestamp"] + " " +
-                       message["message"]["container_name"] + ": " +
-                       message["message"].get("message") + "\n")
-    else:
-        for message in reply["messages"]:
-            print(message["message"]["timestamp"] + " " + message["message"]["container_name"] + ": " + message["message"].get("message") + "\n")
+        page = reply.get("messages") or []
+
+        for message in page:
+            yield message["message"]
+
+        offset = offset + len(page)
+        total = reply.get("total_results") or 0
+        if len(page) < page_size or offset >= total:
+            return
+
+
+def _fetch_window(query, _from, to, page_size=LOGS_PAGE_SIZE):
+    """ Spools the messages of a single window to a temporary file. """
+
+    spool = tempfile.TemporaryFile(mode='w+')
+    count = 0
+    try:
+        for message in _search_pages(query, _from, to, page_size):
+            spool.write(json.dumps(message) + "\n")
+            count = count + 1
+    except:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return spool, count
+
+
+def _fetch_windows(query, _from, to, windows=1, workers=LOGS_WORKERS,
+                   page_size=LOGS_PAGE_SIZE, progress=None):
+    """ Fetches all windows of a time range in parallel. """
+
+    _configure()
+
+    try:
+        bounds = _split_time_range(_from, to, windows)
+    except ValueError as e:
+        return False, str(e)
+
+    spools = [None] * len(bounds)
+    error = None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for i, (start, end) in enumerate(bounds):
+            future = executor.submit(_fetch_window, query, start, end,
+                                     page_size)
+            futures[future] = i
+
+        done = 0
+        for future in as_completed(futures):
+            done = done + 1
+            try:
+                spool, count = future.result()
+            except Exception as e:
+                LOG.debug(str(e))
+                error = str(e)
+                continue
+            spools[futures[future]] = spool
+            LOG.debug("Window " + str(bounds[futures[future]]) +
+                      " returned " + str(count) + " messages")
+            if progress:
+                progress(done, len(bounds), count)
+
+    if error:
+        for spool in spools:
+            if spool:
+                spool.close()
+        return False, error
+
+    return True, spools
+
+
+def _read_spool(spool):
+    """ Generator over the messages in a spool file. """
+
+    for line in spool:
+        yield json.loads(line)
+
+
+def _merge_spools(spools):
+    """ K-way merge of sorted spools, dropping messages that appear in
+    two adjacent windows. """
+
+    merged = heapq.merge(*[_read_spool(spool) for spool in spools],
+                         key=lambda message: message.get("timestamp", ""))
+
+    last_timestamp = None
+    seen = set()
+    for message in merged:
+        timestamp = message.get("timestamp")
+        if timestamp != last_timestamp:
+            last_timestamp = timestamp
+            seen = set()
+        message_id = message.get("_id")
+        if message_id is not None:
+            if message_id in seen:
+                continue
+            seen.add(message_id)
+        yield message
+
+
+def _format_message(message):
+    """ Formats a Graylog message as a single log line. """
+
+    return (str(message.get("timestamp", "")) + " " +
+            str(message.get("container_name", "")) + ": " +
+            str(message.get("message", "")))
+
+
+def format_log_message(message, fmt='text'):
+    """Serializes a Graylog message as a single line, without newline.
+
+    :param message: dictionary with the fields of a Graylog message.
+    :param fmt: (Default value = 'text') 'text' for "timestamp container:
+        message", 'jsonl' for a JSON object with all fields.
+
+    :returns: A string.
+    """
+
+    if fmt == 'jsonl':
+        return json.dumps(message, sort_keys=True)
+
+    return _format_message(message)
+
+
+class _LogWriter(object):
+    """ Buffered log file writer with optional compression and rotation.
+
+    Rotated files get a suffix before the extension: the start of the
+    time interval for time based rotation and a sequence number for size
+    based rotation, e.g. graylogs.20190425T170000.1.log.gz.
+    """
+
+    def __init__(self, path, fmt='text', compression=None, rotate_size=None,
+                 rotate_interval=None, append=False,
+                 buffer_size=LOGS_BUFFER_SIZE):
+
+        if fmt not in ['text', 'jsonl']:
+            raise ValueError("Unsupported log format: " + str(fmt))
+        if compression not in [None, 'gzip', 'zstd']:
+            raise ValueError("Unsupported compression: " + str(compression))
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstandard is required for zstd compression")
+
+        self.base, self.ext = os.path.splitext(path)
+        self.fmt = fmt
+        self.compression = compression
+        self.rotate_size = rotate_size
+        self.rotate_interval = rotate_interval
+        self.append = append
+        self.buffer_size = buffer_size
+        if rotate_size:
+            self.buffer_size = min(buffer_size, rotate_size)
+
+        self.buffer = []
+        self.buffered = 0
+        self.interval = None
+        self.sequence = 0
+        self.raw = None
+        self.stream = None
+        self.paths = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, message):
+        """ Buffers a single Graylog message. """
+
+        if self.rotate_interval:
+            interval = self._interval_of(message)
+            if interval != self.interval:
+                self._flush()
+                self._close_file()
+                self.interval = interval
+                self.sequence = 0
+
+        line = format_log_message(message, self.fmt) + "\n"
+        self.buffer.append(line)
+        self.buffered = self.buffered + len(line)
+
+        if self.buffered >= self.buffer_size:
+            self._flush()
+
+    def close(self):
+        """ Flushes the buffer and closes the current file. """
+
+        self._flush()
+        self._close_file()
+
+    def _interval_of(self, message):
+        """ Start of the rotation interval a message belongs to. """
+
+        try:
+            timestamp = _parse_time(message.get("timestamp"))
+        except (TypeError, ValueError):
+            return self.interval
+
+        epoch = (timestamp - datetime(1970, 1, 1)).total_seconds()
+        start = int(epoch // self.rotate_interval) * self.rotate_interval
+        return datetime(1970, 1, 1) + timedelta(seconds=start)
+
+    def _path(self):
+        """ Path of the current file. """
+
+        path = self.base
+        if self.interval is not None:
+            path = path + '.' + self.interval.strftime('%Y%m%dT%H%M%S')
+        if self.rotate_size and self.sequence:
+            path = path + '.' + str(self.sequence)
+        path = path + self.ext
+        if self.compression == 'gzip':
+            path = path + '.gz'
+        elif self.compression == 'zstd':
+            path = path + '.zst'
+        return path
+
+    def _open_file(self):
+        """ Opens the current file, skipping full files when appending. """
+
+        while True:
+            path = self._path()
+            if not (self.append and self.rotate_size and
+                    os.path.exists(path) and
+                    os.path.getsize(path) >= self.rotate_size):
+                break
+            self.sequence = self.sequence + 1
+
+        mode = 'ab' if self.append or path in self.paths else 'wb'
+        self.raw = open(path, mode)
+        if self.compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode=mode)
+        elif self.compression == 'zstd':
+            compressor = zstandard.ZstdCompressor()
+            self.stream = compressor.stream_writer(self.raw)
+        else:
+            self.stream = self.raw
+        self.paths.append(path)
+        LOG.debug("Writing logs to " + path)
+
+    def _close_file(self):
+        """ Closes the current file, if any. """
+
+        if self.stream is None:
+            return
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+        self.stream = None
+        self.raw = None
+
+    def _flush(self):
+        """ Writes the buffer to the current file in a single call. """
+
+        if not self.buffer:
+            return
+
+        if self.stream is None:
+            self._open_file()
+
+        self.stream.write(''.join(self.buffer).encode('utf-8'))
+        self.buffer = []
+        self.buffered = 0
 
+        if self.rotate_size:
+            # compressors buffer internally, flush to measure the file size
+            self.stream.flush()
+            if self.raw.tell() >= self.rotate_size:
+                self._close_file()
+                self.sequence = self.sequence + 1
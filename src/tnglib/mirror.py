@@ -0,0 +1,378 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+
+import json
+import logging
+import os
+import sqlite3
+from datetime import datetime
+import tnglib.env as env
+from tnglib import helpers
+from tnglib.requests import _format_request
+from tnglib.services import _format_service_instance
+from tnglib.functions import _format_function_instance
+from tnglib.slices import _format_slice_instance
+from tnglib.results import _format_test_result
+
+LOG = logging.getLogger(__name__)
+
+# Default location of the local mirror
+MIRROR_DB = '/tmp/tngcli_mirror.db'
+
+MIRROR_COLLECTIONS = ['requests', 'service_instances', 'function_instances',
+                      'slice_instances', 'test_results']
+
+# Per collection, the fields of the summaries that are indexed columns of
+# the mirror, and their column
+MIRROR_FILTERS = {'requests': {'request_uuid': 'uuid',
+                               'status': 'status',
+                               'instance_uuid': 'instance_uuid'},
+                  'service_instances': {'instance_uuid': 'uuid',
+                                        'status': 'status'},
+                  'function_instances': {'instance_uuid': 'uuid',
+                                         'status': 'status'},
+                  'slice_instances': {'instance_uuid': 'uuid'},
+                  'test_results': {'uuid': 'uuid',
+                                   'status': 'status',
+                                   'instance_uuid': 'instance_uuid'}}
+
+# Per collection, the statuses, in lower case, after which a record
+# doesn't change anymore
+MIRROR_FINAL_STATUSES = {'requests': ['ready', 'error'],
+                         'service_instances': ['terminated', 'error'],
+                         'function_instances': ['terminated', 'error'],
+                         'slice_instances': ['terminated', 'error'],
+                         'test_results': ['passed', 'failed', 'error',
+                                          'cancelled']}
+
+# Number of records written per transaction
+MIRROR_BATCH = 1000
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS records (
+           collection TEXT,
+           uuid TEXT,
+           status TEXT,
+           created_at TEXT,
+           updated_at TEXT,
+           instance_uuid TEXT,
+           record TEXT,
+           PRIMARY KEY (collection, uuid))""",
+    """CREATE INDEX IF NOT EXISTS records_status
+           ON records (collection, status)""",
+    """CREATE INDEX IF NOT EXISTS records_created_at
+           ON records (collection, created_at)""",
+    """CREATE INDEX IF NOT EXISTS records_instance
+           ON records (collection, instance_uuid)""",
+    """CREATE TABLE IF NOT EXISTS syncs (
+           collection TEXT,
+           synced_at TEXT,
+           full INTEGER,
+           fetched INTEGER,
+           added INTEGER,
+           updated INTEGER,
+           removed INTEGER)"""]
+
+
+def sync_mirror(collections=None, db=MIRROR_DB, full=False, workers=None,
+                callback=None):
+    """Mirrors SP collections into a local SQLite database.
+
+    The mirror keeps the complete records, indexed on uuid, status,
+    created_at and instance_uuid. A sync only writes the records that are
+    new, or whose content changed. As the gatekeeper lists the most
+    recent records first, an incremental sync stops
+    reading a collection after a page without changes, once it has seen
+    all mirrored records that weren't in a final status yet, see
+    MIRROR_FINAL_STATUSES. Unfinished records that a complete read
+    doesn't find anymore are removed. A full sync reads every page and
+    also removes all the other records the SP no longer lists.
+
+    :param collections: (Default value = None) list of collections to
+        sync, see MIRROR_COLLECTIONS. If None, all are synced.
+    :param db: (Default value = MIRROR_DB) path of the mirror.
+    :param full: (Default value = False) read the complete collections.
+    :param workers: (Default value = None) number of collections synced in
+        parallel, env.max_workers if None.
+    :param callback: (Default value = None) callable that is invoked with
+        the collection and its statistics when it is synced.
+
+    :returns: A tuple. [0] is a bool, True if all collections were
+        synced. [1] is a dictionary with per collection the number of
+        'fetched', 'added', 'updated' and 'removed' records, or an error
+        message.
+    """
+
+    collections = collections or MIRROR_COLLECTIONS
+    for collection in collections:
+        if collection not in MIRROR_COLLECTIONS:
+            return False, "Unsupported collection: " + str(collection)
+
+    _connect(db).close()
+
+    def sync(collection):
+        res, stats = _sync_collection(collection, db, full)
+        if callback:
+            callback(collection, stats)
+        return res, stats
+
+    results = helpers.bulk_call(sync, [(collection,)
+                                       for collection in collections],
+                                workers)
+
+    report = {}
+    ok = True
+    for collection, (res, stats) in zip(collections, results):
+        ok = ok and res
+        report[collection] = stats
+
+    return ok, report
+
+
+def iter_mirror(collection, params=None, callback=None, db=MIRROR_DB):
+    """Generator over the summaries of a mirrored collection, as the
+    corresponding iter_ function returns them from the SP.
+
+    :param collection: one of MIRROR_COLLECTIONS.
+    :param params: (Default value = None) dictionary with values that the
+        indexed columns must equal, see MIRROR_FILTERS.
+    :param callback: (Default value = None) callable that is invoked after
+        every helpers.PAGE_SIZE records.
+    :param db: (Default value = MIRROR_DB) path of the mirror.
+
+    :raises RequestError: when there's no mirror of the collection.
+    """
+
+    if collection not in MIRROR_COLLECTIONS:
+        raise helpers.RequestError(None, "Unsupported collection: " +
+                                   str(collection))
+
+    if not os.path.exists(db):
+        raise helpers.RequestError(None, "No mirror found at " + db +
+                                   ". Use tng-cli sync")
+
+    clauses = ["collection = ?"]
+    values = [collection]
+    columns = set(MIRROR_FILTERS[collection].values())
+    for column, value in sorted((params or {}).items()):
+        if column not in columns:
+            raise helpers.RequestError(None, "Unsupported filter: " +
+                                       str(column))
+        clauses.append(column + " = ?")
+        values.append(value)
+
+    formatter = _FORMATTERS[collection]
+
+    conn = _connect(db)
+    try:
+        count = 0
+        for row in conn.execute("SELECT record FROM records WHERE " +
+                                " AND ".join(clauses) +
+                                " ORDER BY created_at DESC, uuid", values):
+            yield formatter(json.loads(row[0]))
+            count = count + 1
+            if callback and count % helpers.PAGE_SIZE == 0:
+                callback()
+    finally:
+        conn.close()
+
+
+def get_mirror_info(db=MIRROR_DB):
+    """Returns info on the content of the local mirror.
+
+    :param db: (Default value = MIRROR_DB) path of the mirror.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        dictionaries with per collection the number of 'records', the
+        newest 'created_at' and the time and kind of the last sync.
+    """
+
+    if not os.path.exists(db):
+        return False, "No mirror found at " + db
+
+    conn = _connect(db)
+    try:
+        info = []
+        for collection in MIRROR_COLLECTIONS:
+            records, newest = conn.execute(
+                "SELECT COUNT(*), MAX(created_at) FROM records "
+                "WHERE collection = ?", (collection,)).fetchone()
+            last = conn.execute(
+                "SELECT synced_at, full FROM syncs WHERE collection = ? "
+                "ORDER BY synced_at DESC LIMIT 1", (collection,)).fetchone()
+            info.append({'collection': collection,
+                         'records': records,
+                         'created_at': newest,
+                         'synced_at': last[0] if last else None,
+                         'sync': (('full' if last[1] else 'incremental')
+                                  if last else None)})
+    finally:
+        conn.close()
+
+    return True, info
+
+
+_URLS = {'requests': 'request_api',
+         'service_instances': 'service_instance_api',
+         'function_instances': 'function_instance_api',
+         'slice_instances': 'slice_instance_api',
+         'test_results': 'test_results_api'}
+
+_FORMATTERS = {'requests': _format_request,
+               'service_instances': _format_service_instance,
+               'function_instances': _format_function_instance,
+               'slice_instances': _format_slice_instance,
+               'test_results': _format_test_result}
+
+
+def _sync_collection(collection, db, full):
+    """ Reads a collection from the SP and writes the changes to the
+    mirror. """
+
+    stats = {'fetched': 0, 'added': 0, 'updated': 0, 'removed': 0}
+    url = getattr(env, _URLS[collection])
+    formatter = _FORMATTERS[collection]
+
+    conn = _connect(db)
+    try:
+        known = {}
+        unfinished = set()
+        finals = MIRROR_FINAL_STATUSES[collection]
+        for uuid, status, stored in conn.execute(
+                "SELECT uuid, status, record FROM records "
+                "WHERE collection = ?", (collection,)):
+            known[uuid] = (status, stored)
+            if str(status).lower() not in finals:
+                unfinished.add(uuid)
+        seen = set()
+        batch = []
+        changed = 0
+        complete = False
+
+        try:
+            for record in helpers.iter_pages(url):
+                stats['fetched'] = stats['fetched'] + 1
+
+                row = _to_row(collection, record, formatter)
+                seen.add(row[1])
+                if row[1] not in known:
+                    stats['added'] = stats['added'] + 1
+                    batch.append(row)
+                elif known[row[1]] != (row[2], row[6]):
+                    stats['updated'] = stats['updated'] + 1
+                    batch.append(row)
+
+                if len(batch) >= MIRROR_BATCH:
+                    _write(conn, batch)
+                    batch = []
+
+                # end of a page
+                if stats['fetched'] % helpers.PAGE_SIZE == 0:
+                    page_changes = stats['added'] + stats['updated']
+                    # unfinished records may have changed on later pages
+                    if not full and page_changes == changed and \
+                            unfinished <= seen:
+                        break
+                    changed = page_changes
+            else:
+                complete = True
+        except helpers.RequestError as e:
+            _write(conn, batch)
+            LOG.debug("Syncing " + collection + " failed: " + str(e))
+            return False, e.text
+
+        _write(conn, batch)
+
+        # a complete read also shows which unfinished records are gone, so
+        # they don't keep later incremental syncs from stopping early
+        if full or complete:
+            gone = [(collection, uuid) for uuid in
+                    (known if full else unfinished)
+                    if uuid not in seen]
+            with conn:
+                conn.executemany("DELETE FROM records WHERE collection = ? "
+                                 "AND uuid = ?", gone)
+            stats['removed'] = len(gone)
+
+        with conn:
+            conn.execute("INSERT INTO syncs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (collection,
+                          datetime.utcnow().isoformat(),
+                          int(full),
+                          stats['fetched'],
+                          stats['added'],
+                          stats['updated'],
+                          stats['removed']))
+    finally:
+        conn.close()
+
+    LOG.debug("Synced " + collection + ": " + str(stats))
+
+    return True, stats
+
+
+def _to_row(collection, record, formatter):
+    """ Translates a record of the SP into a row of the records table. """
+
+    summary = formatter(dict(record))
+
+    return (collection,
+            record.get('uuid', record.get('id')),
+            summary.get('status', record.get('status',
+                                             record.get('nsi-status'))),
+            record.get('created_at'),
+            record.get('updated_at'),
+            summary.get('instance_uuid') or None,
+            json.dumps(record, sort_keys=True))
+
+
+def _write(conn, rows):
+    """ Writes a batch of rows in a single transaction. """
+
+    if not rows:
+        return
+
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO records VALUES "
+                         "(?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def _connect(db):
+    """ Opens the mirror, creating the schema when needed. """
+
+    conn = sqlite3.connect(db, timeout=30)
+    with conn:
+        for statement in _SCHEMA:
+            conn.execute(statement)
+
+    return conn
@@ -0,0 +1,348 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+"""A local stand-in for the SP, serving synthetic data for benchmarks."""
+
+import json
+import logging
+import multiprocessing
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+LOG = logging.getLogger(__name__)
+
+# Number of records served per collection
+MOCK_SIZES = {'packages': 100,
+              'services': 100,
+              'functions': 200,
+              'service_instances': 100,
+              'function_instances': 200,
+              'requests': 500,
+              'sla_templates': 50,
+              'agreements': 100,
+              'violations': 1000,
+              'guarantees': 20,
+              'metrics': 100,
+              'vnv_tests': 100,
+              'slice_instances': 20,
+              'test_results': 200}
+
+_NAMESPACE = uuid.UUID('6ba7b811-9dad-11d1-80b4-00c04fd430c8')
+
+
+def mock_uuid(collection, number):
+    """ The uuid of record number of a collection of the mock. """
+
+    return str(uuid.uuid5(_NAMESPACE, collection + '/' + str(number)))
+
+
+class MockServicePlatform(object):
+    """A mock gatekeeper, monitoring manager and analytics engine.
+
+    The mock runs in its own process, so it doesn't take CPU time or
+    memory from the code under test, and serves all components on a single
+    local port. Listings honour the page_size and page_number parameters.
+
+    Use it as a context manager, which points env to the mock and restores
+    the previous SP path and ports on exit::
+
+        with MockServicePlatform({'packages': 1000}, latency=0.01):
+            tnglib.get_packages()
+
+    :param sizes: (Default value = None) number of records per collection,
+        see MOCK_SIZES.
+    :param latency: (Default value = 0) seconds added to every response.
+    :param port: (Default value = 0) port to listen on, a free one if 0.
+    """
+
+    def __init__(self, sizes=None, latency=0, port=0):
+        self.sizes = dict(MOCK_SIZES)
+        self.sizes.update(sizes or {})
+        self.latency = latency
+        self.port = port
+        self.process = None
+        self.previous = None
+
+    @property
+    def url(self):
+        """ Base url of the mock, to use with set_sp_path. """
+
+        return 'http://127.0.0.1'
+
+    def start(self):
+        """ Starts the mock and waits until it accepts requests. """
+
+        ctx = multiprocessing.get_context('spawn')
+        queue = ctx.Queue()
+        self.process = ctx.Process(target=_serve,
+                                   args=(self.sizes, self.latency,
+                                         self.port, queue))
+        self.process.daemon = True
+        self.process.start()
+        self.port = queue.get(timeout=60)
+        LOG.debug("Mock SP listening on port " + str(self.port))
+
+        return self
+
+    def stop(self):
+        """ Stops the mock. """
+
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def __enter__(self):
+        import tnglib.env as env
+
+        self.start()
+        self.previous = (env.sp_path, env.gtk_port, env.monitoring_port,
+                         env.analytics_port)
+        env.set_sp_path(self.url)
+        env.set_ports(self.port, self.port, self.port)
+
+        return self
+
+    def __exit__(self, *args):
+        import tnglib.env as env
+
+        self.stop()
+        sp_path, gtk_port, monitoring_port, analytics_port = self.previous
+        env.set_sp_path(sp_path)
+        env.set_ports(gtk_port, monitoring_port, analytics_port)
+
+
+def _serve(sizes, latency, port, queue):
+    """ Generates the data and serves it until terminated. """
+
+    routes = _generate(sizes)
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            status, body = _route(routes, url.path, parse_qs(url.query))
+            if latency:
+                time.sleep(latency)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', port), Handler)
+    queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def _route(routes, path, query):
+    """ Looks up the reply to a GET, as a status and an encoded body. """
+
+    for prefix in ['/api/v3', '/api/v2']:
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+    path = path.rstrip('/')
+
+    if path == '':
+        return 200, b'{}'
+
+    if path not in routes:
+        return 404, json.dumps({'error': 'Not found'}).encode('utf-8')
+
+    records, encoded = routes[path]
+    if isinstance(records, list) and 'page_size' in query:
+        size = int(query['page_size'][0])
+        number = int(query.get('page_number', ['0'])[0])
+        page = records[size * number:size * (number + 1)]
+        return 200, json.dumps(page).encode('utf-8')
+
+    # complete documents are encoded once
+    if encoded is None:
+        encoded = json.dumps(records).encode('utf-8')
+        routes[path] = (records, encoded)
+
+    return 200, encoded
+
+
+def _generate(sizes):
+    """ Builds the synthetic records, keyed by the path serving them,
+    with room for their encoded form. """
+
+    created_at = '2019-05-01T12:00:00.000+00:00'
+    routes = {}
+
+    def add(path, records):
+        routes[path] = records
+        for record in records:
+            record_uuid = record.get('uuid', record.get('id'))
+            if record_uuid:
+                routes[path + '/' + record_uuid] = record
+
+    add('/packages',
+        [{'uuid': mock_uuid('packages', i),
+          'created_at': created_at,
+          'pd': {'name': 'package-' + str(i), 'version': '1.0',
+                 'vendor': 'eu.5gtango'}}
+         for i in range(sizes['packages'])])
+
+    add('/services',
+        [{'uuid': mock_uuid('services', i),
+          'created_at': created_at,
+          'platform': '5gtango',
+          'nsd': {'name': 'service-' + str(i), 'version': '1.0',
+                  'vendor': 'eu.5gtango',
+                  'network_functions': [{'vnf_id': 'vnf' + str(j),
+                                         'vnf_name': 'function-' + str(j),
+                                         'vnf_version': '1.0'}
+                                        for j in range(3)]}}
+         for i in range(sizes['services'])])
+
+    add('/functions',
+        [{'uuid': mock_uuid('functions', i),
+          'created_at': created_at,
+          'platform': '5gtango',
+          'vnfd': {'name': 'function-' + str(i), 'version': '1.0',
+                   'vendor': 'eu.5gtango'}}
+         for i in range(sizes['functions'])])
+
+    add('/records/services',
+        [{'uuid': mock_uuid('service_instances', i),
+          'created_at': created_at,
+          'instance_name': 'instance-' + str(i),
+          'status': 'normal operation',
+          'descriptor_reference': mock_uuid('services',
+                                            i % max(sizes['services'], 1)),
+          'network_functions': [{'vnfr_id': mock_uuid('function_instances',
+                                                      j)}
+                                for j in range(i * 2, i * 2 + 2)]}
+         for i in range(sizes['service_instances'])])
+
+    add('/records/functions',
+        [{'uuid': mock_uuid('function_instances', i),
+          'created_at': created_at,
+          'status': 'normal operation',
+          'version': '1',
+          'descriptor_reference': mock_uuid('functions',
+                                            i % max(sizes['functions'], 1))}
+         for i in range(sizes['function_instances'])])
+
+    add('/requests',
+        [{'id': mock_uuid('requests', i),
+          'created_at': created_at,
+          'request_type': 'CREATE_SERVICE',
+          'status': 'READY',
+          'instance_uuid': mock_uuid('service_instances',
+                                     i % max(sizes['service_instances'], 1))}
+         for i in range(sizes['requests'])])
+
+    add('/slice-instances',
+        [{'uuid': mock_uuid('slice_instances', i),
+          'created_at': created_at,
+          'name': 'slice-' + str(i),
+          'nst-ref': mock_uuid('slice_templates', i % 5),
+          'nsi-status': 'INSTANTIATED'}
+         for i in range(sizes['slice_instances'])])
+
+    add('/tests/results',
+        [{'uuid': mock_uuid('test_results', i),
+          'created_at': created_at,
+          'instance_uuid': mock_uuid('service_instances',
+                                     i % max(sizes['service_instances'], 1)),
+          'package_id': mock_uuid('packages',
+                                  i % max(sizes['packages'], 1)),
+          'service_uuid': mock_uuid('services',
+                                    i % max(sizes['services'], 1)),
+          'test_uuid': mock_uuid('tests', i % 10),
+          'status': 'PASSED' if i % 4 else 'FAILED'}
+         for i in range(sizes['test_results'])])
+
+    add('/slas/templates',
+        [{'uuid': mock_uuid('sla_templates', i),
+          'created_at': created_at,
+          'slad': {'name': 'sla-' + str(i),
+                   'sla_template': {'service': {
+                       'ns_name': 'service-' + str(i),
+                       'guaranteeTerms': [{'guaranteeID': 'g' + str(i % 5)}]}}}}
+         for i in range(sizes['sla_templates'])])
+
+    agreements = [{'sla_uuid': mock_uuid('sla_templates',
+                                         i % max(sizes['sla_templates'], 1)),
+                   'nsi_uuid': mock_uuid('service_instances', i),
+                   'sla_name': 'sla-' + str(i),
+                   'ns_name': 'service-' + str(i),
+                   'sla_status': 'VALID'}
+                  for i in range(sizes['agreements'])]
+    routes['/slas/agreements'] = {'agreements': agreements}
+
+    routes['/slas/violations'] = [
+        {'sla_uuid': mock_uuid('sla_templates',
+                               i % max(sizes['sla_templates'], 1)),
+         'nsi_uuid': mock_uuid('service_instances',
+                               i % max(sizes['service_instances'], 1)),
+         'violation_time': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                         time.gmtime(1556712000 + i * 60)),
+         'alert_state': 'firing'}
+        for i in range(sizes['violations'])]
+
+    routes['/slas/configurations/guaranteesList'] = {'guaranteeTerms': [
+        {'guaranteeID': 'g' + str(i),
+         'guarantee_name': 'guarantee-' + str(i),
+         'guarantee_operator': '<',
+         'guarantee_threshold': str(i * 10)}
+        for i in range(sizes['guarantees'])]}
+
+    for i in range(sizes['metrics']):
+        routes['/monitoring/data/prometheus/metrics/name/metric-' + str(i)] = {
+            'metrics': {'result': [{'metric': {'job': 'job-' + str(j),
+                                               'instance': 'vdu-' + str(j)},
+                                    'value': [1556712000 + j, str(j)]}
+                                   for j in range(10)]}}
+
+    routes['/monitoring/data/passive-monitoring-tests'] = {'results': [
+        {'test_id': mock_uuid('vnv_tests', i),
+         'service_id': mock_uuid('service_instances',
+                                 i % max(sizes['service_instances'], 1)),
+         'created': created_at,
+         'terminated': created_at,
+         'data': {'metric': 'metric-' + str(i % 10), 'value': i}}
+        for i in range(sizes['vnv_tests'])]}
+
+    return dict((path, (records, None)) for path, records in routes.items())
@@ -270,6 +270,27 @@ def get_metric(metric_name):
     :returns: A list. [0] is a bool with the result. [1] is a list of 
         dictionaries. Each dictionary contains a metric.
     """
+    res, results = _get_metric_results(metric_name)
+
+    if not res:
+        return False, results
+
+    temp_res = []
+
+    for res in results:
+        dic = {'job': res['metric']['job'],
+               'instance': res['metric']['instance'],
+               'value': res['value'][1]
+                }
+        LOG.debug(str(dic))
+        if not dic in temp_res:
+            temp_res.append(dic)
+
+    return True, temp_res
+
+def _get_metric_results(metric_name):
+    """ Returns the raw Prometheus results for a metric name. """
+
     resp=requests.get(env.monitor_api+'/prometheus/metrics/name/'+metric_name,
                         timeout=env.timeout,
                         headers=env.header)
@@ -281,19 +302,8 @@ def get_metric(metric_name):
 
     templates = json.loads(resp.text)
 
-    temp_res = []
-
     if 'metrics' in templates and  'result' in templates['metrics']:
-        for res in templates['metrics']['result']:
-            dic = {'job': res['metric']['job'],
-                   'instance': res['metric']['instance'],
-                   'value': res['value'][1]
-                    }
-            LOG.debug(str(dic))
-            if not dic in temp_res:
-                temp_res.append(dic)
-
-        return True, temp_res
+        return True, templates['metrics']['result']
     else:
         LOG.debug("Request returned with " + (json.dumps(templates)))
         error = "VDUs not found"
@@ -33,10 +33,21 @@
 import requests
 import logging
 import json
+import time
+from collections import Counter
 import tnglib.env as env
+from tnglib import helpers
+from tnglib.results import query_test_results
 
 LOG = logging.getLogger(__name__)
 
+# Seconds between two listings of the test plans by watch_test_plans
+PLANS_WATCH_INTERVAL = 10
+
+# Statuses after which a test plan doesn't change anymore
+PLAN_FINAL_STATUSES = ['COMPLETED', 'CANCELLED', 'ERROR', 'REJECTED',
+                       'NOT_CONFIRMED']
+
 def get_test_plans():
     """Returns info on all available test plans.
 
@@ -97,4 +108,204 @@ def get_test_plan(uuid):
                   (str(resp.status_code)))
         return False, json.loads(resp.text)
 
-    return True, json.loads(resp.text)
\ No newline at end of file
+    return True, json.loads(resp.text)
+
+
+def watch_test_plans(plan_uuids=None, interval=PLANS_WATCH_INTERVAL,
+                     timeout=None, callback=None, progress=None):
+    """Follows test plans until they are all finished.
+
+    Every interval seconds, the status of all plans is read with a single
+    listing. Status changes are reported with the time they were seen,
+    and finished plans with their duration and their test result. The
+    duration runs from the created_at to the updated_at of the plan,
+    with the time the watch first saw the plan and the time it saw it
+    finished in their place when the SP doesn't provide them. Plans that
+    finished without a test_result_uuid are linked to the most recent
+    result of their service and test since the plan began, from the
+    local results index. The index is read once when the watch starts,
+    and brought up to date at most once per listing.
+
+    :param plan_uuids: (Default value = None) uuids of the plans to
+        follow. If None, all plans that aren't finished when the watch
+        starts are followed, as well as the plans created while they
+        run. Uuids that aren't in the first listing are reported with
+        the status 'NOT_FOUND' and not waited for.
+    :param interval: (Default value = PLANS_WATCH_INTERVAL) seconds
+        between two listings.
+    :param timeout: (Default value = None) stop after this many seconds.
+    :param callback: (Default value = None) callable that is invoked with
+        a dictionary with the 'uuid', 'previous' and 'status' of a plan,
+        the 'duration' and 'test_result_uuid' once it is finished, at
+        every status change.
+    :param progress: (Default value = None) callable that is invoked
+        after every listing with a dictionary with the number of
+        'plans', 'finished' plans and plans per status, and the
+        'elapsed' seconds.
+
+    :returns: A tuple. [0] is a bool, True if all plans finished. [1] is
+        a list of dictionaries with the 'uuid', 'status', 'duration',
+        'transitions' and 'test_result_uuid' of every plan, or an error
+        message.
+    """
+
+    start = time.time()
+    tracked = {}
+    ignored = set()
+    missing = []
+    wanted = set(plan_uuids or [])
+
+    # prefetch the results index
+    query_test_results(limit=1)
+
+    first = True
+    while True:
+        try:
+            res, plans = helpers.get_paged(env.test_plans_api)
+        except requests.exceptions.RequestException as e:
+            res, plans = False, str(e)
+
+        if not res:
+            LOG.debug("Listing the test plans failed: " + str(plans))
+            if first:
+                return False, plans
+        else:
+            now = time.time()
+            refreshed = False
+
+            if first and wanted:
+                listed = set(plan.get('uuid') for plan in plans)
+                missing = sorted(wanted - listed)
+                wanted = wanted - set(missing)
+                for plan_uuid in missing:
+                    LOG.debug("Test plan " + plan_uuid + " not found")
+                    if callback:
+                        callback({'uuid': plan_uuid,
+                                  'previous': None,
+                                  'status': 'NOT_FOUND'})
+
+            for plan in plans:
+                plan_uuid = plan.get('uuid')
+                status = plan.get('test_status')
+                state = tracked.get(plan_uuid)
+
+                if state is None:
+                    if plan_uuid in ignored:
+                        continue
+                    if (wanted and plan_uuid not in wanted) or \
+                            (not wanted and first and
+                             status in PLAN_FINAL_STATUSES):
+                        ignored.add(plan_uuid)
+                        continue
+                    created_at = helpers.parse_timestamp(
+                        plan.get('created_at'))
+                    state = {'uuid': plan_uuid,
+                             'service_uuid': plan.get('service_uuid'),
+                             'test_uuid': plan.get('test_uuid'),
+                             'status': None,
+                             'first_seen': now,
+                             'created_at': created_at.timestamp()
+                             if created_at else None,
+                             'duration': None,
+                             'transitions': 0,
+                             'test_result_uuid': None}
+                    tracked[plan_uuid] = state
+
+                if status == state['status']:
+                    continue
+
+                event = {'uuid': plan_uuid,
+                         'previous': state['status'],
+                         'status': status}
+                state['status'] = status
+                state['transitions'] = state['transitions'] + 1
+
+                if status in PLAN_FINAL_STATUSES:
+                    state['duration'] = _plan_duration(plan, state, now,
+                                                       event['previous'])
+                    result_uuid = plan.get('test_result_uuid')
+                    if not result_uuid and status == 'COMPLETED':
+                        result_uuid = _find_plan_result(state,
+                                                        not refreshed)
+                        refreshed = True
+                    state['test_result_uuid'] = result_uuid
+                    event['duration'] = state['duration']
+                    event['test_result_uuid'] = result_uuid
+
+                if callback:
+                    callback(event)
+
+            first = False
+
+            if progress:
+                counts = Counter(state['status']
+                                 for state in tracked.values())
+                summary = {'plans': len(tracked),
+                           'finished': sum(counts[status] for status
+                                           in PLAN_FINAL_STATUSES),
+                           'elapsed': round(now - start, 1)}
+                summary.update(counts)
+                progress(summary)
+
+        done = all(state['status'] in PLAN_FINAL_STATUSES
+                   for state in tracked.values())
+        if done and set(tracked) >= wanted:
+            break
+
+        if timeout is not None and time.time() - start + interval > timeout:
+            break
+
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            break
+
+    report = [{'uuid': plan_uuid,
+               'status': 'NOT_FOUND',
+               'duration': None,
+               'transitions': 0,
+               'test_result_uuid': None} for plan_uuid in missing]
+    for state in tracked.values():
+        report.append({'uuid': state['uuid'],
+                       'status': state['status'],
+                       'duration': state['duration'],
+                       'transitions': state['transitions'],
+                       'test_result_uuid': state['test_result_uuid']})
+
+    finished = all(row['status'] in PLAN_FINAL_STATUSES for row in report)
+
+    return finished, report
+
+
+def _plan_duration(plan, state, now, previous):
+    """ Seconds a finished plan ran, None if that isn't known. """
+
+    began = state['created_at']
+    if began is None:
+        # seen finished right away, without timestamps of the SP
+        if previous is None:
+            return None
+        began = state['first_seen']
+
+    ended = helpers.parse_timestamp(plan.get('updated_at'))
+    ended = ended.timestamp() if ended else now
+
+    return round(max(ended - began, 0), 1)
+
+
+def _find_plan_result(state, refresh):
+    """ uuid of the most recent result of the service and test of a plan
+    since it began, None if there is none. """
+
+    since = state['created_at'] or state['first_seen']
+    res, found = query_test_results(service_uuid=state['service_uuid'],
+                                    since=since,
+                                    refresh=refresh)
+    if not res:
+        return None
+
+    for result in found:
+        if result.get('test_uuid') == state['test_uuid']:
+            return result.get('uuid')
+
+    return None
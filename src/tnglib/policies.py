@@ -37,6 +37,7 @@ import time
 import os
 import yaml
 import tnglib.env as env
+from tnglib import helpers
 
 LOG = logging.getLogger(__name__)
 
@@ -102,15 +103,13 @@ def create_policy(path):
 
     ext = os.path.splitext(path)[1]
 
-    if ext == '.json':
-        template_raw = open(path, 'r')
-        template = json.load(template_raw)
-    elif ext in ['.yaml', '.yml']:
-        template_raw = open(path, 'rb')
-        template = yaml.load(template_raw)
-    else:
+    if ext not in ['.json', '.yaml', '.yml']:
         return False, "Provide json or yaml file"
 
+    res, template = helpers.load_descriptor(path)
+    if not res:
+        return False, template
+
     resp = requests.post(env.policy_api,
                          json=template,
                          timeout=env.timeout)
@@ -0,0 +1,280 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+
+import logging
+import math
+import re
+from tnglib import helpers
+
+LOG = logging.getLogger(__name__)
+
+# Operators of a filter condition, longest first
+FILTER_OPERATORS = ['!=', '>=', '<=', '=', '>', '<', '~']
+
+_CONDITION = re.compile(r'^\s*([\w.\-]+)\s*(' +
+                        '|'.join(re.escape(op) for op in FILTER_OPERATORS) +
+                        r')\s*(.*?)\s*$')
+
+_NUMBER = re.compile(r'^\s*[+-]?(\d+(\.\d*)?|\.\d+)\s*$')
+
+
+def parse_filter(expression):
+    """Parses a filter expression like 'status=ERROR,created_at>7d'.
+
+    An expression is a comma separated list of conditions, which must all
+    hold. A condition is a field, an operator and a value. Fields of
+    nested dictionaries are addressed with dots, e.g. 'nsd.name'. The
+    operators are =, !=, <, <=, >, >= and ~, which matches a regular
+    expression. Values that are plain decimal numbers, like '-2.5', are
+    compared as numbers, and values that are timestamps or durations
+    relative to now, like '24h', are compared as timestamps by <, <=, >
+    and >=. All other values are compared as text.
+
+    :param expression: the filter expression. None or '' filters nothing.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        (field, operator, value) tuples, or an error message.
+    """
+
+    conditions = []
+    for part in (expression or '').split(','):
+        if not part.strip():
+            continue
+        match = _CONDITION.match(part)
+        if not match:
+            return False, "Unsupported filter condition: " + part.strip()
+        field, operator, value = match.groups()
+        if operator == '~':
+            try:
+                re.compile(value)
+            except re.error as e:
+                return False, "Unsupported expression " + value + ": " + \
+                    str(e)
+        conditions.append((field, operator, value))
+
+    return True, conditions
+
+
+def filter_params(conditions, fields):
+    """Translates the filter conditions the gatekeeper can evaluate into
+    query parameters.
+
+    Only equality conditions on the given fields are translated. The
+    records should still be filtered with query_records, as not every
+    gatekeeper release honours the parameters.
+
+    :param conditions: list of conditions, see parse_filter.
+    :param fields: dictionary with, per field of the records, the query
+        parameter that filters on it.
+
+    :returns: a dictionary with query parameters.
+    """
+
+    params = {}
+    for field, operator, value in conditions or []:
+        if operator == '=' and field in (fields or {}):
+            params[fields[field]] = value
+
+    return params
+
+
+def query_records(records, conditions=None, sort=None, columns=None):
+    """Filters, sorts and projects an iterable of records.
+
+    Filtering and projection are applied while the records are consumed.
+    Sorting needs all records that pass the filter.
+
+    :param records: iterable of dictionaries, e.g. from iter_requests.
+    :param conditions: (Default value = None) list of conditions, see
+        parse_filter.
+    :param sort: (Default value = None) comma separated fields to sort on.
+        A field prefixed with '-' sorts in descending order. Records
+        without the field come last.
+    :param columns: (Default value = None) comma separated fields to keep.
+
+    :returns: a generator over the resulting records.
+    """
+
+    predicate = compile_filter(conditions)
+    if predicate is not None:
+        records = (record for record in records if predicate(record))
+
+    if sort:
+        records = _sort(records, _split(sort))
+
+    if columns:
+        fields = _split(columns)
+        records = ({field: _get_field(record, field) for field in fields}
+                   for record in records)
+
+    return records
+
+
+def compile_filter(conditions):
+    """Compiles filter conditions into a single predicate.
+
+    The values of the conditions are parsed once, so evaluating the
+    predicate only parses the fields of the record.
+
+    :param conditions: list of conditions, see parse_filter.
+
+    :returns: a callable that takes a record and returns whether it
+        matches all conditions, or None if there are no conditions.
+    """
+
+    if not conditions:
+        return None
+
+    checks = [_compile_condition(*condition) for condition in conditions]
+
+    def predicate(record):
+        for check in checks:
+            if not check(record):
+                return False
+        return True
+
+    return predicate
+
+
+def _compile_condition(field, operator, value):
+    """ Predicate of a single condition. """
+
+    if operator == '~':
+        pattern = re.compile(value)
+
+        def check(record):
+            found = _get_field(record, field)
+            return found is not None and \
+                pattern.search(str(found)) is not None
+        return check
+
+    compare = _COMPARISONS[operator]
+
+    number = _to_number(value)
+    if number is not None:
+        def check(record):
+            found = _to_number(_get_field(record, field))
+            if found is None:
+                return operator == '!='
+            return compare(found, number)
+        return check
+
+    if operator not in ['=', '!=']:
+        moment = helpers.parse_since(value)
+        if moment is not None:
+            def check(record):
+                found = helpers.parse_timestamp(_get_field(record, field))
+                return found is not None and compare(found, moment)
+            return check
+
+    def check(record):
+        found = _get_field(record, field)
+        if found is None:
+            return operator == '!='
+        return compare(str(found), value)
+    return check
+
+
+_COMPARISONS = {'=': lambda left, right: left == right,
+                '!=': lambda left, right: left != right,
+                '<': lambda left, right: left < right,
+                '<=': lambda left, right: left <= right,
+                '>': lambda left, right: left > right,
+                '>=': lambda left, right: left >= right}
+
+
+def _get_field(record, field):
+    """ Value of a field, following dots into nested dictionaries. """
+
+    if field in record:
+        return record[field]
+
+    value = record
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+
+    return value
+
+
+def _to_number(value):
+    """ value as a float, None if it isn't a number. """
+
+    if isinstance(value, bool) or value is None:
+        return None
+
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+
+    # only plain decimals, float() also takes 'nan', 'inf' and '1e3'
+    if isinstance(value, str) and _NUMBER.match(value):
+        return float(value)
+
+    return None
+
+
+def _sort(records, fields):
+    """ Sorted list of records, by multiple fields. """
+
+    records = list(records)
+
+    # stable sorts, least significant field first
+    for field in reversed(fields):
+        reverse = field.startswith('-')
+        field = field.lstrip('-+')
+        present = [record for record in records
+                   if _get_field(record, field) is not None]
+        missing = [record for record in records
+                   if _get_field(record, field) is None]
+        present.sort(key=lambda record: _sort_key(_get_field(record, field)),
+                     reverse=reverse)
+        records = present + missing
+
+    return records
+
+
+def _sort_key(value):
+    """ Numbers sort before and apart from texts. """
+
+    number = _to_number(value)
+    if number is not None:
+        return (0, number, '')
+
+    return (1, 0, str(value))
+
+
+def _split(fields):
+    """ List of the fields in a comma separated string. """
+
+    return [field.strip() for field in fields.split(',') if field.strip()]
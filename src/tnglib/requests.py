@@ -36,10 +36,35 @@ import json
 import time
 import os
 import yaml
+import threading
 import tnglib.env as env
+from collections import OrderedDict
+from tnglib import helpers
+from tnglib import timings
 
 LOG = logging.getLogger(__name__)
 
+# Seconds between two status polls of a batch of requests
+BATCH_POLL_INTERVAL = 5
+
+# Statuses after which a request doesn't change anymore
+FINAL_STATUSES = ['READY', 'ERROR']
+
+# Consecutive failed polls after which a request of a batch is given up
+BATCH_POLL_RETRIES = 10
+
+# Fields of the request summaries the gatekeeper filters on, and their
+# query parameter
+REQUEST_FILTERS = {'status': 'status',
+                   'request_type': 'request_type',
+                   'instance_uuid': 'instance_uuid'}
+
+# Number of submitted requests whose timers are kept until they're followed
+REQUEST_TIMERS = 1000
+
+_timers = OrderedDict()
+_timers_lock = threading.Lock()
+
 
 def get_requests():
     """Returns info on all requests.
@@ -67,21 +92,44 @@ def get_requests():
 
     req_res = []
     for req in requests_dic:
-        dic = {'request_uuid': req['id'],
-               'request_type': req['request_type'],
-               'status': req['status'],
-               'created_at': req['created_at'],
-               'instance_uuid': req['instance_uuid']}
-
-        if dic['instance_uuid'] is None:
-            dic['instance_uuid'] = ''
-
+        dic = _format_request(req)
         LOG.debug(str(dic))
         req_res.append(dic)
 
     return True, req_res
 
 
+def iter_requests(callback=None, params=None):
+    """Generator over all requests, reading them page by page.
+
+    :param callback: (Default value = None) callable that is invoked after
+        each page, see helpers.iter_pages.
+    :param params: (Default value = None) dictionary with query parameters
+        that filter the listing, see filter_params.
+
+    :raises RequestError: when the gatekeeper replies with an error.
+    """
+
+    for req in helpers.iter_pages(env.request_api, params,
+                                  callback=callback):
+        yield _format_request(req)
+
+
+def _format_request(req):
+    """ Summary of a request as returned by get_requests. """
+
+    dic = {'request_uuid': req['id'],
+           'request_type': req['request_type'],
+           'status': req['status'],
+           'created_at': req['created_at'],
+           'instance_uuid': req['instance_uuid']}
+
+    if dic['instance_uuid'] is None:
+        dic['instance_uuid'] = ''
+
+    return dic
+
+
 def get_request(request_uuid):
     """Returns info on a specific request.
 
@@ -211,6 +259,256 @@ def slice_terminate(instance_uuid):
 
     return _post_request(data)
 
+def slice_batch_instantiate(slices, failure_threshold=None, rollback=True,
+                            interval=BATCH_POLL_INTERVAL, timeout=None,
+                            workers=None, callback=None):
+    """Instantiates a batch of slices and waits until they are all done.
+
+    The requests are submitted in parallel and followed in a single
+    polling loop. As soon as more than failure_threshold slices failed,
+    the slices of the batch that did get instantiated are terminated
+    again. Requests that are still running at that point, or that timed
+    out, are followed until they are done, for at most another timeout,
+    and their slices are terminated as well.
+
+    :param slices: list of dictionaries with the 'template' uuid and
+        optionally a 'name' and 'description' for each slice instance.
+    :param failure_threshold: (Default value = None) number of slices
+        that may fail, or a fraction of the batch if below 1. If None,
+        failures never cause a rollback.
+    :param rollback: (Default value = True) terminate the instantiated
+        slices when the failure threshold is crossed.
+    :param interval: (Default value = BATCH_POLL_INTERVAL) seconds between
+        two status polls.
+    :param timeout: (Default value = None) seconds after which requests
+        that aren't done count as failed.
+    :param workers: (Default value = None) number of parallel requests,
+        env.max_workers if None.
+    :param callback: (Default value = None) callable that is invoked with
+        the result dictionary of a slice whenever its status changes.
+
+    :returns: A tuple. [0] is a bool, True if the failure threshold was
+        not crossed. [1] is a list of dictionaries with the 'template',
+        'name', 'request_uuid', 'instance_uuid', 'status', 'submission'
+        (seconds to submit the request), 'duration' (seconds until the
+        request was done), 'error' and 'rolled_back' of each slice, or an
+        error message.
+    """
+
+    for number, slc in enumerate(slices):
+        if not isinstance(slc, dict) or not slc.get('template'):
+            return False, "Slice " + str(number) + " of the batch has " \
+                "no template"
+
+    batch = []
+    calls = []
+    for number, slc in enumerate(slices):
+        name = slc.get('name') or 'slice-' + str(number)
+        description = slc.get('description') or name
+        batch.append({'template': slc['template'], 'name': name})
+        calls.append((slc['template'], name, description))
+
+    _submit_batch(slice_instantiate, batch, calls, workers, callback)
+
+    if failure_threshold is not None and failure_threshold < 1:
+        failure_threshold = failure_threshold * len(batch)
+
+    def crossed(results):
+        failed = [res for res in results if res['status'] == 'ERROR']
+        return failure_threshold is not None and \
+            len(failed) > failure_threshold
+
+    track_requests(batch, interval, timeout, workers, callback,
+                   stop=crossed if rollback else None)
+
+    if not crossed(batch):
+        return True, batch
+
+    LOG.debug("Failure threshold crossed, batch is rolled back")
+
+    if rollback:
+        # requests that are still running, or timed out, may still bring
+        # up a slice, so they are followed until they are done
+        unfinished = [res for res in batch if res['request_uuid'] and
+                      (res.get('timed_out') or
+                       res['status'] not in FINAL_STATUSES)]
+        settled = [{'request_uuid': res['request_uuid'],
+                    'submitted_at': res['submitted_at'],
+                    'instance_uuid': res['instance_uuid'],
+                    'status': 'NEW'} for res in unfinished]
+        track_requests(settled, interval, timeout, workers)
+        for res, settle in zip(unfinished, settled):
+            res['instance_uuid'] = settle['instance_uuid']
+            if settle['status'] == 'READY':
+                res['status'] = 'READY'
+                res['duration'] = settle['duration']
+            elif settle['status'] not in FINAL_STATUSES or \
+                    settle.get('timed_out'):
+                res['status'] = 'ERROR'
+                res['error'] = 'Rollback failed: request still running'
+            else:
+                res['status'] = 'ERROR'
+                res['error'] = res['error'] or settle['error']
+
+        ready = [res for res in batch
+                 if res['status'] == 'READY' and res['instance_uuid']]
+        terminations = [dict() for res in ready]
+        _submit_batch(slice_terminate, terminations,
+                      [(res['instance_uuid'],) for res in ready], workers)
+        track_requests(terminations, interval, timeout, workers)
+        for res, termination in zip(ready, terminations):
+            res['rolled_back'] = termination['status'] == 'READY'
+            if not res['rolled_back']:
+                res['error'] = 'Rollback failed: ' + \
+                    str(termination['error'])
+
+    return False, batch
+
+
+def slice_batch_terminate(instance_uuids, interval=BATCH_POLL_INTERVAL,
+                          timeout=None, workers=None, callback=None):
+    """Terminates a batch of slices and waits until they are all done.
+
+    :param instance_uuids: list of slice instance uuids.
+    :param interval: (Default value = BATCH_POLL_INTERVAL) seconds between
+        two status polls.
+    :param timeout: (Default value = None) seconds after which requests
+        that aren't done count as failed.
+    :param workers: (Default value = None) number of parallel requests,
+        env.max_workers if None.
+    :param callback: (Default value = None) see slice_batch_instantiate.
+
+    :returns: A tuple. [0] is a bool, True if all slices were terminated.
+        [1] is a list of dictionaries, see slice_batch_instantiate.
+    """
+
+    batch = [{'instance_uuid': uuid} for uuid in instance_uuids]
+    _submit_batch(slice_terminate, batch,
+                  [(uuid,) for uuid in instance_uuids], workers, callback)
+    track_requests(batch, interval, timeout, workers, callback)
+
+    return all(res['status'] == 'READY' for res in batch), batch
+
+
+def track_requests(batch, interval=BATCH_POLL_INTERVAL, timeout=None,
+                   workers=None, callback=None, stop=None):
+    """Polls a batch of requests until they all reached READY or ERROR.
+
+    Only the requests that aren't done yet are polled, in parallel, in
+    every iteration. Requests that time out, or that couldn't be polled
+    BATCH_POLL_RETRIES times in a row, are set to ERROR. Timed out ones
+    are also marked with 'timed_out', as they may still finish.
+
+    :param batch: list of dictionaries with a 'request_uuid', a
+        'submitted_at' timestamp and a 'status', as made by the batch
+        functions. They are updated in place.
+    :param interval: (Default value = BATCH_POLL_INTERVAL) seconds between
+        two status polls.
+    :param timeout: (Default value = None) seconds after which requests
+        that aren't done count as failed.
+    :param workers: (Default value = None) number of parallel requests,
+        env.max_workers if None.
+    :param callback: (Default value = None) callable that is invoked with
+        a dictionary of the batch whenever its status changes.
+    :param stop: (Default value = None) callable that is invoked with the
+        batch after every poll. Polling stops early when it returns True,
+        leaving the unfinished requests in their last status.
+
+    :returns: the batch.
+    """
+
+    start = time.time()
+    failures = {}
+
+    while True:
+        pending = [res for res in batch
+                   if res['status'] not in FINAL_STATUSES]
+        if not pending:
+            break
+
+        if timeout is not None and time.time() - start > timeout:
+            for res in pending:
+                res['error'] = 'Timed out in status ' + str(res['status'])
+                res['status'] = 'ERROR'
+                res['timed_out'] = True
+                if callback:
+                    callback(res)
+            break
+
+        polls = helpers.bulk_call(get_request,
+                                  [(res['request_uuid'],) for res in pending],
+                                  workers)
+        now = time.time()
+        for res, (ok, request) in zip(pending, polls):
+            if not ok or not isinstance(request, dict):
+                LOG.debug("Polling " + res['request_uuid'] + " failed")
+                failures[id(res)] = failures.get(id(res), 0) + 1
+                if failures[id(res)] >= BATCH_POLL_RETRIES:
+                    res['error'] = 'Request unreachable: ' + str(request)
+                    res['status'] = 'ERROR'
+                    if callback:
+                        callback(res)
+                continue
+            failures.pop(id(res), None)
+            status = request.get('status')
+            _get_timer(res['request_uuid'], request).update(status, now)
+            if status in FINAL_STATUSES:
+                _drop_timer(res['request_uuid'])
+            if status == res['status']:
+                continue
+            res['status'] = status
+            if request.get('instance_uuid'):
+                res['instance_uuid'] = request['instance_uuid']
+            if status in FINAL_STATUSES:
+                res['duration'] = round(now - res['submitted_at'], 3)
+            if status == 'ERROR':
+                res['error'] = request.get('error')
+            if callback:
+                callback(res)
+
+        if stop and stop(batch):
+            break
+
+        if [res for res in batch if res['status'] not in FINAL_STATUSES]:
+            time.sleep(interval)
+
+    return batch
+
+
+def _submit_batch(func, batch, calls, workers=None, callback=None):
+    """ Submits the requests of a batch in parallel, recording how long
+    each submission took. """
+
+    def submit(res, *args):
+        res['submitted_at'] = time.time()
+        result = func(*args)
+        res['submission'] = round(time.time() - res['submitted_at'], 3)
+        return result
+
+    submissions = helpers.bulk_call(submit,
+                                    [(res,) + call
+                                     for res, call in zip(batch, calls)],
+                                    workers)
+
+    for res, (ok, request_uuid) in zip(batch, submissions):
+        res.setdefault('instance_uuid', '')
+        res.setdefault('submission', None)
+        res['duration'] = None
+        res['error'] = None
+        res['rolled_back'] = False
+        if ok:
+            res['request_uuid'] = request_uuid
+            res['status'] = 'NEW'
+        else:
+            res['request_uuid'] = ''
+            res['status'] = 'ERROR'
+            res['error'] = str(request_uuid)
+        if callback:
+            callback(res)
+
+    return batch
+
+
 def service_scale_out(instance_uuid, vnfd_uuid, number_inst=1, vim_uuid=None):
     """
     Makes a request to scale out a service.
@@ -291,9 +589,79 @@ def service_migrate(instance_uuid, vnf_uuid, vim_uuid):
 
     return _post_request(data)
 
+def wait_for_request(request_uuid, interval=BATCH_POLL_INTERVAL,
+                     timeout=None, callback=None):
+    """Polls a request until it reaches READY or ERROR.
+
+    The time spent in each status and the time until the request is done
+    are recorded in the timings store, see get_timings.
+
+    :param request_uuid: A string. The uuid of the request.
+    :param interval: (Default value = BATCH_POLL_INTERVAL) seconds between
+        two polls.
+    :param timeout: (Default value = None) seconds after which to give up.
+    :param callback: (Default value = None) callable that is invoked with
+        the request dictionary after every poll.
+
+    :returns: A tuple. [0] is a bool, True if the request reached READY.
+        [1] is a dictionary containing the request, or an error message.
+    """
+
+    start = time.time()
+
+    while True:
+        res, request = get_request(request_uuid)
+        if not res:
+            return False, request
+
+        _get_timer(request_uuid, request).update(request['status'])
+        if callback:
+            callback(request)
+
+        if request['status'] in FINAL_STATUSES:
+            _drop_timer(request_uuid)
+            return request['status'] == 'READY', request
+
+        if timeout is not None and time.time() - start > timeout:
+            return False, "Timed out in status " + str(request['status'])
+
+        time.sleep(interval)
+
+
+def _get_timer(request_uuid, request=None):
+    """ Timer of a request, started at its submission when it was
+    submitted by this process. """
+
+    with _timers_lock:
+        timer = _timers.get(request_uuid)
+    if timer is None:
+        request_type = (request or {}).get('request_type')
+        timer = timings._RequestTimer(request_type)
+        _add_timer(request_uuid, timer)
+
+    return timer
+
+
+def _add_timer(request_uuid, timer):
+    """ Keeps the timer of a request, dropping the oldest ones. """
+
+    with _timers_lock:
+        _timers[request_uuid] = timer
+        while len(_timers) > REQUEST_TIMERS:
+            _timers.popitem(last=False)
+
+
+def _drop_timer(request_uuid):
+    """ Forgets the timer of a request that is done. """
+
+    with _timers_lock:
+        _timers.pop(request_uuid, None)
+
+
 def _post_request(data):
     """ Generic request maker. """
 
+    submitted_at = time.time()
     resp = requests.post(env.request_api,
                          json=data,
                          timeout=env.timeout,
@@ -301,10 +669,19 @@ def _post_request(data):
 
     env.set_return_header(resp.headers)
 
+    timings.record_timing('request_submission_seconds',
+                          time.time() - submitted_at,
+                          request_type=data['request_type'],
+                          code=resp.status_code)
+
     if resp.status_code != 201:
         LOG.debug("Request returned with " +
                   (str(resp.status_code)))
         LOG.debug(str(resp.text))
         return False, json.loads(resp.text)
 
-    return True, json.loads(resp.text)['id']
+    request_uuid = json.loads(resp.text)['id']
+    _add_timer(request_uuid,
+               timings._RequestTimer(data['request_type'], submitted_at))
+
+    return True, request_uuid
@@ -33,10 +33,32 @@
 import requests
 import logging
 import json
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 import tnglib.env as env
+from tnglib import helpers
 
 LOG = logging.getLogger(__name__)
 
+# Seconds after which the results index is brought up to date
+RESULTS_INDEX_TTL = 60
+
+# Fields of the test results the index looks up
+RESULTS_INDEX_KEYS = ['instance_uuid', 'service_uuid', 'package_id', 'status']
+
+_index = {'url': None, 'refreshed_at': 0, 'results': {}, 'times': []}
+_index_lock = threading.Lock()
+
+# Fields of the test result summaries the gatekeeper filters on, and their
+# query parameter
+TEST_RESULT_FILTERS = {'status': 'status',
+                       'instance_uuid': 'instance_uuid',
+                       'package_id': 'package_id',
+                       'service_uuid': 'service_uuid',
+                       'test_uuid': 'test_uuid'}
+
 def get_test_results():
     """Returns info on all available tests results.
 
@@ -60,20 +82,42 @@ def get_test_results():
 
     tests_res = []
     for test in tests:
-        dic = {'uuid': test['uuid'],
-               'instance_uuid': test['instance_uuid'],
-               'package_id': test['package_id'],
-               'service_uuid': test['service_uuid'],
-               'test_uuid': test['test_uuid'],
-               #'test_instance_uuid': test['test_instance_uuid'],
-               'status': test['status'],
-               'created_at': test['created_at']}
+        dic = _format_test_result(test)
         LOG.debug(str(dic))
         tests_res.append(dic)
 
     return True, tests_res
 
 
+def iter_test_results(callback=None, params=None):
+    """Generator over all test results, reading them page by page.
+
+    :param callback: (Default value = None) callable that is invoked after
+        each page, see helpers.iter_pages.
+    :param params: (Default value = None) dictionary with query parameters
+        that filter the listing, see filter_params.
+
+    :raises RequestError: when the gatekeeper replies with an error.
+    """
+
+    for test in helpers.iter_pages(env.test_results_api, params,
+                                   callback=callback):
+        yield _format_test_result(test)
+
+
+def _format_test_result(test):
+    """ Summary of a test result as returned by get_test_results. """
+
+    return {'uuid': test['uuid'],
+            'instance_uuid': test['instance_uuid'],
+            'package_id': test['package_id'],
+            'service_uuid': test['service_uuid'],
+            'test_uuid': test['test_uuid'],
+            #'test_instance_uuid': test['test_instance_uuid'],
+            'status': test['status'],
+            'created_at': test['created_at']}
+
+
 def get_test_result(uuid):
     """Returns info on a specific test result.
 
@@ -107,27 +151,308 @@ def get_test_uuid_by_instance_uuid(instance_uuid):
         dictionaries. Each dictionary contains a test_uuid.
     """
 
-    # get current list of tests results
-    resp = requests.get(env.test_results_api,
-                        timeout=env.timeout,
-                        headers=env.header)
+    res, found = get_test_uuids_by_instance_uuids([instance_uuid],
+                                                  refresh=True)
+    if not res:
+        return False, []
 
-    env.set_return_header(resp.headers)
+    return True, found[instance_uuid]
 
-    if resp.status_code != 200:
-        LOG.debug("Request for test results returned with " +
-                  (str(resp.status_code)))
-        return False, []
 
-    tests = json.loads(resp.text)
+def get_test_uuids_by_instance_uuids(instance_uuids, refresh=False):
+    """Returns the uuids of the test results of many service instances.
 
-    tests_uuids = []
+    The results are looked up in the local results index, see
+    find_test_results, so all instances cost a single listing at most.
 
-    for test in tests:
-        if test['instance_uuid'] == instance_uuid:
-            dic = {'uuid': test['uuid']}
+    :param instance_uuids: list of instance uuids.
+    :param refresh: (Default value = False) bring the index up to date
+        first.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a dictionary
+        with per instance uuid a list of dictionaries. Each dictionary
+        contains a test_uuid.
+    """
+
+    with _index_lock:
+        res, mes = _update_index(refresh)
+        if not res:
+            return False, mes
+
+        found = {}
+        for instance_uuid in instance_uuids:
+            uuids = _index['instance_uuid'].get(instance_uuid, set())
+            found[instance_uuid] = [{'uuid': uuid} for uuid in sorted(uuids)]
+
+    return True, found
+
+
+def find_test_results(instance_uuid=None, service_uuid=None, package_id=None,
+                      status=None, refresh=False):
+    """Returns the test results that match all given fields.
+
+    The first call reads all test results into a local index keyed by
+    instance_uuid, service_uuid, package_id and status. After
+    RESULTS_INDEX_TTL seconds, or with refresh, the index is rebuilt from
+    the complete listing, which also drops the results that were deleted
+    on the SP.
+
+    :param instance_uuid: (Default value = None) uuid of a service instance.
+    :param service_uuid: (Default value = None) uuid of a service.
+    :param package_id: (Default value = None) uuid of a package.
+    :param status: (Default value = None) status of the result.
+    :param refresh: (Default value = False) bring the index up to date
+        first.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        dictionaries. Each dictionary contains a result.
+    """
+
+    criteria = {'instance_uuid': instance_uuid,
+                'service_uuid': service_uuid,
+                'package_id': package_id,
+                'status': status}
+
+    with _index_lock:
+        res, mes = _update_index(refresh)
+        if not res:
+            return False, mes
+
+        uuids = None
+        for key, value in criteria.items():
+            if value is None:
+                continue
+            found = _index[key].get(value, set())
+            uuids = set(found) if uuids is None else uuids & found
+
+        if uuids is None:
+            uuids = _index['results'].keys()
+
+        tests_res = [_format_test_result(_index['results'][uuid])
+                     for uuid in sorted(uuids)]
+
+    return True, tests_res
+
+
+def query_test_results(status=None, service_uuid=None, instance_uuid=None,
+                       since=None, until=None, limit=None, refresh=False):
+    """Returns the test results of a period, the most recent first.
+
+    Results are ordered on their started_at, or their created_at when
+    they didn't start, parsed as timezone aware timestamps. Timestamps
+    without timezone are taken to be UTC. The lookup uses the local
+    results index, see find_test_results, which keeps the results sorted
+    on time.
+
+    :param status: (Default value = None) status of the results, e.g.
+        'PASSED'.
+    :param service_uuid: (Default value = None) uuid of a service.
+    :param instance_uuid: (Default value = None) uuid of a service
+        instance.
+    :param since: (Default value = None) start of the period, a timestamp
+        or a duration like '24h' relative to now.
+    :param until: (Default value = None) end of the period.
+    :param limit: (Default value = None) maximum number of results.
+    :param refresh: (Default value = False) bring the index up to date
+        first.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        dictionaries. Each dictionary contains a complete test result.
+    """
+
+    res, bounds = _time_bounds(since, until)
+    if not res:
+        return False, bounds
+
+    criteria = {'status': status,
+                'service_uuid': service_uuid,
+                'instance_uuid': instance_uuid}
+
+    with _index_lock:
+        res, mes = _update_index(refresh)
+        if not res:
+            return False, mes
+
+        uuids = None
+        for key, value in criteria.items():
+            if value is None:
+                continue
+            found = _index[key].get(value, set())
+            uuids = set(found) if uuids is None else uuids & found
+
+        times = _index['times']
+        low = 0
+        high = len(times)
+        if bounds[0] is not None:
+            low = bisect_left(times, (bounds[0],))
+        if bounds[1] is not None:
+            high = bisect_right(times, (bounds[1], chr(0x10ffff)))
+
+        found = []
+        for pos in range(high - 1, low - 1, -1):
+            uuid = times[pos][1]
+            if uuids is not None and uuid not in uuids:
+                continue
+            found.append(dict(_index['results'][uuid]))
+            if limit and len(found) >= limit:
+                break
+
+    return True, found
+
+
+def get_latest_test_result(status='PASSED', service_uuid=None, since=None,
+                           until=None, refresh=False):
+    """Returns the most recent test result with a status.
+
+    Without refresh, the result is looked up in the local results index,
+    see query_test_results. With refresh, the index isn't used. The
+    matching results are read instead, filtered on the gatekeeper, and
+    the most recent one is picked. This doesn't depend on the order of
+    the listing.
+
+    :param status: (Default value = 'PASSED') status of the result.
+    :param service_uuid: (Default value = None) uuid of a service.
+    :param since: (Default value = None) start of the period, a timestamp
+        or a duration like '24h' relative to now.
+    :param until: (Default value = None) end of the period.
+    :param refresh: (Default value = False) read the current results
+        from the SP.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a dictionary
+        containing the complete test result, or an error message.
+    """
+
+    if refresh:
+        return _latest_from_listing(status, service_uuid, since, until)
+
+    res, found = query_test_results(status=status,
+                                    service_uuid=service_uuid,
+                                    since=since,
+                                    until=until,
+                                    limit=1,
+                                    refresh=refresh)
+    if not res:
+        return False, found
+
+    if not found:
+        return False, "No matching test result"
+
+    return True, found[0]
+
+
+def _latest_from_listing(status, service_uuid, since, until):
+    """ Most recent matching result of a complete, filtered listing. """
+
+    res, bounds = _time_bounds(since, until)
+    if not res:
+        return False, bounds
+
+    params = {}
+    criteria = {'status': status, 'service_uuid': service_uuid}
+    for field, value in criteria.items():
+        if value is not None:
+            params[TEST_RESULT_FILTERS[field]] = value
+
+    latest = None
+    try:
+        for result in helpers.iter_pages(env.test_results_api, params):
+            # the gatekeeper may ignore the filters
+            if any(value is not None and result.get(field) != value
+                   for field, value in criteria.items()):
+                continue
+            entry = _time_entry(result)
+            if entry is None or \
+                    (bounds[0] is not None and entry[0] < bounds[0]) or \
+                    (bounds[1] is not None and entry[0] > bounds[1]):
+                continue
+            if latest is None or entry > latest[0]:
+                latest = (entry, result)
+    except helpers.RequestError as e:
+        LOG.debug("Listing test results failed: " + str(e))
+        return False, e.text
+
+    if latest is None:
+        return False, "No matching test result"
+
+    return True, latest[1]
+
+
+def _time_bounds(since, until):
+    """ since and until as seconds since epoch, None when not given. """
+
+    bounds = []
+    for value in [since, until]:
+        moment = None
+        if value:
+            moment = helpers.parse_since(value)
+            if moment is None:
+                return False, "Unsupported time: " + str(value)
+            moment = moment.timestamp()
+        bounds.append(moment)
+
+    return True, bounds
+
+
+def rebuild_test_result_index():
+    """Drops the local results index and reads all test results again.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the number of
+        indexed results, or an error message.
+    """
+
+    with _index_lock:
+        _index['url'] = None
+        res, mes = _update_index()
+        if not res:
+            return False, mes
+
+        return True, len(_index['results'])
+
+
+def _update_index(refresh=False):
+    """ Builds the results index, or rebuilds it when it is older than
+    RESULTS_INDEX_TTL. Every build reads the complete listing, as the
+    order of the listing isn't guaranteed, so changes on any page are
+    picked up and deleted results drop out. Callers hold _index_lock. """
+
+    url = env.test_results_api
+    if _index['url'] == url and not refresh and \
+            time.time() - _index['refreshed_at'] < RESULTS_INDEX_TTL:
+        return True, None
+
+    results = {}
+    keys = dict((key, defaultdict(set)) for key in RESULTS_INDEX_KEYS)
+    times = []
+
+    try:
+        for result in helpers.iter_pages(url):
+            results[result['uuid']] = result
+            for key in RESULTS_INDEX_KEYS:
+                keys[key][result.get(key)].add(result['uuid'])
+            entry = _time_entry(result)
+            if entry:
+                times.append(entry)
+    except helpers.RequestError as e:
+        LOG.debug("Indexing test results failed: " + str(e))
+        return False, e.text
+
+    times.sort()
+    _index['url'] = url
+    _index['results'] = results
+    _index['times'] = times
+    _index.update(keys)
+    _index['refreshed_at'] = time.time()
+    LOG.debug(str(len(results)) + " test results indexed")
+
+    return True, None
+
+
+def _time_entry(result):
+    """ Entry of a result in the time ordered list of the index. """
 
-            LOG.debug(str(dic))
-            tests_uuids.append(dic)
+    moment = helpers.parse_timestamp(result.get('started_at') or
+                                     result.get('created_at'))
+    if moment is None:
+        return None
 
-    return True, tests_uuids
\ No newline at end of file
+    return (moment.timestamp(), result['uuid'])
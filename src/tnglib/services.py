@@ -37,9 +37,14 @@ import time
 import os
 import yaml
 import tnglib.env as env
+from tnglib import helpers
 
 LOG = logging.getLogger(__name__)
 
+# Fields of the service instance summaries the gatekeeper filters on, and
+# their query parameter
+SERVICE_INSTANCE_FILTERS = {'status': 'status'}
+
 
 def get_service_descriptors():
     """Returns info on all available service descriptors.
@@ -124,20 +129,43 @@ def get_service_instances():
 
     services_res = []
     for service in services:
-        if 'instance_name' not in service.keys():
-            service['instance_name'] = ''
-        if service['instance_name'] is None:
-            service['instance_name'] = ''
-        dic = {'instance_uuid': service['uuid'],
-               'name': service['instance_name'],
-               'status': service['status'],
-               'created_at': service['created_at']}
+        dic = _format_service_instance(service)
         LOG.debug(str(dic))
         services_res.append(dic)
 
     return True, services_res
 
 
+def iter_service_instances(callback=None, params=None):
+    """Generator over all service instances, reading them page by page.
+
+    :param callback: (Default value = None) callable that is invoked after
+        each page, see helpers.iter_pages.
+    :param params: (Default value = None) dictionary with query parameters
+        that filter the listing, see filter_params.
+
+    :raises RequestError: when the gatekeeper replies with an error.
+    """
+
+    for service in helpers.iter_pages(env.service_instance_api, params,
+                                      callback=callback):
+        yield _format_service_instance(service)
+
+
+def _format_service_instance(service):
+    """ Summary of an nsr as returned by get_service_instances. """
+
+    if 'instance_name' not in service.keys():
+        service['instance_name'] = ''
+    if service['instance_name'] is None:
+        service['instance_name'] = ''
+
+    return {'instance_uuid': service['uuid'],
+            'name': service['instance_name'],
+            'status': service['status'],
+            'created_at': service['created_at']}
+
+
 def get_service_instance(service_instance_uuid):
     """Returns info on a specific service instance.
 
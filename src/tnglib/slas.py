@@ -36,10 +36,37 @@ import json
 import time
 import os
 import yaml
+import itertools
+from datetime import datetime
 import tnglib.env as env
+from tnglib import helpers
 
 LOG = logging.getLogger(__name__)
 
+# Maximum number of SLA templates created per second by a manifest
+SLA_MANIFEST_RATE = 10
+
+LICENCE_TYPES = ['public', 'trial', 'private']
+
+# Fields of a manifest entry, in the order of create_sla_template
+MANIFEST_FIELDS = ['templateName', 'nsd_uuid', 'expireDate', 'guaranteeId',
+                   'service_licence_type', 'allowed_service_instances',
+                   'service_licence_expiration_date', 'template_initiator',
+                   'provider_name', 'dflavour_name']
+
+MANIFEST_DEFAULTS = {'expireDate': '01/01/2025',
+                     'guaranteeId': None,
+                     'service_licence_type': 'public',
+                     'allowed_service_instances': '100',
+                     'service_licence_expiration_date': '01/01/2025',
+                     'template_initiator': 'admin',
+                     'provider_name': 'default',
+                     'dflavour_name': None}
+
+# Fields of a manifest entry that can hold a list, to create a template
+# per combination
+MANIFEST_MATRIX = ['nsd_uuid', 'service_licence_type', 'guaranteeId']
+
 
 def create_sla_template(templateName, nsd_uuid, expireDate,
                         guaranteeId, service_licence_type,
@@ -180,6 +207,223 @@ def delete_sla_template(sla_template_uuid):
         return False, json.loads(resp.text)
 
 
+def create_sla_templates_from_manifest(manifest, mapping=None, workers=None,
+                                       rate=SLA_MANIFEST_RATE,
+                                       callback=None):
+    """Creates the SLA templates described in a manifest.
+
+    The manifest is a json or yaml file with an optional 'defaults'
+    dictionary and a 'templates' list. Each entry uses the parameter names
+    of create_sla_template. 'nsd_uuid', 'service_licence_type' and
+    'guaranteeId' can be lists, in which case a template is created for
+    every combination. The 'templateName' is formatted with the fields of
+    the combination, e.g. "gold-{service_licence_type}-{guaranteeId}", and
+    must be unique.
+
+    All entries are validated before any template is created. Templates
+    whose name already exists on the SP are not created again, so an
+    interrupted run can be repeated.
+
+    :param manifest: path to the manifest, or the parsed manifest.
+    :param mapping: (Default value = None) path to a json file in which
+        the uuid of each template is stored, by template name.
+    :param workers: (Default value = None) number of parallel requests,
+        env.max_workers if None.
+    :param rate: (Default value = SLA_MANIFEST_RATE) maximum number of
+        templates created per second.
+    :param callback: (Default value = None) callable that is invoked with
+        the result dictionary of each template as it is created.
+
+    :returns: A tuple. [0] is a bool with the result, False if the
+        manifest is invalid or a template could not be created. [1] is a
+        list of dictionaries with the 'templateName', 'nsd_uuid',
+        'service_licence_type', 'guaranteeId', 'status' ('created',
+        'exists' or 'failed'), 'sla_uuid' and 'error' of each template,
+        or the validation errors of the manifest. Either 'sla_uuid' or
+        'error' is None.
+    """
+
+    if not isinstance(manifest, dict):
+        res, manifest = _load_manifest(manifest)
+        if not res:
+            return False, manifest
+
+    res, entries = _expand_manifest(manifest)
+    if not res:
+        return False, entries
+
+    res, existing = get_sla_templates()
+    if not res:
+        return False, existing
+    existing = dict((template['name'], template['sla_uuid'])
+                    for template in existing)
+
+    results = []
+    todo = []
+    for entry in entries:
+        result = {'templateName': entry['templateName'],
+                  'nsd_uuid': entry['nsd_uuid'],
+                  'service_licence_type': entry['service_licence_type'],
+                  'guaranteeId': entry['guaranteeId'],
+                  'status': None,
+                  'sla_uuid': None,
+                  'error': None}
+        if entry['templateName'] in existing:
+            result['status'] = 'exists'
+            result['sla_uuid'] = existing[entry['templateName']]
+        else:
+            todo.append((entry, result))
+        results.append(result)
+
+    LOG.debug(str(len(todo)) + " of " + str(len(entries)) +
+              " SLA templates to create")
+
+    def created(item, outcome):
+        result = item[0]
+        if outcome[0]:
+            result['status'] = 'created'
+            result['sla_uuid'] = outcome[1]
+        else:
+            result['status'] = 'failed'
+            result['error'] = str(outcome[1])
+        if callback:
+            callback(result)
+
+    calls = [tuple([result] +
+                   [entry[field] for field in MANIFEST_FIELDS])
+             for entry, result in todo]
+    helpers.bulk_call(lambda result, *args: create_sla_template(*args),
+                      calls, workers, rate, created)
+
+    if mapping:
+        _store_mapping(mapping, results)
+
+    failed = [result for result in results if result['status'] == 'failed']
+
+    return not failed, results
+
+
+def _load_manifest(path):
+    """ Reads a json or yaml manifest. """
+
+    ext = os.path.splitext(path)[1]
+
+    try:
+        with open(path, 'r') as manifest_file:
+            if ext == '.json':
+                return True, json.load(manifest_file)
+            elif ext in ['.yaml', '.yml']:
+                return True, yaml.safe_load(manifest_file)
+    except (IOError, ValueError, yaml.YAMLError) as e:
+        return False, "Manifest can't be read: " + str(e)
+
+    return False, "Provide json or yaml file"
+
+
+def _expand_manifest(manifest):
+    """ Validates a manifest and expands its entries into one dictionary
+    per template. """
+
+    if not isinstance(manifest, dict) or \
+            not isinstance(manifest.get('templates'), list):
+        return False, "Manifest requires a 'templates' list"
+
+    defaults = dict(MANIFEST_DEFAULTS)
+    defaults.update(manifest.get('defaults') or {})
+
+    entries = []
+    errors = []
+    for number, template in enumerate(manifest['templates']):
+        fields = dict(defaults)
+        fields.update(template)
+
+        unknown = [key for key in fields if key not in MANIFEST_FIELDS]
+        if unknown:
+            errors.append("Entry " + str(number) + ": unknown fields " +
+                          ", ".join(unknown))
+            continue
+
+        if not fields.get('templateName') or not fields.get('nsd_uuid'):
+            errors.append("Entry " + str(number) + ": templateName and "
+                          "nsd_uuid are required")
+            continue
+
+        values = []
+        for field in MANIFEST_MATRIX:
+            value = fields[field]
+            values.append(value if isinstance(value, list) else [value])
+
+        for combination in itertools.product(*values):
+            entry = dict(fields)
+            entry.update(zip(MANIFEST_MATRIX, combination))
+            try:
+                entry['templateName'] = str(fields['templateName']).format(
+                    **entry)
+            except (KeyError, IndexError, ValueError) as e:
+                errors.append("Entry " + str(number) + ": templateName "
+                              "can't be formatted: " + str(e))
+                break
+            error = _validate_entry(entry)
+            if error:
+                errors.append("Entry " + str(number) + " (" +
+                              entry['templateName'] + "): " + error)
+            entries.append(entry)
+
+    names = [entry['templateName'] for entry in entries]
+    for name in sorted(set(name for name in names if names.count(name) > 1)):
+        errors.append("Duplicate templateName " + name)
+
+    if errors:
+        return False, "\n".join(errors)
+
+    return True, entries
+
+
+def _validate_entry(entry):
+    """ Checks the fields of an expanded manifest entry. Returns an error
+    message, or None. """
+
+    for field in ['expireDate', 'service_licence_expiration_date']:
+        try:
+            datetime.strptime(str(entry[field]), '%d/%m/%Y')
+        except ValueError:
+            return field + " should be DD/MM/YYYY, not " + str(entry[field])
+
+    if entry['service_licence_type'] not in LICENCE_TYPES:
+        return "service_licence_type should be one of " + \
+            "|".join(LICENCE_TYPES)
+
+    try:
+        if int(entry['allowed_service_instances']) < 0:
+            raise ValueError()
+    except (TypeError, ValueError):
+        return "allowed_service_instances should be a positive number"
+
+    return None
+
+
+def _store_mapping(path, results):
+    """ Writes the uuid of every created or existing template to a json
+    file, keeping the entries of previous runs. """
+
+    mapping = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as mapping_file:
+                mapping = json.load(mapping_file)
+        except ValueError:
+            LOG.debug("Overwriting unreadable mapping " + path)
+
+    for result in results:
+        if result.get('sla_uuid'):
+            mapping[result['templateName']] = result['sla_uuid']
+
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as mapping_file:
+        json.dump(mapping, mapping_file, indent=4, sort_keys=True)
+    os.replace(tmp, path)
+
+
 def get_sla_guarantees():
     """Returns info on all available SLA guarantees.
 
@@ -268,6 +512,84 @@ def get_detailed_agreement(sla_uuid, nsi_uuid):
         return False, json.loads(resp.text)['error']
 
 
+def get_agreement_details(nsi_uuid=None, workers=None):
+    """Returns all SLA agreements joined with their details, templates
+    and guarantees.
+
+    The details are fetched in parallel. Each SLA template is fetched
+    once, however many agreements refer to it, and the guarantees are
+    fetched once per call.
+
+    :param nsi_uuid:  (Default value = None) uuid of a service instance.
+    :param workers: (Default value = None) number of parallel requests,
+        env.max_workers if None.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        dictionaries with the keys 'sla_uuid', 'nsi_uuid', 'agreement',
+        'detail', 'template' and 'guarantees'. 'detail' and 'template'
+        contain the error message when their request failed.
+    """
+
+    res, agreements = get_agreements(nsi_uuid)
+    if not res:
+        return False, agreements
+
+    res, guarantees = get_sla_guarantees()
+    if not res:
+        return False, guarantees
+    guarantees = dict((str(guar['id']), guar) for guar in guarantees)
+
+    pairs = []
+    seen = set()
+    for agreement in agreements:
+        pair = (agreement['sla_uuid'], agreement['nsi_uuid'])
+        if pair not in seen:
+            seen.add(pair)
+            pairs.append(pair)
+    sla_uuids = sorted(set(pair[0] for pair in pairs))
+
+    details = helpers.bulk_call(get_detailed_agreement, pairs, workers)
+    details = dict(zip(pairs, details))
+    templates = helpers.bulk_call(get_sla_template,
+                                  [(sla_uuid,) for sla_uuid in sla_uuids],
+                                  workers)
+    templates = dict(zip(sla_uuids, templates))
+
+    joined = []
+    for agreement in agreements:
+        pair = (agreement['sla_uuid'], agreement['nsi_uuid'])
+        template = templates[pair[0]]
+        guar_ids = []
+        if template[0]:
+            guar_ids = _get_template_guarantee_ids(template[1])
+        joined.append({'sla_uuid': pair[0],
+                       'nsi_uuid': pair[1],
+                       'agreement': agreement,
+                       'detail': details[pair][1],
+                       'template': template[1],
+                       'guarantees': [guarantees[gid] for gid in guar_ids
+                                      if gid in guarantees]})
+
+    return True, joined
+
+
+def _get_template_guarantee_ids(template):
+    """ Extracts the guarantee ids from an SLA template. """
+
+    try:
+        service = template['slad']['sla_template']['service']
+    except (KeyError, TypeError):
+        return []
+
+    ids = []
+    for term in service.get('guaranteeTerms', []):
+        guar_id = term.get('guaranteeID', term.get('guarantee_id'))
+        if guar_id is not None:
+            ids.append(str(guar_id))
+
+    return ids
+
+
 def get_violations(nsi_uuid=None):
     """Returns info on all SLA violations.
 
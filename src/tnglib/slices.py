@@ -35,8 +35,9 @@ import logging
 import json
 import time
 import os
-import yaml
+import copy
 import tnglib.env as env
+from tnglib import helpers
 
 LOG = logging.getLogger(__name__)
 
@@ -120,16 +121,38 @@ def get_slice_instances():
 
     slices_res = []
     for slc in slices:
-        dic = {'instance_uuid': slc['uuid'],
-               'name': slc['name'],
-               'template_uuid': slc['nst-ref'],
-               'created_at': slc['created_at']}
+        dic = _format_slice_instance(slc)
         LOG.debug(str(dic))
         slices_res.append(dic)
 
     return True, slices_res
 
 
+def iter_slice_instances(callback=None, params=None):
+    """Generator over all slice instances, reading them page by page.
+
+    :param callback: (Default value = None) callable that is invoked after
+        each page, see helpers.iter_pages.
+    :param params: (Default value = None) dictionary with query parameters
+        that filter the listing, see filter_params.
+
+    :raises RequestError: when the gatekeeper replies with an error.
+    """
+
+    for slc in helpers.iter_pages(env.slice_instance_api, params,
+                                  callback=callback):
+        yield _format_slice_instance(slc)
+
+
+def _format_slice_instance(slc):
+    """ Summary of a slice instance as returned by get_slice_instances. """
+
+    return {'instance_uuid': slc['uuid'],
+            'name': slc['name'],
+            'template_uuid': slc['nst-ref'],
+            'created_at': slc['created_at']}
+
+
 def get_slice_instance(slice_instance_uuid):
     """Returns info on a specific slice instance.
 
@@ -187,15 +210,73 @@ def create_slice_template(path):
 
     ext = os.path.splitext(path)[1]
 
-    if ext == '.json':
-        template_raw = open(path, 'r')
-        template = json.load(template_raw)
-    elif ext in ['.yaml', '.yml']:
-        template_raw = open(path, 'rb')
-        template = yaml.load(template_raw)
-    else:
+    if ext not in ['.json', '.yaml', '.yml']:
         return False, "Provide json or yaml file"
 
+    res, template = helpers.load_descriptor(path)
+    if not res:
+        return False, template
+
+    return _post_slice_template(template)
+
+
+def create_slice_template_variants(path, slas, workers=None):
+    """Creates a variant of a slice template for each of a list of SLAs.
+
+    The template is parsed once. Each variant has the SLA attached to all
+    its subnets, see add_sla_to_nstd_subnets, and the SLA name appended to
+    its name. The variants are uploaded in parallel.
+
+    :param path: relative path to where the slice template is stored.
+    :param slas: list of (sla_uuid, sla_name) tuples.
+    :param workers: (Default value = None) number of parallel uploads,
+        env.max_workers if None.
+
+    :returns: A tuple. [0] is a bool with the result, False if a variant
+        could not be created. [1] is a list of dictionaries with the
+        'sla_uuid', 'name', 'uuid' and 'error' of each variant, or an
+        error message. Either 'uuid' or 'error' is None.
+    """
+
+    ext = os.path.splitext(path)[1]
+
+    if ext not in ['.json', '.yaml', '.yml']:
+        return False, "Provide json or yaml file"
+
+    res, template = helpers.load_descriptor(path)
+    if not res:
+        return False, template
+
+    variants = []
+    for sla_uuid, sla_name in slas:
+        res, variant = add_sla_to_nstd_subnets(template, sla_uuid, sla_name)
+        if not res:
+            return False, variant
+        variant['name'] = str(template.get('name')) + '-' + str(sla_name)
+        variants.append((variant,))
+
+    results = []
+    uploads = helpers.bulk_call(_post_slice_template, variants, workers)
+    for (variant,), (sla_uuid, sla_name), upload in zip(variants, slas,
+                                                         uploads):
+        result = {'sla_uuid': sla_uuid,
+                  'name': variant['name'],
+                  'uuid': None,
+                  'error': None}
+        if upload[0]:
+            result['uuid'] = upload[1]
+        else:
+            result['error'] = str(upload[1])
+        results.append(result)
+
+    failed = [result for result in results if result['error']]
+
+    return not failed, results
+
+
+def _post_slice_template(template):
+    """ Uploads a parsed slice template. """
+
     resp = requests.post(env.slice_template_api,
                          json=template,
                          timeout=env.timeout,
@@ -217,13 +298,17 @@ def create_slice_template(path):
 def add_sla_to_nstd_subnets(yaml_nstd, sla_uuid, sla_name):
     """Adds SLA information into the NSTD passed as param.
 
-    :param yaml_nstd: yaml object with the NSTD to modify.
+    :param yaml_nstd: yaml object with the NSTD to modify, or the parsed
+        NSTD, which is left unchanged.
     :param sla_uuid: uuid object identying the sla to associate with the NS within the NSTD.
     :param sla_name: string object naming the sla to associate with the NS within the NSTD.
 
     :returns: A json objectA tuple. [0] is a bool with the result. [1] is a json containing the NSTD.
     """
-    nstd_dict = yaml.load(yaml_nstd)
+    if isinstance(yaml_nstd, dict):
+        nstd_dict = copy.deepcopy(yaml_nstd)
+    else:
+        nstd_dict = helpers.load_yaml(yaml_nstd)
 
     if not nstd_dict:
         error = "No JSON object arrived."
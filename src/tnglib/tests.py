@@ -34,7 +34,7 @@ import requests
 import logging
 import json
 import tnglib.env as env
-from datetime import date
+from tnglib import results
 
 LOG = logging.getLogger(__name__)
 
@@ -114,23 +114,5 @@ def get_latest_succesful_test_results():
         containing the test results metadata.
     """
 
-    url = env.test_results_api
-    resp = requests.get(url,
-                        timeout=env.timeout,
-                        headers=env.header)
-
-    env.set_return_header(resp.headers)
-
-    if resp.status_code != 200:
-        LOG.debug("Request for test descriptor returned with " +
-                  (str(resp.status_code)))
-        return False, json.loads(resp.text)
-
-    data = json.loads(resp.text)
-    
-    match = next(d for d in data if d['status'] == 'PASSED')
-    
-    if (str(date.today()) not in match['started_at']):
-        return False, json.loads(resp.text)
-    
-    return True, match
+    return results.get_latest_test_result('PASSED', since='24h',
+                                          refresh=True)
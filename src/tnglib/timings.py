@@ -0,0 +1,225 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from tnglib import helpers
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the histogram buckets
+TIMINGS_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+                   600, 1800, 3600]
+
+# Number of samples kept per series to compute percentiles
+TIMINGS_SAMPLES = 10000
+
+_series = {}
+_lock = threading.Lock()
+
+
+class _Series(object):
+    """ Histogram of the timings with the same metric and labels. A
+    reservoir of samples is kept for percentiles. """
+
+    def __init__(self):
+        self.buckets = [0] * (len(TIMINGS_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def add(self, seconds):
+        self.buckets[bisect.bisect_left(TIMINGS_BUCKETS, seconds)] += 1
+        self.count = self.count + 1
+        self.sum = self.sum + seconds
+        self.max = max(self.max, seconds)
+        if len(self.samples) < TIMINGS_SAMPLES:
+            self.samples.append(seconds)
+        else:
+            pos = random.randrange(self.count)
+            if pos < TIMINGS_SAMPLES:
+                self.samples[pos] = seconds
+
+    def percentile(self, percent):
+        return helpers.percentile(sorted(self.samples), percent)
+
+
+def record_timing(metric, seconds, **labels):
+    """Adds a duration to the in-memory timing store.
+
+    :param metric: name of the metric, e.g. 'request_duration_seconds'.
+    :param seconds: the duration.
+    :param labels: labels of the series, e.g. request_type='CREATE_SLICE'.
+    """
+
+    key = (metric, tuple(sorted((name, str(value))
+                                for name, value in labels.items())))
+
+    with _lock:
+        if key not in _series:
+            _series[key] = _Series()
+        _series[key].add(seconds)
+
+
+def get_timings(metric=None, percentiles=(50, 90, 99)):
+    """Returns a summary of the recorded timings.
+
+    :param metric: (Default value = None) only this metric.
+    :param percentiles: (Default value = (50, 90, 99)) the percentiles to
+        compute.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        dictionaries, one per metric and label combination, with the
+        'metric', 'labels', 'count', 'sum', 'max' and a 'p<N>' key for
+        every percentile.
+    """
+
+    with _lock:
+        keys = sorted(key for key in _series
+                      if metric is None or key[0] == metric)
+        summary = []
+        for key in keys:
+            series = _series[key]
+            entry = {'metric': key[0],
+                     'labels': dict(key[1]),
+                     'count': series.count,
+                     'sum': round(series.sum, 6),
+                     'max': round(series.max, 6)}
+            for percent in percentiles:
+                entry['p' + str(percent)] = round(series.percentile(percent),
+                                                  6)
+            summary.append(entry)
+
+    return True, summary
+
+
+def export_timings(fmt='prometheus'):
+    """Exports the recorded timings.
+
+    :param fmt: (Default value = 'prometheus') 'prometheus' for the
+        Prometheus text exposition format, with a histogram per metric,
+        or 'json' for the summary of get_timings.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a string.
+    """
+
+    if fmt == 'json':
+        return True, json.dumps(get_timings()[1], indent=4)
+
+    if fmt != 'prometheus':
+        return False, "Unsupported format: " + str(fmt)
+
+    lines = []
+    with _lock:
+        metrics = sorted(set(key[0] for key in _series))
+        for metric in metrics:
+            name = 'tng_' + metric
+            lines.append('# TYPE ' + name + ' histogram')
+            for key in sorted(key for key in _series if key[0] == metric):
+                series = _series[key]
+                labels = list(key[1])
+                cumulative = 0
+                bounds = [str(bound) for bound in TIMINGS_BUCKETS] + ['+Inf']
+                for bound, count in zip(bounds, series.buckets):
+                    cumulative = cumulative + count
+                    lines.append(name + '_bucket' +
+                                 _format_labels(labels + [('le', bound)]) +
+                                 ' ' + str(cumulative))
+                lines.append(name + '_sum' + _format_labels(labels) + ' ' +
+                             repr(series.sum))
+                lines.append(name + '_count' + _format_labels(labels) + ' ' +
+                             str(series.count))
+
+    return True, '\n'.join(lines) + '\n'
+
+
+def reset_timings():
+    """Drops all recorded timings."""
+
+    with _lock:
+        _series.clear()
+
+
+def _format_labels(labels):
+    """ Formats label pairs as {name="value",...}. """
+
+    if not labels:
+        return ''
+
+    pairs = []
+    for name, value in labels:
+        value = value.replace('\\', '\\\\').replace('"', '\\"')
+        pairs.append(name + '="' + value + '"')
+
+    return '{' + ','.join(pairs) + '}'
+
+
+class _RequestTimer(object):
+    """ Follows the status changes of one lifecycle request and records
+    the time spent in each status and the time until it was done.
+    Durations are only as precise as the polls that observe them. Without
+    a submission time, the first status seen has an unknown start and is
+    not recorded, nor is the total duration. """
+
+    def __init__(self, request_type, submitted_at=None):
+        self.request_type = str(request_type)
+        self.submitted_at = submitted_at
+        self.status = None
+        self.since = submitted_at
+        self.done = False
+
+    def update(self, status, now=None):
+        """ Registers the status seen at time now. """
+
+        if self.done or status == self.status:
+            return
+
+        now = now or time.time()
+        if self.status is not None:
+            if self.since is not None:
+                record_timing('request_status_seconds', now - self.since,
+                              request_type=self.request_type,
+                              status=self.status)
+            self.since = now
+        self.status = status
+
+        if status in ['READY', 'ERROR']:
+            self.done = True
+            if self.submitted_at is not None:
+                record_timing('request_duration_seconds',
+                              now - self.submitted_at,
+                              request_type=self.request_type, result=status)
@@ -0,0 +1,397 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+import base64
+import contextlib
+import gzip
+import json
+import logging
+import multiprocessing
+import threading
+import time
+import requests
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qsl, urlencode
+import tnglib.env as env
+
+LOG = logging.getLogger(__name__)
+
+TRAFFIC_FORMAT = 'tng-traffic'
+TRAFFIC_VERSION = 1
+
+# Response headers that don't apply to the recorded, decoded body
+_SKIPPED_HEADERS = ['content-encoding', 'content-length', 'transfer-encoding',
+                    'connection', 'keep-alive']
+
+_recorder = None
+_recorder_lock = threading.Lock()
+_original_send = requests.Session.send
+
+
+def start_recording(path):
+    """Starts recording all HTTP exchanges made through requests.
+
+    Every exchange is appended to a gzip compressed json lines archive
+    with its method, url, request body, status, response headers, body and
+    latency. The Graylog client doesn't use requests and isn't recorded.
+
+    :param path: path of the archive.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the path, or
+        an error message.
+    """
+
+    global _recorder
+
+    with _recorder_lock:
+        if _recorder is not None:
+            return False, "Already recording to " + _recorder.path
+        try:
+            _recorder = _Recorder(path)
+        except IOError as e:
+            return False, str(e)
+        requests.Session.send = _recording_send
+
+    return True, path
+
+
+def stop_recording():
+    """Stops recording and closes the archive.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the number of
+        recorded exchanges, or an error message.
+    """
+
+    global _recorder
+
+    with _recorder_lock:
+        if _recorder is None:
+            return False, "Not recording"
+        requests.Session.send = _original_send
+        count = _recorder.close()
+        _recorder = None
+
+    return True, count
+
+
+@contextlib.contextmanager
+def record_traffic(path):
+    """Context manager that records the HTTP exchanges made inside it,
+    see start_recording."""
+
+    res, mes = start_recording(path)
+    if not res:
+        raise RuntimeError(mes)
+    try:
+        yield path
+    finally:
+        stop_recording()
+
+
+def load_traffic(path):
+    """Reads a recorded archive.
+
+    :param path: path of the archive.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        dictionaries, one per exchange in the order they were recorded, or
+        an error message.
+    """
+
+    res, header, exchanges = _read_archive(path)
+    if not res:
+        return False, header
+
+    return True, exchanges
+
+
+class TrafficReplay(object):
+    """Replays a recorded archive from local stub servers.
+
+    One stub is started per port found in the archive, all in a separate
+    process. A request is answered with the next recorded response for the
+    same method, path and query, repeating the last one when they run
+    out. Responses are delayed by their recorded latency times
+    latency_factor. Components that aren't in the archive are pointed to
+    an extra stub that answers every request with an error, so a replay
+    never reaches a real service.
+
+    Use it as a context manager, which points env to the stubs and
+    restores the previous SP path and ports on exit.
+
+    :param path: path of the archive.
+    :param latency_factor: (Default value = 1.0) factor applied to the
+        recorded latencies, e.g. 0.5 to answer twice as fast or 0 to answer
+        immediately.
+    """
+
+    def __init__(self, path, latency_factor=1.0):
+        self.path = path
+        self.latency_factor = latency_factor
+        self.ports = {}
+        self.recorded_ports = {}
+        self.process = None
+        self.previous = None
+
+    @property
+    def url(self):
+        """ Base url of the stubs, to use with set_sp_path. """
+
+        return 'http://127.0.0.1'
+
+    def start(self):
+        """ Starts the stubs and waits until they accept requests. """
+
+        res, header, exchanges = _read_archive(self.path)
+        if not res:
+            raise IOError(header)
+        self.recorded_ports = header.get('ports', {})
+
+        ctx = multiprocessing.get_context('spawn')
+        queue = ctx.Queue()
+        self.process = ctx.Process(target=_serve,
+                                   args=(exchanges, self.latency_factor,
+                                         queue))
+        self.process.daemon = True
+        self.process.start()
+        self.ports = queue.get(timeout=60)
+        LOG.debug("Replaying " + self.path + " on ports " + str(self.ports))
+
+        return self
+
+    def stop(self):
+        """ Stops the stubs. """
+
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def __enter__(self):
+        self.start()
+        self.previous = (env.sp_path, env.gtk_port, env.monitoring_port,
+                         env.analytics_port)
+        env.set_sp_path(self.url)
+        recorded = self.recorded_ports
+        unrecorded = self.ports[None]
+        env.set_ports(self.ports.get(recorded.get('gtk', env.gtk_port),
+                                     unrecorded),
+                      self.ports.get(recorded.get('monitoring',
+                                                  env.monitoring_port),
+                                     unrecorded),
+                      self.ports.get(recorded.get('analytics',
+                                                  env.analytics_port),
+                                     unrecorded))
+
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+        sp_path, gtk_port, monitoring_port, analytics_port = self.previous
+        env.set_sp_path(sp_path)
+        env.set_ports(gtk_port, monitoring_port, analytics_port)
+
+
+class _Recorder(object):
+    """ Appends exchanges to an archive, from any thread. """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.lock = threading.Lock()
+        self.archive = gzip.open(path, 'wt')
+        self.archive.write(json.dumps({'format': TRAFFIC_FORMAT,
+                                       'version': TRAFFIC_VERSION,
+                                       'sp_path': env.sp_path,
+                                       'ports': {
+                                           'gtk': env.gtk_port,
+                                           'monitoring': env.monitoring_port,
+                                           'analytics': env.analytics_port},
+                                       'recorded_at': time.time()}) + '\n')
+
+    def add(self, request, resp, latency):
+        exchange = {'method': request.method,
+                    'url': request.url,
+                    'request_body': _encode_body(request.body),
+                    'status': resp.status_code,
+                    'headers': dict((key, value)
+                                    for key, value in resp.headers.items()
+                                    if key.lower() not in _SKIPPED_HEADERS),
+                    'body': _encode_body(resp.content),
+                    'latency': round(latency, 6)}
+
+        with self.lock:
+            self.archive.write(json.dumps(exchange) + '\n')
+            self.count = self.count + 1
+
+    def close(self):
+        with self.lock:
+            self.archive.close()
+            return self.count
+
+
+def _read_archive(path):
+    """ Reads the header and the exchanges of an archive. """
+
+    try:
+        with gzip.open(path, 'rt') as archive:
+            header = json.loads(archive.readline())
+            if header.get('format') != TRAFFIC_FORMAT:
+                return False, path + " is not a traffic archive", None
+            exchanges = [json.loads(line) for line in archive if line.strip()]
+    except (IOError, OSError, ValueError) as e:
+        return False, "Can't read " + path + ": " + str(e), None
+
+    return True, header, exchanges
+
+
+def _recording_send(session, request, **kwargs):
+    """ Replacement of requests.Session.send that records the exchange. """
+
+    start = time.perf_counter()
+    resp = _original_send(session, request, **kwargs)
+    latency = time.perf_counter() - start
+
+    recorder = _recorder
+    if recorder is not None and not kwargs.get('stream'):
+        recorder.add(request, resp, latency)
+
+    return resp
+
+
+def _encode_body(body):
+    """ Text bodies are kept as they are, binary ones base64 encoded. """
+
+    if body is None:
+        return None
+
+    if isinstance(body, str):
+        return body
+
+    try:
+        return body.decode('utf-8')
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(body).decode('ascii')}
+
+
+def _decode_body(body):
+    """ Reverse of _encode_body, to bytes. """
+
+    if body is None:
+        return b''
+
+    if isinstance(body, dict):
+        return base64.b64decode(body['base64'])
+
+    return body.encode('utf-8')
+
+
+def _key(method, url):
+    """ Method, path and sorted query identifying a request. """
+
+    parsed = urlparse(url)
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+
+    return method + ' ' + parsed.path.rstrip('/') + '?' + query
+
+
+def _serve(exchanges, latency_factor, queue):
+    """ Starts a stub per recorded port, and one without recordings
+    under the None key, and serves until terminated. """
+
+    responses = {None: {}}
+    for exchange in exchanges:
+        url = urlparse(exchange['url'])
+        port = url.port or (443 if url.scheme == 'https' else 80)
+        key = _key(exchange['method'], exchange['url'])
+        responses.setdefault(port, {}).setdefault(key, []).append(exchange)
+
+    lock = threading.Lock()
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    def handler(replies):
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def handle_one(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+
+                with lock:
+                    queued = replies.get(_key(self.command, self.path))
+                    exchange = None
+                    if queued:
+                        exchange = queued[0]
+                        if len(queued) > 1:
+                            queued.pop(0)
+
+                if exchange is None:
+                    status = 404
+                    headers = {'Content-Type': 'application/json'}
+                    body = b'{"error": "Not recorded"}'
+                else:
+                    status = exchange['status']
+                    headers = exchange['headers']
+                    body = _decode_body(exchange['body'])
+                    if latency_factor:
+                        time.sleep(exchange['latency'] * latency_factor)
+
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_one
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    ports = {}
+    for port, replies in responses.items():
+        server = Server(('127.0.0.1', 0), handler(replies))
+        ports[port] = server.server_address[1]
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    queue.put(ports)
+
+    while True:
+        time.sleep(3600)
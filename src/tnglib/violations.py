@@ -0,0 +1,378 @@
+# Copyright (c) 2015 SONATA-NFV, 2017 5GTANGO
+# ALL RIGHTS RESERVED.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Neither the name of the SONATA-NFV, 5GTANGO
+# nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written
+# permission.
+#
+# This work has been performed in the framework of the SONATA project,
+# funded by the European Commission under Grant number 671517 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the SONATA
+# partner consortium (www.sonata-nfv.eu).
+#
+# This work has been performed in the framework of the 5GTANGO project,
+# funded by the European Commission under Grant number 761493 through
+# the Horizon 2020 and 5G-PPP programmes. The authors would like to
+# acknowledge the contributions of their colleagues of the 5GTANGO
+# partner consortium (www.5gtango.eu).
+
+import hashlib
+import logging
+import requests
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+import tnglib.env as env
+from tnglib import helpers
+
+LOG = logging.getLogger(__name__)
+
+# Seconds a fetched list of violations is reused
+VIOLATIONS_CACHE_TTL = 60
+
+WINDOWS = {'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800}
+
+# Bounds, in seconds, of the adaptive poll interval of watch_violations
+VIOLATIONS_WATCH_MIN = 5
+VIOLATIONS_WATCH_MAX = 120
+
+_cache = helpers.TTLCache(VIOLATIONS_CACHE_TTL)
+
+
+def get_violation_index(nsi_uuid=None, refresh=False):
+    """Returns all SLA violations, indexed by time, nsi_uuid and sla_uuid.
+
+    Violations are read page by page and cached for VIOLATIONS_CACHE_TTL
+    seconds, so consecutive summaries don't hit the SP again.
+
+    :param nsi_uuid: (Default value = None) only violations of this
+        service instance.
+    :param refresh: (Default value = False) ignore the cache.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a dictionary
+        with 'violations' sorted by time, their 'times' as seconds since
+        epoch and position lists per 'nsi_uuid' and 'sla_uuid'.
+    """
+
+    url = env.sl_violations_api
+    if nsi_uuid:
+        url = env.sl_violations_api + '/service/' + nsi_uuid
+
+    if refresh:
+        _cache.clear()
+
+    return _cache.get(url, lambda: _build_index(url))
+
+
+def get_violation_summary(window='hour', group_by='nsi_uuid', since=None,
+                          until=None, nsi_uuid=None, sla_uuid=None,
+                          refresh=False):
+    """Counts SLA violations per group and time window.
+
+    :param window: (Default value = 'hour') 'minute', 'hour', 'day',
+        'week' or a number of seconds.
+    :param group_by: (Default value = 'nsi_uuid') 'nsi_uuid' or 'sla_uuid'.
+    :param since: (Default value = None) start of the period, a timestamp
+        or a duration like '7d' relative to now.
+    :param until: (Default value = None) end of the period.
+    :param nsi_uuid: (Default value = None) only this service instance.
+    :param sla_uuid: (Default value = None) only this SLA.
+    :param refresh: (Default value = False) ignore the cache.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        dictionaries with the group, 'window_start', 'violations',
+        'first', 'last' and 'duration' (seconds between first and last),
+        ordered by window and number of violations.
+    """
+
+    res, positions, index = _select(group_by, since, until, nsi_uuid,
+                                    sla_uuid, refresh)
+    if not res:
+        return False, positions
+
+    size = WINDOWS.get(window, window)
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return False, "Unsupported window: " + str(window)
+    if size <= 0:
+        return False, "Unsupported window: " + str(window)
+
+    times = index['times']
+    violations = index['violations']
+
+    buckets = defaultdict(list)
+    for pos in positions:
+        start = int(times[pos] // size) * size
+        buckets[(start, violations[pos].get(group_by))].append(times[pos])
+
+    summary = []
+    for (start, group), stamps in buckets.items():
+        summary.append({group_by: str(group),
+                        'window_start': _format(start),
+                        'violations': str(len(stamps)),
+                        'first': _format(stamps[0]),
+                        'last': _format(stamps[-1]),
+                        'duration': str(int(stamps[-1] - stamps[0]))})
+
+    summary.sort(key=lambda row: (row['window_start'],
+                                  -int(row['violations'])))
+
+    return True, summary
+
+
+def get_top_violators(top=10, group_by='nsi_uuid', since=None, until=None,
+                      nsi_uuid=None, sla_uuid=None, refresh=False):
+    """Returns the service instances or SLAs with the most violations.
+
+    :param top: (Default value = 10) number of entries.
+    :param group_by: (Default value = 'nsi_uuid') 'nsi_uuid' or 'sla_uuid'.
+    :param since: (Default value = None) start of the period, a timestamp
+        or a duration like '7d' relative to now.
+    :param until: (Default value = None) end of the period.
+    :param nsi_uuid: (Default value = None) only this service instance.
+    :param sla_uuid: (Default value = None) only this SLA.
+    :param refresh: (Default value = False) ignore the cache.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is a list of
+        dictionaries with the group, 'violations', 'first' and 'last'.
+    """
+
+    res, positions, index = _select(group_by, since, until, nsi_uuid,
+                                    sla_uuid, refresh)
+    if not res:
+        return False, positions
+
+    times = index['times']
+    violations = index['violations']
+
+    counts = Counter()
+    first = {}
+    last = {}
+    for pos in positions:
+        group = violations[pos].get(group_by)
+        counts[group] += 1
+        first.setdefault(group, times[pos])
+        last[group] = times[pos]
+
+    result = []
+    for group, count in counts.most_common(top):
+        result.append({group_by: str(group),
+                       'violations': str(count),
+                       'first': _format(first[group]),
+                       'last': _format(last[group])})
+
+    return True, result
+
+
+def watch_violations(callback=None, webhook=None, nsi_uuids=None,
+                     interval=VIOLATIONS_WATCH_MIN,
+                     max_interval=VIOLATIONS_WATCH_MAX, history=False,
+                     polls=None):
+    """Polls the SLA violations and reports the ones not seen before.
+
+    All violations are read in a single listing per poll, however many
+    service instances are watched. Seen violations are remembered as
+    8 byte digests of their (sla_uuid, nsi_uuid, violation_time) key.
+    The violations of the first successful poll count as existing ones.
+    The poll interval halves when new violations show up, down to
+    interval, and grows by half when they don't, up to max_interval.
+    Failing polls are retried after max_interval.
+
+    :param callback: (Default value = None) callable that is invoked with
+        every new violation.
+    :param webhook: (Default value = None) url to which every new
+        violation is posted as json.
+    :param nsi_uuids: (Default value = None) list of service instance
+        uuids to watch. If None, all service instances are watched.
+    :param interval: (Default value = VIOLATIONS_WATCH_MIN) shortest time
+        between two polls, in seconds.
+    :param max_interval: (Default value = VIOLATIONS_WATCH_MAX) longest
+        time between two polls, in seconds.
+    :param history: (Default value = False) also report the violations
+        that exist when the watch starts.
+    :param polls: (Default value = None) stop after this many polls. If
+        None, watch until interrupted.
+
+    :returns: A tuple. [0] is a bool with the result. [1] is the number of
+        reported violations.
+    """
+
+    if nsi_uuids:
+        nsi_uuids = set(nsi_uuids)
+
+    seen = set()
+    primed = False
+    reported = 0
+    count = 0
+    delay = interval
+
+    while polls is None or count < polls:
+        count = count + 1
+
+        try:
+            res, violations = helpers.get_paged(env.sl_violations_api)
+        except KeyboardInterrupt:
+            break
+        except requests.exceptions.RequestException as e:
+            res, violations = False, str(e)
+
+        if not res:
+            LOG.debug("Polling violations failed: " + str(violations))
+            delay = max_interval
+        else:
+            new = []
+            for violation in violations:
+                if nsi_uuids and violation.get('nsi_uuid') not in nsi_uuids:
+                    continue
+                key = _violation_key(violation)
+                if key not in seen:
+                    seen.add(key)
+                    new.append(violation)
+
+            if primed or history:
+                new.sort(key=lambda violation:
+                         str(violation.get('violation_time')))
+                for violation in new:
+                    _emit(violation, callback, webhook)
+                reported = reported + len(new)
+
+            if new and primed:
+                delay = max(interval, delay / 2.0)
+            else:
+                delay = min(max_interval, delay * 1.5)
+
+            # violations of the first successful poll already existed
+            primed = True
+
+            LOG.debug(str(len(new)) + " new violations, next poll in " +
+                      str(round(delay, 1)) + "s")
+
+        if polls is not None and count >= polls:
+            break
+
+        try:
+            time.sleep(delay)
+        except KeyboardInterrupt:
+            break
+
+    return True, reported
+
+
+def _violation_key(violation):
+    """ Compact digest identifying a violation. """
+
+    key = "|".join([str(violation.get('sla_uuid')),
+                    str(violation.get('nsi_uuid')),
+                    str(violation.get('violation_time'))])
+
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+
+
+def _emit(violation, callback=None, webhook=None):
+    """ Hands a new violation to the callback and the webhook. """
+
+    if callback:
+        callback(violation)
+
+    if webhook:
+        try:
+            resp = requests.post(webhook,
+                                 json=violation,
+                                 timeout=env.timeout)
+            if resp.status_code >= 300:
+                LOG.debug("Webhook returned with " + str(resp.status_code))
+        except requests.exceptions.RequestException as e:
+            LOG.debug("Webhook failed: " + str(e))
+
+
+def _build_index(url):
+    """ Reads all violations from url and indexes them. """
+
+    res, violations = helpers.get_paged(url)
+    if not res:
+        return False, violations
+
+    stamped = []
+    for violation in violations:
+        timestamp = helpers.parse_timestamp(violation.get('violation_time'))
+        if timestamp is None:
+            LOG.debug("Skipping violation without time: " + str(violation))
+            continue
+        stamped.append((timestamp.timestamp(), violation))
+
+    stamped.sort(key=lambda item: item[0])
+
+    index = {'times': [item[0] for item in stamped],
+             'violations': [item[1] for item in stamped],
+             'nsi_uuid': defaultdict(list),
+             'sla_uuid': defaultdict(list)}
+
+    for pos, violation in enumerate(index['violations']):
+        index['nsi_uuid'][violation.get('nsi_uuid')].append(pos)
+        index['sla_uuid'][violation.get('sla_uuid')].append(pos)
+
+    return True, index
+
+
+def _select(group_by, since=None, until=None, nsi_uuid=None, sla_uuid=None,
+            refresh=False):
+    """ Positions of the indexed violations that match the filters. """
+
+    if group_by not in ['nsi_uuid', 'sla_uuid']:
+        return False, "Unsupported grouping: " + str(group_by), None
+
+    res, index = get_violation_index(refresh=refresh)
+    if not res:
+        return False, index, None
+
+    times = index['times']
+    low = 0
+    high = len(times)
+
+    if since:
+        start = helpers.parse_since(since)
+        if start is None:
+            return False, "Unsupported time: " + str(since), None
+        low = bisect_left(times, start.timestamp())
+
+    if until:
+        end = helpers.parse_since(until)
+        if end is None:
+            return False, "Unsupported time: " + str(until), None
+        high = bisect_right(times, end.timestamp())
+
+    if nsi_uuid or sla_uuid:
+        candidates = None
+        for key, value in [('nsi_uuid', nsi_uuid), ('sla_uuid', sla_uuid)]:
+            if value:
+                found = set(index[key].get(value, []))
+                candidates = found if candidates is None else \
+                    candidates & found
+        positions = sorted(pos for pos in candidates if low <= pos < high)
+    else:
+        positions = range(low, high)
+
+    return True, positions, index
+
+
+def _format(seconds):
+    """ Formats seconds since epoch as a UTC timestamp. """
+
+    stamp = datetime.fromtimestamp(seconds, timezone.utc)
+    return stamp.strftime('%Y-%m-%dT%H:%M:%S')